@@ -1,26 +1,13 @@
 from crewai import Agent
-from langchain_openai import ChatOpenAI
 from tools import StockTools
-import os
-from dotenv import load_dotenv
+from llm_client import get_llm
 
-load_dotenv()
 
-import httpx
-
-# 实例化LLM，默认使用环境变量中的 OPENAI_API_KEY
-# 如果需要使用其他模型，可以在这里配置
-# 使用 httpx.Client 显式设置超时
-http_client = httpx.Client(timeout=httpx.Timeout(300.0, connect=60.0))
-
-llm = ChatOpenAI(
-    model="qwen-plus", # 阿里云建议使用 qwen-plus 作为主力模型，性价比和稳定性较好
-    temperature=0.5,
-    api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_API_BASE"),
-    http_client=http_client,
-    max_retries=5
-)
+def __getattr__(name):
+    # 兼容 `from agents import llm`：模块属性访问时才构建 LLM
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class StockAnalysisAgents:
     def market_researcher(self):
@@ -35,7 +22,7 @@ class StockAnalysisAgents:
                 StockTools.get_stock_financials,
                 StockTools.get_stock_info
             ],
-            llm=llm,
+            llm=get_llm(),
             verbose=True,
             allow_delegation=False
         )
@@ -48,7 +35,7 @@ class StockAnalysisAgents:
             你擅长解读财务报表（如营收、利润、现金流），评估公司的盈利能力、偿债能力和成长性。
             你的任务是判断该公司的当前估值是否合理，以及未来的增长潜力。""",
             tools=[], # 依赖研究员提供的数据
-            llm=llm,
+            llm=get_llm(),
             verbose=True,
             allow_delegation=False
         )
@@ -61,7 +48,7 @@ class StockAnalysisAgents:
             你擅长利用K线形态、均线系统（MA）、MACD、RSI等技术指标来识别趋势、支撑位和压力位。
             你的任务是判断当前的买卖时机，并给出具体的入场点（买入区间）、止损点和止盈点建议。""",
             tools=[], # 依赖研究员提供的数据
-            llm=llm,
+            llm=get_llm(),
             verbose=True,
             allow_delegation=False
         )
@@ -80,7 +67,7 @@ class StockAnalysisAgents:
             5. 主要风险提示
             你需要用通俗易懂但专业的语言向客户解释你的决策逻辑。""",
             tools=[],
-            llm=llm,
+            llm=get_llm(),
             verbose=True,
             allow_delegation=False
         )
@@ -0,0 +1,679 @@
+"""
+盯盘提醒引擎 (Alerts)
+
+客户端原先开着 /api/trade-signal 页面轮询，只为等某个价格或 RSI 阈值。这里由服务端登记条件，
+每当全市场行情快照（shared_snapshot.spot）发布新版本时，对全部规则做一次向量化求值，
+命中的通过 SSE（/api/alerts/stream）推送给对应客户端。
+
+规则字段：
+- 行情：price、change_pct、turnover_rate、amount、volume（直接取自快照）
+- 日线指标：RSI6、K、D、J——用前一交易日为止的日K预先算好每只股票的状态
+  （最近 19 个收盘价、8 日高低点、K/D、EMA12/EMA26/DEA），盘中用快照最新价一步外推当日值
+- score：与 generate_trade_signal 相同参数的评分，只含全市场可得的部分（换手率、主力资金、
+  MACD 交叉、KDJ、RSI6、布林带），盘口与多周期共振需要逐只拉取，不参与
+
+条件：cross_above / cross_below（相邻两次快照之间穿越阈值）、above / below（条件由假变真，
+首次求值即满足也触发）、band_change（score 所在操作评级区间变化）。
+once=true 的规则只推送一次，推送后删除；否则两次触发至少间隔 cooldown 秒。
+
+规则存放在 .data/alerts/rules.json，多个 worker 共用（flock 串行写入，按 mtime 重新加载），
+每个 worker 各自求值并推送给连到本进程的客户端。各 worker 持有连接的 client_id 写在
+.data/alerts/online/<pid>.json（Presence），分发规则见 Dispatcher：
+- once 规则由持有该客户端连接的 worker 立即认领（从规则文件删除），认领成功才推送；
+  没有 worker 持有连接时，等 grace 秒后规则仍在才由某个 worker 认领并为客户端保留（积压）；
+- 其他规则推送给连到本进程的客户端；客户端连在其他 worker 上时本进程不积压，避免重连后重复补发。
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+import cache_policy
+import metrics
+import shared_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows：单进程部署，不需要跨进程锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ALERTS_DIR = os.path.join(os.getcwd(), ".data", "alerts")
+SPOT_FIELDS = ("price", "change_pct", "turnover_rate", "amount", "volume")
+LIVE_FIELDS = ("RSI6", "K", "D", "J", "score")
+FIELDS = SPOT_FIELDS + LIVE_FIELDS
+OPS = ("cross_above", "cross_below", "above", "below", "band_change")
+BAND_LABELS = ("强烈卖出", "谨慎卖出", "观望", "谨慎买入", "强烈买入")
+# 预计算状态所需的最少日K根数
+MIN_HISTORY = 30
+
+ALERT_EVENTS = metrics.counter("alert_events_total", "Alert rules triggered by field and delivery", ["field", "delivered"])
+ALERT_EVALUATION = metrics.histogram("alert_evaluation_seconds", "Time to evaluate all alert rules against one snapshot")
+ALERT_RULES = metrics.gauge("alert_rules", "Alert rules registered across all clients")
+
+
+@dataclass
+class Rule:
+    client_id: str
+    code: str
+    field: str
+    op: str
+    threshold: Optional[float] = None
+    once: bool = True
+    cooldown: float = 300.0
+    id: str = ""
+    created_at: float = 0.0
+
+    def describe(self) -> Dict:
+        return asdict(self)
+
+
+def make_rule(client_id: str, symbol: str, field: str, op: str, threshold: Optional[float] = None,
+              once: bool = True, cooldown: float = 300.0) -> Rule:
+    """校验并生成规则，参数不合法时抛出 ValueError"""
+    code = (symbol or "")[-6:]
+    if not client_id:
+        raise ValueError("client_id is required")
+    if not code.isdigit() or len(code) != 6:
+        raise ValueError(f"Invalid symbol: {symbol}")
+    if field not in FIELDS:
+        raise ValueError(f"Unknown field {field}, available: {', '.join(FIELDS)}")
+    if op not in OPS:
+        raise ValueError(f"Unknown op {op}, available: {', '.join(OPS)}")
+    if op == "band_change":
+        if field != "score":
+            raise ValueError("band_change only applies to the score field")
+    elif threshold is None:
+        raise ValueError(f"{op} requires a threshold")
+    return Rule(client_id=client_id, code=code, field=field, op=op,
+                threshold=None if threshold is None else float(threshold), once=once,
+                cooldown=max(0.0, float(cooldown)), id=uuid.uuid4().hex[:12], created_at=time.time())
+
+
+class RuleStore:
+    """多 worker 共用的规则文件"""
+
+    def __init__(self, directory: str = ALERTS_DIR, max_per_client: int = 50):
+        self.path = os.path.join(directory, "rules.json")
+        self._lock_path = os.path.join(directory, "rules.lock")
+        self.max_per_client = max_per_client
+        self._rules: Dict[str, Rule] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> Dict[str, Rule]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._rules, self._mtime = {}, None
+            return self._rules
+        if mtime != self._mtime:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._rules = {r["id"]: Rule(**r) for r in json.load(f)}
+                self._mtime = mtime
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Failed to read alert rules: {e}")
+        return self._rules
+
+    def _save(self, rules: Dict[str, Rule]):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([r.describe() for r in rules.values()], f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._rules, self._mtime = rules, os.stat(self.path).st_mtime_ns
+        ALERT_RULES.set(len(rules))
+
+    def rules(self) -> List[Rule]:
+        with self._lock:
+            return list(self._load().values())
+
+    @property
+    def version(self):
+        with self._lock:
+            self._load()
+            return self._mtime
+
+    def add(self, rule: Rule) -> Rule:
+        with self._exclusive():
+            rules = dict(self._load())
+            if sum(1 for r in rules.values() if r.client_id == rule.client_id) >= self.max_per_client:
+                raise ValueError(f"Client {rule.client_id} already has {self.max_per_client} rules")
+            rules[rule.id] = rule
+            self._save(rules)
+        return rule
+
+    def remove(self, rule_ids: Sequence[str], client_id: Optional[str] = None) -> int:
+        return len(self.claim(rule_ids, client_id))
+
+    def claim(self, rule_ids: Sequence[str], client_id: Optional[str] = None) -> List[str]:
+        """删除规则并返回本次实际删除的 id；多个 worker 同时删除同一条规则时只有一个拿到"""
+        with self._exclusive():
+            rules = dict(self._load())
+            removed = [i for i in rule_ids if i in rules and (client_id is None or rules[i].client_id == client_id)]
+            for i in removed:
+                del rules[i]
+            if removed:
+                self._save(rules)
+        return removed
+
+    def for_client(self, client_id: str) -> List[Rule]:
+        return [r for r in self.rules() if r.client_id == client_id]
+
+
+class LiveIndicators:
+    """被盯股票的日线指标状态，盘中按最新价一步外推（全部股票一次向量化计算）"""
+
+    CLOSES = 19
+
+    def __init__(self):
+        self._states: Dict[str, Dict] = {}
+        self._building = set()
+        self._day: Optional[datetime.date] = None
+        self._stacked = None
+        self._lock = threading.Lock()
+
+    def claim_missing(self, codes: Sequence[str], today: datetime.date, limit: int) -> List[str]:
+        """取出最多 limit 只尚无状态且不在构建中的股票，并标记为构建中"""
+        with self._lock:
+            if self._day != today:
+                # 新的交易日：昨天的状态要并入昨天的K线后重算
+                self._states, self._day, self._stacked = {}, today, None
+            claimed = [c for c in codes if c not in self._states and c not in self._building][:limit]
+            self._building.update(claimed)
+            return claimed
+
+    def release(self, codes: Sequence[str]):
+        with self._lock:
+            self._building.difference_update(codes)
+
+    def build(self, codes: Sequence[str], today: datetime.date):
+        """用日K存储中的前复权日K（不含当天）计算状态；在 market 线程池中执行"""
+        import pandas as pd
+
+        import indicators
+        import kline_store
+
+        for code in codes:
+            state = None
+            try:
+                df = kline_store.daily_bars(code, adjust="qfq")
+                df = df[pd.to_datetime(df["日期"]) < pd.Timestamp(today)]
+                if len(df) >= MIN_HISTORY:
+                    values = indicators.evaluate(df, ["KDJ", "MACD"])
+                    state = {
+                        "closes": df["收盘"].to_numpy(dtype=float)[-self.CLOSES:],
+                        "low8": float(df["最低"].iloc[-8:].min()),
+                        "high8": float(df["最高"].iloc[-8:].max()),
+                        **{name: float(values[name].iloc[-1]) for name in ("K", "D", "EMA12", "EMA26", "DIF", "DEA")},
+                    }
+            except Exception as e:
+                logger.warning(f"Failed to build alert indicator state for {code}: {e}")
+            with self._lock:
+                self._building.discard(code)
+                if self._day == today:
+                    # 拉取失败或历史不足也记下，当天不再重试，这些股票的指标值为 NaN
+                    self._states[code] = state
+                    self._stacked = None
+
+    def _stack(self, codes: Sequence[str]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if self._stacked is not None and self._stacked[0] == tuple(codes):
+                return self._stacked[1]
+            n = len(codes)
+            closes = np.full((n, self.CLOSES), np.nan)
+            scalars = {name: np.full(n, np.nan) for name in ("low8", "high8", "K", "D", "EMA12", "EMA26", "DIF", "DEA")}
+            for i, code in enumerate(codes):
+                state = self._states.get(code)
+                if state is None:
+                    continue
+                closes[i, -len(state["closes"]):] = state["closes"]
+                for name in scalars:
+                    scalars[name][i] = state[name]
+            stacked = {"closes": closes, **scalars}
+            self._stacked = (tuple(codes), stacked)
+            return stacked
+
+    def compute(self, codes: Sequence[str], price: np.ndarray, high: np.ndarray, low: np.ndarray) -> Dict[str, np.ndarray]:
+        """当日 RSI6、KDJ、MACD、布林带，公式与 indicators 注册表一致"""
+        s = self._stack(codes)
+        closes = np.concatenate([s["closes"], price[:, None]], axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = np.diff(closes[:, -7:], axis=1)
+            gain = np.where(delta > 0, delta, 0).mean(axis=1)
+            loss = np.where(delta < 0, -delta, 0).mean(axis=1)
+            rsi6 = 100 - 100 / (1 + gain / loss)
+
+            low9 = np.minimum(s["low8"], low)
+            high9 = np.maximum(s["high8"], high)
+            rsv = (price - low9) / (high9 - low9) * 100
+            k = s["K"] * 2 / 3 + rsv / 3
+            d = s["D"] * 2 / 3 + k / 3
+
+            ema12 = s["EMA12"] + (price - s["EMA12"]) * 2 / 13
+            ema26 = s["EMA26"] + (price - s["EMA26"]) * 2 / 27
+            dif = ema12 - ema26
+            dea = s["DEA"] + (dif - s["DEA"]) * 2 / 10
+
+            mid = closes.mean(axis=1)
+            std = closes.std(axis=1, ddof=1)
+        return {
+            "RSI6": rsi6, "K": k, "D": d, "J": 3 * k - 2 * d,
+            "golden_cross": (s["DIF"] < s["DEA"]) & (dif > dea),
+            "dead_cross": (s["DIF"] > s["DEA"]) & (dif < dea),
+            "upper": mid + 2 * std, "lower": mid - 2 * std,
+        }
+
+
+def snapshot_score(params, spot: Dict[str, np.ndarray], live: Dict[str, np.ndarray],
+                   inflow: np.ndarray, inflow_pct: np.ndarray) -> np.ndarray:
+    """generate_trade_signal 评分中全市场可得的部分，逐项向量化"""
+    p = params
+    score = np.full(len(spot["price"]), float(p.base_score))
+    turnover = spot["turnover_rate"]
+    score += np.where(turnover > p.turnover_high, p.turnover_weight, 0)
+    score -= np.where(turnover < p.turnover_low, p.turnover_weight, 0)
+    score += np.where((inflow > 0) & (inflow_pct > p.main_inflow_pct), p.main_inflow_weight, 0)
+    score -= np.where((inflow < 0) & (inflow_pct < -p.main_inflow_pct), p.main_inflow_weight, 0)
+    score += np.where(live["golden_cross"], p.macd_cross_weight, 0)
+    score -= np.where(live["dead_cross"], p.macd_cross_weight, 0)
+    score += np.where(live["K"] < p.kdj_oversold, p.kdj_weight, 0)
+    score -= np.where(live["K"] > p.kdj_overbought, p.kdj_weight, 0)
+    score += np.where(live["RSI6"] < p.rsi_oversold, p.rsi_weight, 0)
+    score -= np.where(live["RSI6"] > p.rsi_overbought, p.rsi_weight, 0)
+    score += np.where(spot["price"] < live["lower"], p.boll_weight, 0)
+    score -= np.where(spot["price"] > live["upper"], p.boll_weight, 0)
+    score = np.clip(score, 0, 100)
+    # 涨跌停时信号固定为观望 50 分；没有指标状态的股票不评分
+    score = np.where(np.abs(spot["change_pct"]) >= p.limit_pct, 50.0, score)
+    return np.where(np.isnan(live["K"]), np.nan, score)
+
+
+class AlertEngine:
+    def __init__(self, store: RuleStore, params=None):
+        self.store = store
+        self.live = LiveIndicators()
+        self._params = params
+        self._compiled = None
+        # 规则 id -> (上一次的值, 上一次触发时间, once 规则是否已触发)；重新编译时按 id 继承
+        self._memory: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def params(self):
+        if self._params is None:
+            from signal_params import SignalParams
+            self._params = SignalParams.load()
+        return self._params
+
+    def _compile(self):
+        version = self.store.version
+        if self._compiled is not None and self._compiled["version"] == version:
+            return self._compiled
+        rules = sorted(self.store.rules(), key=lambda r: r.created_at)
+        codes = sorted({r.code for r in rules})
+        thresholds = np.array([np.nan if r.threshold is None else r.threshold for r in rules], dtype=float)
+        memory = [self._memory.get(r.id, (np.nan, 0.0, False)) for r in rules]
+        self._compiled = {
+            "version": version,
+            "rules": rules,
+            "codes": codes,
+            "code_index": np.searchsorted(np.array(codes), np.array([r.code for r in rules])) if rules else np.zeros(0, dtype=int),
+            "field_index": np.array([FIELDS.index(r.field) for r in rules], dtype=int),
+            "op": np.array([OPS.index(r.op) for r in rules], dtype=int),
+            "threshold": thresholds,
+            "cooldown": np.array([r.cooldown for r in rules], dtype=float),
+            "once": np.array([r.once for r in rules], dtype=bool),
+            "prev": np.array([m[0] for m in memory], dtype=float),
+            "fired_at": np.array([m[1] for m in memory], dtype=float),
+            "spent": np.array([m[2] for m in memory], dtype=bool),
+        }
+        return self._compiled
+
+    def watched(self) -> List[str]:
+        with self._lock:
+            return list(self._compile()["codes"])
+
+    def needs_indicators(self) -> bool:
+        with self._lock:
+            return any(r.field in LIVE_FIELDS for r in self._compile()["rules"])
+
+    def values(self, segment, flow_segment, codes: Sequence[str]) -> np.ndarray:
+        """(字段, 股票) 矩阵；快照中没有的股票或没有指标状态的字段为 NaN"""
+        n = len(codes)
+        keys = np.array([c.encode("ascii") for c in codes], dtype="S6")
+        spot = {name: np.full(n, np.nan) for name in SPOT_FIELDS + ("high", "low")}
+        if segment is not None and segment.rows:
+            snapshot_codes = segment.column("code")
+            rows = np.minimum(np.searchsorted(snapshot_codes, keys), segment.rows - 1)
+            found = snapshot_codes[rows] == keys
+            for name in spot:
+                spot[name] = np.where(found, segment.column(name)[rows], np.nan)
+        # 停牌股票最新价为 0
+        spot["price"] = np.where(spot["price"] > 0, spot["price"], np.nan)
+
+        matrix = np.full((len(FIELDS), n), np.nan)
+        for name in SPOT_FIELDS:
+            matrix[FIELDS.index(name)] = spot[name]
+        if any(f in LIVE_FIELDS for f in (r.field for r in self._compiled["rules"])):
+            live = self.live.compute(codes, spot["price"], spot["high"], spot["low"])
+            inflow = inflow_pct = np.full(n, np.nan)
+            if flow_segment is not None and flow_segment.rows:
+                flow_codes = flow_segment.column("code")
+                rows = np.minimum(np.searchsorted(flow_codes, keys), flow_segment.rows - 1)
+                found = flow_codes[rows] == keys
+                inflow = np.where(found, flow_segment.column("main_net_inflow")[rows], np.nan)
+                inflow_pct = np.where(found, flow_segment.column("main_net_inflow_pct")[rows], np.nan)
+            for name in ("RSI6", "K", "D", "J"):
+                matrix[FIELDS.index(name)] = live[name]
+            matrix[FIELDS.index("score")] = snapshot_score(self.params, spot, live, inflow, inflow_pct)
+        return matrix
+
+    def bands(self, score: np.ndarray) -> np.ndarray:
+        p = self.params
+        return np.digitize(score, [p.sell_band, p.hold_band, p.buy_band, p.strong_buy_band]).astype(float)
+
+    def evaluate(self, segment, flow_segment=None, now: Optional[float] = None) -> List[Dict]:
+        """对一版快照求值全部规则，返回命中的事件"""
+        started = time.perf_counter()
+        now = now or time.time()
+        with self._lock:
+            c = self._compile()
+            if not c["rules"]:
+                return []
+            matrix = self.values(segment, flow_segment, c["codes"])
+            cur = matrix[c["field_index"], c["code_index"]]
+            prev, thr, op = c["prev"], c["threshold"], c["op"]
+
+            band_rules = op == OPS.index("band_change")
+            cur_cmp = np.where(band_rules, self.bands(cur), cur)
+            prev_cmp = np.where(band_rules, self.bands(prev), prev)
+            with np.errstate(invalid="ignore"):
+                hit = np.select(
+                    [op == OPS.index("cross_above"), op == OPS.index("cross_below"),
+                     op == OPS.index("above"), op == OPS.index("below"), band_rules],
+                    [(prev < thr) & (cur >= thr), (prev > thr) & (cur <= thr),
+                     (cur > thr) & ~(prev > thr), (cur < thr) & ~(prev < thr), ~np.isnan(prev) & (cur_cmp != prev_cmp)],
+                    default=False,
+                )
+            hit &= ~np.isnan(cur) & ~c["spent"] & (now - c["fired_at"] >= c["cooldown"])
+            # 取不到值时保留上一次的值，恢复后按最后一次已知值判断穿越
+            c["prev"] = np.where(np.isnan(cur), prev, cur)
+            c["fired_at"] = np.where(hit, now, c["fired_at"])
+
+            events = []
+            for i in np.flatnonzero(hit):
+                rule = c["rules"][i]
+                event = {
+                    "event_id": uuid.uuid4().hex[:12],
+                    "rule_id": rule.id,
+                    "client_id": rule.client_id,
+                    "code": rule.code,
+                    "field": rule.field,
+                    "op": rule.op,
+                    "threshold": rule.threshold,
+                    "value": round(float(cur[i]), 4),
+                    "previous": None if np.isnan(prev[i]) else round(float(prev[i]), 4),
+                    "once": rule.once,
+                    "as_of": cache_policy.market_time(segment.version).isoformat(timespec="seconds") if segment is not None else None,
+                    "triggered_at": cache_policy.market_time(now).isoformat(timespec="seconds"),
+                }
+                if band_rules[i]:
+                    event["band"] = BAND_LABELS[int(cur_cmp[i])]
+                    if not np.isnan(prev[i]):
+                        event["previous_band"] = BAND_LABELS[int(prev_cmp[i])]
+                events.append(event)
+            # once 规则在本进程内只触发一次，规则文件删除它之前的重新编译也不会重置
+            c["spent"] |= hit & c["once"]
+            self._memory = {r.id: (c["prev"][i], c["fired_at"][i], bool(c["spent"][i])) for i, r in enumerate(c["rules"])}
+        ALERT_EVALUATION.observe(time.perf_counter() - started)
+        return events
+
+
+class AlertHub:
+    """按 client_id 分发事件；客户端暂未连接到任何 worker 时在本进程保留最近的事件，重连后补发"""
+
+    def __init__(self, queue_size: int = 100, backlog_size: int = 20, backlog_seconds: float = 600.0):
+        self.queue_size = queue_size
+        self.backlog_size = backlog_size
+        self.backlog_seconds = backlog_seconds
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._backlog: Dict[str, Deque] = {}
+
+    def subscribe(self, client_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(client_id, []).append(queue)
+        cutoff = time.time() - self.backlog_seconds
+        for received, event in self._backlog.pop(client_id, ()):
+            if received >= cutoff:
+                self._put(queue, event)
+        return queue
+
+    def unsubscribe(self, client_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(client_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(client_id, None)
+
+    def clients(self) -> List[str]:
+        return list(self._subscribers)
+
+    def online(self, client_id: str) -> bool:
+        return bool(self._subscribers.get(client_id))
+
+    def _put(self, queue: asyncio.Queue, event: Dict):
+        if queue.full():
+            # 消费太慢的连接丢弃最旧的事件
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def publish(self, events: Sequence[Dict], remote: Set[str] = frozenset()) -> List[Dict]:
+        """
+        在事件循环线程中调用，返回已推送给本进程在线客户端的事件。
+        remote 为连在其他 worker 上的 client_id：这些客户端的非 once 事件由那个 worker 推送，本进程不积压；
+        once 事件只会交给认领了它的 worker，没有本地连接时总是积压。
+        """
+        delivered = []
+        for event in events:
+            queues = self._subscribers.get(event["client_id"])
+            if queues:
+                for queue in queues:
+                    self._put(queue, event)
+                delivered.append(event)
+                outcome = "yes"
+            elif event["once"] or event["client_id"] not in remote:
+                backlog = self._backlog.setdefault(event["client_id"], deque(maxlen=self.backlog_size))
+                backlog.append((time.time(), event))
+                outcome = "no"
+            else:
+                outcome = "remote"
+            ALERT_EVENTS.labels(event["field"], outcome).inc()
+        return delivered
+
+
+class Presence:
+    """
+    各 worker 持有连接的 client_id，每个 worker 一个文件 .data/alerts/online/<pid>.json；
+    内容不变时每 ttl/3 秒重写一次作为心跳，超过 ttl 未更新的文件视为已退出的 worker
+    """
+
+    def __init__(self, directory: str = os.path.join(ALERTS_DIR, "online"), name: Optional[str] = None,
+                 ttl: float = 30.0):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name or os.getpid()}.json")
+        self.ttl = ttl
+        self._published: Optional[List[str]] = None
+        self._published_at = 0.0
+
+    def publish(self, clients: Sequence[str]):
+        clients = sorted(set(clients))
+        now = time.time()
+        if clients == self._published and now - self._published_at < self.ttl / 3:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(clients, f)
+        os.replace(tmp_path, self.path)
+        self._published, self._published_at = clients, now
+
+    def others(self) -> Set[str]:
+        """其他存活 worker 上在线的 client_id"""
+        online: Set[str] = set()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return online
+        cutoff = time.time() - self.ttl
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path == self.path:
+                continue
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    online.update(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return online
+
+
+class Dispatcher:
+    """
+    一个 worker 的事件分发。每个 worker 都对全部规则求值，once 规则的事件在每个 worker 上都会产生：
+    - 本进程持有该客户端连接：立即认领（RuleStore.claim），认领成功才推送；
+    - 否则暂存 grace 秒，期间客户端连到本进程则立即认领；到期后规则仍在（没有 worker 推送过）
+      才认领，认领成功的为客户端积压；
+    - 认领出错时留待下一轮重试。规则在本进程内已经失效（AlertEngine 的 spent），不会重复触发。
+    """
+
+    def __init__(self, hub: AlertHub, store: RuleStore, presence: Presence, grace: float = 5.0):
+        self.hub = hub
+        self.store = store
+        self.presence = presence
+        self.grace = grace
+        # 规则 id -> (到期时间, 事件)
+        self._pending: Dict[str, Tuple[float, Dict]] = {}
+
+    async def dispatch(self, events: Sequence[Dict], now: Optional[float] = None) -> List[Dict]:
+        """每轮调用一次（没有新事件时也要调用，处理暂存的 once 事件），返回推送给本进程客户端的事件"""
+        now = now or time.time()
+        claims = []
+        for event in events:
+            if not event["once"]:
+                continue
+            if self.hub.online(event["client_id"]):
+                claims.append(event)
+            else:
+                self._pending.setdefault(event["rule_id"], (now + self.grace, event))
+        claims.extend(event for due, event in self._pending.values()
+                      if due <= now or self.hub.online(event["client_id"]))
+        claimed: Set[str] = set()
+        if claims:
+            try:
+                # 在 compute 隔离舱之外执行：只是一次加锁的小文件写入，不能因隔离舱满而丢掉已失效的 once 事件
+                claimed = set(await asyncio.to_thread(self.store.claim, [e["rule_id"] for e in claims]))
+                for event in claims:
+                    self._pending.pop(event["rule_id"], None)
+            except Exception as e:
+                logger.warning(f"Failed to claim once alert rules, retrying next round: {e}")
+                for event in claims:
+                    self._pending[event["rule_id"]] = (now, event)
+                claims = []
+        outgoing = [e for e in events if not e["once"]] + [e for e in claims if e["rule_id"] in claimed]
+        remote: Set[str] = set()
+        if any(not e["once"] and not self.hub.online(e["client_id"]) for e in outgoing):
+            remote = await asyncio.to_thread(self.presence.others)
+        return self.hub.publish(outgoing, remote)
+
+
+store = RuleStore(max_per_client=int(os.getenv("ALERTS_MAX_RULES_PER_CLIENT", "50")))
+engine = AlertEngine(store)
+hub = AlertHub()
+presence = Presence()
+
+
+async def run_loop(poll_seconds: float = None, builds_per_tick: int = None):
+    """每个 worker 一个：有规则时保持行情快照的需求，快照有新版本就求值并分发"""
+    from executors import BulkheadFull
+
+    poll_seconds = poll_seconds or float(os.getenv("ALERTS_POLL_SECONDS", "1"))
+    builds_per_tick = builds_per_tick or int(os.getenv("ALERTS_STATE_BUILDS_PER_TICK", "20"))
+    dispatcher = Dispatcher(hub, store, presence, grace=max(5.0, 3 * poll_seconds))
+    last_version = None
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            await asyncio.to_thread(presence.publish, hub.clients())
+            events = []
+            evaluated = await _evaluate_new_snapshot(last_version, builds_per_tick)
+            if evaluated is not None:
+                last_version, events = evaluated
+            await dispatcher.dispatch(events)
+        except BulkheadFull:
+            continue
+        except Exception as e:
+            logger.warning(f"Alert evaluation failed: {e}")
+
+
+async def _evaluate_new_snapshot(last_version, builds_per_tick: int) -> Optional[Tuple[float, List[Dict]]]:
+    """行情快照有新版本时求值全部规则，返回 (快照版本, 事件)；没有规则或没有新版本时返回 None"""
+    import executors
+
+    codes = engine.watched()
+    if not codes:
+        return None
+    if engine.needs_indicators():
+        today = cache_policy.market_today()
+        missing = engine.live.claim_missing(codes, today, builds_per_tick)
+        if missing:
+            # 状态在后台逐批构建，构建好之前这些股票的指标规则不会触发
+            asyncio.ensure_future(_build_states(missing, today))
+        flow_segment = await executors.market.run(_flow_segment)
+    else:
+        flow_segment = None
+    segment = await executors.market.run(shared_snapshot.spot.get)
+    if segment is None or segment.version == last_version:
+        return None
+    # 求值成功后才记下版本，求值因隔离舱已满失败时下一轮重试同一版本
+    return segment.version, await executors.compute.run(engine.evaluate, segment, flow_segment)
+
+
+async def _build_states(codes: List[str], today: datetime.date):
+    import executors
+    try:
+        await executors.market.run(engine.live.build, codes, today)
+    except Exception as e:
+        logger.warning(f"Failed to schedule alert indicator states: {e}")
+    finally:
+        engine.live.release(codes)
+
+
+def _flow_segment():
+    import fund_flow
+    return fund_flow.snapshot.get()
@@ -1,22 +1,5 @@
 import os
 from dotenv import load_dotenv
-import openai
-from httpx import Timeout
-
-# --- Patch OpenAI Client to force timeouts ---
-# This ensures that ANY OpenAI client created by CrewAI or LangChain uses a long timeout
-_original_openai_init = openai.OpenAI.__init__
-
-def _patched_openai_init(self, *args, **kwargs):
-    # Force 300s timeout
-    kwargs['timeout'] = 300.0
-    # We can also force max_retries
-    if 'max_retries' not in kwargs:
-        kwargs['max_retries'] = 5
-    _original_openai_init(self, *args, **kwargs)
-
-openai.OpenAI.__init__ = _patched_openai_init
-# ---------------------------------------------
 
 # 加载环境变量
 load_dotenv()
@@ -44,16 +27,28 @@ except ImportError:
     pass
 # -----------------------------------------------------------
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import pandas as pd
-from crew import StockAnalysisCrew
-from tools import StockTools
+from typing import Dict, List, Optional
+import asyncio
 import logging
 import json
 import datetime
 import os
+import time
+import threading
+import metrics
+import timing
+import executors
+import report_store
+import shared_snapshot
+import stock_universe
+from executors import BulkheadFull
+from stock_universe import StockUniverse
+from data_provider import UpstreamUnavailable, staleness, upstream_health
+from timing import span
 
 # 初始化 FastAPI
 app = FastAPI(title="Stock Analysis API", version="1.0.0")
@@ -65,24 +60,133 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    metrics.HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        # 使用路由模板而不是实际路径，避免 /api/realtime/{symbol} 按股票代码膨胀
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.HTTP_LATENCY.labels(request.method, path, status).observe(time.perf_counter() - started)
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    timer, token = timing.start_request(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+        response.headers["Server-Timing"] = timer.header()
+        return response
+    finally:
+        timing.end_request(timer, token)
+
+@app.exception_handler(BulkheadFull)
+async def handle_bulkhead_full(request: Request, exc: BulkheadFull):
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(UpstreamUnavailable)
+async def handle_upstream_unavailable(request: Request, exc: UpstreamUnavailable):
+    logger.warning(f"Upstream unavailable for {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.get("/api/health/upstreams")
+async def get_upstream_health():
+    """各 akshare 函数的熔断器状态与剩余令牌，以及 LLM 网关的排队情况"""
+    import llm_gateway
+    return {"upstreams": upstream_health(), "llm_gateway": llm_gateway.gateway.stats()}
+
+def _warm_imports():
+    """worker 开始接收请求后在后台加载 pandas 等依赖，避免首个请求承担导入耗时"""
+    import importlib
+    modules = ["realtime_trade", "direct_analysis"]
+    if os.getenv("PRELOAD_AGENT_STACK", "0") == "1":
+        modules.append("crew")
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Failed to preload {name}: {e}")
+
+@app.on_event("startup")
+async def start_import_warmup():
+    threading.Thread(target=_warm_imports, name="import-warmup", daemon=True).start()
+
+@app.on_event("startup")
+async def start_alert_loop():
+    # 每个 worker 一个求值循环；没有规则时只检查规则文件
+    import alerts
+    asyncio.get_running_loop().create_task(alerts.run_loop())
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 指标"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 class AnalyzeRequest(BaseModel):
     symbol: str
     mode: str = "direct" # direct, agent, mixed
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Stock Analysis API is running"}
 
-from direct_analysis import generate_analysis_report
+def _lookup_stock_name(symbol: str) -> str:
+    """通过 stock_individual_info_em 获取股票简称，失败时返回原始代码"""
+    stock_name = symbol
+    try:
+        from data_provider import ak
+        code = symbol[-6:]
+        with span("name"):
+            info = ak.stock_individual_info_em(symbol=code)
+        # info 是一个 DataFrame，查找 item 为 '股票简称' 的 value
+        name_row = info[info['item'] == '股票简称']
+        if not name_row.empty:
+            stock_name = name_row.iloc[0]['value']
+    except Exception as e:
+        logger.warning(f"Failed to fetch stock name: {e}")
+    return stock_name
+
+async def _direct_report(symbol: str) -> str:
+    """直接分析：行情数据、指标计算与 LLM 调用分别在各自的线程池中执行"""
+    from direct_analysis import fetch_report_data, compute_report_indicators, build_report_prompt, ainvoke_report_llm
+    data = await executors.market.run(fetch_report_data, symbol)
+    quant_data = await executors.compute.run(compute_report_indicators, data)
+    prompt = build_report_prompt(symbol, data, quant_data)
+    # LLM 调用走异步网关，按交互优先级排队，不占用 llm 线程池
+    return await ainvoke_report_llm(prompt)
+
+def _run_crew(symbol: str) -> str:
+    # CrewAI / LangChain 导入需要数秒，只在第一次使用 agent 模式时加载
+    from crew import StockAnalysisCrew
+    from llm_gateway import BACKGROUND, priority
+    crew = StockAnalysisCrew(symbol)
+    with metrics.CREW_IN_FLIGHT.track_inprogress(), metrics.CREW_LATENCY.time(), span("crew"), priority(BACKGROUND):
+        return crew.run()
 
 @app.post("/api/analyze")
-def analyze_stock(request: AnalyzeRequest):
+async def analyze_stock(request: AnalyzeRequest):
     """
     触发全流程股票分析
     """
@@ -91,78 +195,191 @@ def analyze_stock(request: AnalyzeRequest):
     
     try:
         # 获取股票名称
-        stock_name = symbol
-        try:
-            import akshare as ak
-            code = symbol[-6:]
-            info = ak.stock_individual_info_em(symbol=code)
-            # info 是一个 DataFrame，查找 item 为 '股票简称' 的 value
-            name_row = info[info['item'] == '股票简称']
-            if not name_row.empty:
-                stock_name = name_row.iloc[0]['value']
-        except Exception as e:
-            logger.warning(f"Failed to fetch stock name: {e}")
+        stock_name = await executors.market.run(_lookup_stock_name, symbol)
 
         reports = {}
+        precomputed = None
         
         # 1. Direct Analysis (Fast, Robust)
         if request.mode in ["direct", "mixed"]:
-            try:
-                reports["direct"] = generate_analysis_report(symbol)
-            except Exception as e:
-                reports["direct"] = f"Direct analysis failed: {str(e)}"
+            # 收盘后预生成 (pregenerate.py) 的报告在下一个交易时段内直接返回
+            precomputed = await executors.market.run(report_store.load_fresh, symbol)
+            if precomputed is not None:
+                reports["direct"] = precomputed["report"]
+            else:
+                try:
+                    reports["direct"] = await _direct_report(symbol)
+                except BulkheadFull:
+                    raise
+                except Exception as e:
+                    reports["direct"] = f"Direct analysis failed: {str(e)}"
 
         # 2. Agent Analysis (Deep, but potentially slow)
         if request.mode in ["agent", "mixed"]:
             try:
-                crew = StockAnalysisCrew(symbol)
-                reports["agent"] = crew.run()
+                reports["agent"] = await executors.llm.run(_run_crew, symbol)
+            except BulkheadFull:
+                raise
             except Exception as e:
                 reports["agent"] = f"Agent analysis failed: {str(e)}"
         
         # Fallback for backward compatibility (if frontend expects single 'report')
         primary_report = reports.get("direct") or reports.get("agent") or "No report generated"
 
-        return {
+        result = {
             "symbol": symbol,
             "name": stock_name,
             "report": primary_report, # Legacy field
             "reports": reports # New field for multi-mode
         }
+        if precomputed is not None:
+            result["precomputed"] = {"direct": precomputed["generated_at"]}
+        return result
+    except BulkheadFull:
+        raise
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class BatchAnalyzeRequest(BaseModel):
+    symbols: List[str]
+
+BATCH_MAX_SYMBOLS = int(os.getenv("ANALYZE_BATCH_MAX_SYMBOLS", "50"))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_FETCH_CONCURRENCY", "4"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_LLM_CONCURRENCY", "4"))
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(request: BatchAnalyzeRequest, http_request: Request):
+    """
+    批量直接分析（组合复盘）：行情数据并发拉取，LLM 调用限制并发数，
+    每只股票完成后立即以一行 JSON（application/x-ndjson）返回，单只失败不影响其他股票，最后一行为汇总
+    """
+    codes = list(dict.fromkeys(s.strip()[-6:] for s in request.symbols if s.strip()))
+    if not codes:
+        raise HTTPException(status_code=400, detail="symbols is empty")
+    if len(codes) > BATCH_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_SYMBOLS} symbols per batch")
+    logger.info(f"Received batch analysis request for {len(codes)} symbols")
+
+    fetch_slots = asyncio.Semaphore(BATCH_FETCH_CONCURRENCY)
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(_batch_analyze_one(code, fetch_slots, llm_slots)) for code in codes]
+
+    async def lines():
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                failed += item["status"] != "ok"
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+                if await http_request.is_disconnected():
+                    break
+            yield json.dumps({"done": True, "total": len(codes), "succeeded": len(codes) - failed, "failed": failed,
+                              "elapsed_seconds": round(time.perf_counter() - started, 2)}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时不再继续拉取和调用 LLM
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+async def _batch_analyze_one(code: str, fetch_slots: asyncio.Semaphore, llm_slots: asyncio.Semaphore) -> Dict:
+    from direct_analysis import (acall_report_llm, build_report_prompt, compute_report_indicators, fetch_report_data,
+                                 require_market_data)
+    started = time.perf_counter()
+    item = {"symbol": code, "name": code}
+    stage = "data"
+    try:
+        item["name"] = await _batch_stock_name(code)
+        precomputed = await executors.market.run(report_store.load_fresh, code)
+        if precomputed is not None:
+            item.update(status="ok", report=precomputed["report"], precomputed={"direct": precomputed["generated_at"]})
+        else:
+            async with fetch_slots:
+                data = await executors.market.run(fetch_report_data, code)
+                quant_data = await executors.compute.run(compute_report_indicators, data)
+            # 行情拉取失败的股票记为 data 阶段失败，不占用 LLM 名额
+            require_market_data(data, quant_data)
+            prompt = build_report_prompt(code, data, quant_data)
+            stage = "llm"
+            # 数据准备与 LLM 生成重叠进行：信号量只限制本批次同时在途的 LLM 请求数
+            async with llm_slots:
+                item.update(status="ok", report=await acall_report_llm(prompt))
+    except Exception as e:
+        logger.warning(f"Batch analysis failed for {code} at {stage}: {e}")
+        item.update(status="error", stage=stage, error=str(e))
+    item["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+    return item
+
+async def _batch_stock_name(code: str) -> str:
+    """优先从全市场行情快照取简称（内存二分查找），快照中没有时再请求个股信息"""
+    row = shared_snapshot.spot_row(code, wait=0)
+    if row is not None and row.get("name"):
+        return row["name"]
+    return await executors.market.run(_lookup_stock_name, code)
+
 @app.get("/api/hot")
-def get_hot_stocks():
+async def get_hot_stocks():
+    return await executors.market.run(_get_hot_stocks)
+
+def _get_hot_stocks():
     try:
-        import akshare as ak
-        
-        # 1. Boards
+        # 任一数据源过期（上游熔断或快照长时间未刷新）时带上过期标记
+        stale = None
+        # 各数据源的取得时间，取最早的作为结果的 as_of
+        as_of = []
+
+        # 1. Boards：由行情快照按成分股本地聚合；成分股尚未拉取成功时才回退到上游板块接口
         board_list = []
         try:
-            # Primary: Industry Boards
-            df_board = ak.stock_board_industry_name_em()
-            df_board = df_board.sort_values(by="涨跌幅", ascending=False).head(6)
-            board_list = df_board[['板块名称', '板块代码', '涨跌幅', '领涨股票', '领涨股票-涨跌幅']].to_dict(orient="records")
+            import sectors
+            hot = sectors.hot_boards(6)
+            if hot is not None:
+                board_list = hot["boards"]
+                stale = stale or hot.get("stale")
+                as_of.append(hot["as_of"])
         except Exception as e:
-            logger.warning(f"Failed industry board: {e}")
-            # Fallback: Concept Boards
-            try:
-                df_concept = ak.stock_board_concept_name_em()
-                df_concept = df_concept.sort_values(by="涨跌幅", ascending=False).head(6)
-                board_list = df_concept[['板块名称', '板块代码', '涨跌幅', '领涨股票', '领涨股票-涨跌幅']].to_dict(orient="records")
-            except Exception as e2:
-                logger.warning(f"Failed concept board fallback: {e2}")
-                board_list = []
+            logger.warning(f"Failed local board aggregation: {e}")
+        if not board_list:
+            # 上游板块列表（共享快照，按 cache_policy 的 board 策略刷新）：行业板块优先，失败时用概念板块
+            for snapshot in (shared_snapshot.industry_boards, shared_snapshot.concept_boards):
+                try:
+                    boards = shared_snapshot.head(snapshot, 6)
+                except Exception as e:
+                    logger.warning(f"Failed {snapshot.name}: {e}")
+                    continue
+                if boards is None or not boards["rows"]:
+                    logger.warning(f"Board snapshot {snapshot.name} unavailable")
+                    continue
+                board_list = [{
+                    "板块名称": row["name"],
+                    "板块代码": row["code"],
+                    "涨跌幅": row["change_pct"],
+                    "领涨股票": row["leader"],
+                    "领涨股票-涨跌幅": row["leader_change_pct"],
+                } for row in boards["rows"]]
+                stale = stale or boards.get("stale")
+                as_of.append(boards["as_of"])
+                break
             
         # 2. Stocks
         stock_list = []
         try:
-            # Primary: Real-time Spot Data (Top Gainers)
-            df_stocks = ak.stock_zh_a_spot_em()
-            df_hot = df_stocks.sort_values(by="涨跌幅", ascending=False).head(6)
-            stock_list = df_hot[['代码', '名称', '最新价', '涨跌幅', '成交量', '成交额']].to_dict(orient="records")
+            # Primary: Real-time Spot Data (Top Gainers)，取自跨 worker 共享快照
+            top = shared_snapshot.spot_top(6, by="change_pct")
+            if top is None:
+                raise RuntimeError("spot snapshot unavailable")
+            stock_list = [{
+                "代码": row["code"],
+                "名称": row["name"],
+                "最新价": row["price"],
+                "涨跌幅": row["change_pct"],
+                "成交量": row["volume"],
+                "成交额": row["amount"],
+            } for row in top]
+            if top:
+                as_of.append(top[0]["as_of"])
         except Exception as e:
             logger.warning(f"Failed stock spot: {e}")
             stock_list = []
@@ -173,28 +390,25 @@ def get_hot_stocks():
         if len(stock_list) == 0:
             try:
                 logger.info("Using stock_hot_rank_em as fallback")
-                df_rank = ak.stock_hot_rank_em()
-                df_rank = df_rank.head(6)
-                processed_list = []
-                for _, row in df_rank.iterrows():
-                    code = str(row['代码'])
-                    # Strip prefix (SH/SZ)
-                    if code.upper().startswith('SH') or code.upper().startswith('SZ'):
-                        code = code[2:]
-                    
-                    processed_list.append({
-                        "代码": code,
-                        "名称": row['股票名称'],
-                        "最新价": row['最新价'],
-                        "涨跌幅": row['涨跌幅'],
-                        "成交量": 0, 
-                        "成交额": 0
-                    })
-                stock_list = processed_list
+                rank = shared_snapshot.head(shared_snapshot.hot_rank, 6)
+                if rank is None:
+                    raise RuntimeError("hot rank snapshot unavailable")
+                stock_list = [{
+                    "代码": row["code"],
+                    "名称": row["name"],
+                    "最新价": row["price"],
+                    "涨跌幅": row["change_pct"],
+                    "成交量": 0,
+                    "成交额": 0
+                } for row in rank["rows"]]
+                stale = stale or rank.get("stale")
+                as_of.append(rank["as_of"])
             except Exception as e2:
                 logger.warning(f"Failed stock rank fallback: {e2}")
 
-        result = {"boards": board_list, "stocks": stock_list, "fallback": False, "asof": datetime.date.today().isoformat()}
+        result = {"boards": board_list, "stocks": stock_list, "fallback": False, "as_of": min(as_of) if as_of else None}
+        if stale:
+            result["stale"] = stale
         if len(board_list) == 0 and len(stock_list) == 0:
             cache_dir = os.path.join(os.getcwd(), ".data", "cache")
             cache_path = os.path.join(cache_dir, "hot.json")
@@ -202,11 +416,13 @@ def get_hot_stocks():
                 with open(cache_path, "r", encoding="utf-8") as f:
                     cached = json.load(f)
                 cached["fallback"] = True
+                metrics.cache_hit("hot_fallback")
                 return cached
             except Exception as ce:
                 logger.warning(f"No hot cache available: {ce}")
+                metrics.cache_miss("hot_fallback")
                 return result
-        else:
+        elif not stale:
             try:
                 cache_dir = os.path.join(os.getcwd(), ".data", "cache")
                 os.makedirs(cache_dir, exist_ok=True)
@@ -217,13 +433,13 @@ def get_hot_stocks():
                     json.dump(to_cache, f, ensure_ascii=False)
             except Exception as we:
                 logger.warning(f"Failed to write hot cache: {we}")
-            return result
+        return result
     except Exception as e:
         logger.error(f"Error hot: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/kline")
-def get_kline(symbol: str, period: str = "daily", adjust: str = "qfq"):
+async def get_kline(symbol: str, period: str = "daily", adjust: str = "qfq"):
     """
     获取K线数据，直接供前端图表使用
     :param symbol: 股票代码
@@ -231,30 +447,114 @@ def get_kline(symbol: str, period: str = "daily", adjust: str = "qfq"):
     :param adjust: 复权 qfq, hfq, ""
     """
     try:
-        # 复用 Tools 中的逻辑，但直接返回 JSON 对象
-        import akshare as ak
-        code = symbol[-6:]
+        stock_name, df = await executors.market.run(_fetch_kline, symbol, period, adjust)
         
-        # 获取股票名称
-        stock_name = symbol
-        try:
-            info = ak.stock_individual_info_em(symbol=code)
-            name_row = info[info['item'] == '股票简称']
-            if not name_row.empty:
-                stock_name = name_row.iloc[0]['value']
-        except Exception as e:
-            logger.warning(f"Failed to fetch stock name: {e}")
-
-        # Map period to akshare parameters
-        # ak.stock_zh_a_hist supports period="daily", "weekly", "monthly"
-        # For minutes, we need stock_zh_a_hist_min_em
+        if df.empty:
+             raise HTTPException(status_code=404, detail="No data found")
+             
+        data = await executors.compute.run(_kline_records, df)
         
+        result = {
+            "name": stock_name,
+            "symbol": symbol,
+            "data": data
+        }
+        stale = staleness(df)
+        if stale:
+            result["stale"] = stale
+        return result
+    except (BulkheadFull, UpstreamUnavailable, HTTPException):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching kline: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/indicators")
+async def get_indicators(symbol: str, names: str = "MA5,MA10,MA20,BOLL", period: str = "daily",
+                         adjust: str = "qfq", bars: bool = False):
+    """
+    指标叠加序列，供前端图表绘制
+    :param names: 逗号分隔的指标名，可用指标见 /api/indicators/available
+    :param period: 与 /api/kline 相同
+    :param bars: 为 true 时一并返回K线（与 /api/kline 的 data 相同），图表只需请求一次
+    """
+    import indicators
+    requested = [n.strip().upper() for n in names.split(",") if n.strip()]
+    unknown = [n for n in requested if n not in indicators.REGISTRY or not indicators.REGISTRY[n].public]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail={
+            "unknown": unknown,
+            "available": [i["name"] for i in indicators.available()],
+        })
+    try:
+        stock_name, df = await executors.market.run(_fetch_kline, symbol, period, adjust)
+        if df.empty:
+            raise HTTPException(status_code=404, detail="No data found")
+        result = await executors.compute.run(_indicator_series, df, requested, bars)
+        result.update({"name": stock_name, "symbol": symbol, "period": period})
+        stale = staleness(df)
+        if stale:
+            result["stale"] = stale
+        return result
+    except (BulkheadFull, UpstreamUnavailable, HTTPException):
+        raise
+    except Exception as e:
+        logger.error(f"Error computing indicators: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/indicators/available")
+async def list_indicators():
+    import indicators
+    return {"indicators": indicators.available()}
+
+def _indicator_series(df, names, bars: bool):
+    """按请求的指标求值，序列与K线时间戳一一对应，缺失值为 null"""
+    import indicators
+    import pandas as pd
+    with span("indicators"):
+        groups = indicators.compute(df, names)
+    date_col = "日期" if "日期" in df.columns else "时间"
+    with span("serialize"):
+        result = {
+            "timestamp": ((pd.to_datetime(df[date_col]) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).tolist(),
+            "indicators": {
+                name: {
+                    series_name: _nullable(series.to_numpy(dtype=float))
+                    for series_name, series in outputs.items()
+                }
+                for name, outputs in groups.items()
+            },
+        }
+    if bars:
+        result["data"] = _kline_records(df)
+    return result
+
+def _nullable(values):
+    """float 数组 -> 保留 4 位小数的列表，NaN 转为 None"""
+    import numpy as np
+    rounded = np.round(values, 4)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+def _fetch_kline(symbol: str, period: str, adjust: str):
+    """获取股票名称与K线 DataFrame"""
+    from data_provider import ak
+    import kline_store
+    code = symbol[-6:]
+    
+    # 获取股票名称
+    stock_name = _lookup_stock_name(symbol)
+
+    # Map period to akshare parameters
+    # ak.stock_zh_a_hist supports period="daily", "weekly", "monthly"
+    # For minutes, we need stock_zh_a_hist_min_em
+    
+    with span("fetch"):
         if period in ["daily", "weekly", "monthly"]:
-            start_date = "20200101" # Load more history for weekly/monthly
             if period == "daily":
-                start_date = "20230101"
-            
-            df = ak.stock_zh_a_hist(symbol=code, period=period, start_date=start_date, adjust=adjust)
+                # 日K只存一份不复权数据 + 复权因子，三种复权方式共用
+                df = kline_store.daily_bars(code, adjust=adjust, start_date="20230101")
+            else:
+                df = ak.stock_zh_a_hist(symbol=code, period=period, start_date="20200101", adjust=adjust) # Load more history for weekly/monthly
         
         elif period in ["1", "5", "15", "30", "60"]:
             # Minute data
@@ -264,60 +564,55 @@ def get_kline(symbol: str, period: str = "daily", adjust: str = "qfq"):
             df = ak.stock_zh_a_hist_min_em(symbol=code, period=period, adjust=adjust)
         else:
             # Default to daily
-            df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date="20230101", adjust=adjust)
-        
-        if df.empty:
-             raise HTTPException(status_code=404, detail="No data found")
-             
-        # Rename columns based on period type
-        # Minute data columns: 时间, 开盘, 收盘, 最高, 最低, 成交量, 成交额, ...
-        # Daily data columns: 日期, 开盘, 收盘, 最高, 最低, 成交量, ...
-        
-        rename_map = {
-            "日期": "date_str",
-            "时间": "date_str",
-            "开盘": "open",
-            "最高": "high",
-            "最低": "low",
-            "收盘": "close",
-            "成交量": "volume"
-        }
+            df = kline_store.daily_bars(code, adjust=adjust, start_date="20230101")
+
+    return stock_name, df
+
+def _kline_records(df):
+    """把 akshare K线 DataFrame 序列化为前端图表使用的记录列表"""
+    # Rename columns based on period type
+    # Minute data columns: 时间, 开盘, 收盘, 最高, 最低, 成交量, 成交额, ...
+    # Daily data columns: 日期, 开盘, 收盘, 最高, 最低, 成交量, ...
+    
+    rename_map = {
+        "日期": "date_str",
+        "时间": "date_str",
+        "开盘": "open",
+        "最高": "high",
+        "最低": "low",
+        "收盘": "close",
+        "成交量": "volume"
+    }
+    import pandas as pd
+    with span("serialize"):
         df = df.rename(columns=rename_map)
         
         # 转换日期为时间戳 (毫秒)
         df['timestamp'] = pd.to_datetime(df['date_str']).apply(lambda x: x.timestamp() * 1000)
         
-        data = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].to_dict(orient="records")
-        
-        return {
-            "name": stock_name,
-            "symbol": symbol,
-            "data": data
-        }
-    except Exception as e:
-        logger.error(f"Error fetching kline: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].to_dict(orient="records")
 
 @app.get("/api/recommend")
-def get_recommended_stocks():
+async def get_recommended_stocks():
     """
     获取推荐买入的个股 (1-3只)
     基于量化指标筛选：MA多头排列 + MACD金叉 + RSI超卖反弹
     """
+    return await executors.market.run(_get_recommended_stocks)
+
+def _get_recommended_stocks():
     try:
-        import akshare as ak
         from direct_analysis import calculate_technical_indicators
+        import kline_store
         
         # 1. 获取热门股票候选池 (从热点榜单中筛选，保证活跃度)
         candidates = []
         try:
-            # 使用个股人气榜前20作为候选
-            df_rank = ak.stock_hot_rank_em().head(20)
-            for _, row in df_rank.iterrows():
-                code = str(row['代码'])
-                if code.upper().startswith('SH') or code.upper().startswith('SZ'):
-                    code = code[2:]
-                candidates.append({"code": code, "name": row['股票名称']})
+            # 使用个股人气榜前20作为候选（共享快照，按 cache_policy 的 hot_rank 策略刷新）
+            rank = shared_snapshot.head(shared_snapshot.hot_rank, 20)
+            if rank is None:
+                raise RuntimeError("hot rank snapshot unavailable")
+            candidates = [{"code": row["code"], "name": row["name"]} for row in rank["rows"]]
         except Exception as e:
             logger.warning(f"Failed to fetch rank candidates: {e}")
             # Fallback candidates if rank fails
@@ -333,7 +628,7 @@ def get_recommended_stocks():
             try:
                 code = stock['code']
                 # 获取历史数据
-                df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date="20230101", adjust="qfq")
+                df = kline_store.daily_bars(code, adjust="qfq", start_date="20230101")
                 
                 if df.empty or len(df) < 60:
                     continue
@@ -383,19 +678,45 @@ def get_recommended_stocks():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# 股票搜索缓存
+# 股票搜索缓存：下载与拼音计算只在共享快照的 leader 进程做一次，
+# 本进程缓存由当前快照版本物化出的列表，版本变化时重建
+UNIVERSE_FIELDS = stock_universe.FIELDS
 _stock_list_cache = None
+_stock_list_version = None
+
+def _universe_columns():
+    from data_provider import ak
+    stocks = _build_stock_list(ak.stock_info_a_code_name())
+    return {field: [s[field] for s in stocks] for field in UNIVERSE_FIELDS}
 
-def _get_stock_list():
-    """获取股票列表（带缓存）并附带首字母与拼音全称字段"""
-    global _stock_list_cache
-    if _stock_list_cache is not None:
+universe_snapshot = shared_snapshot.SharedSnapshot(
+    "universe", _universe_columns, ttl=float(os.getenv("SHARED_UNIVERSE_TTL", "86400"))
+)
+
+def _get_stock_list() -> StockUniverse:
+    """获取列式股票池（带缓存），含首字母与拼音全称字段"""
+    global _stock_list_cache, _stock_list_version
+    # 已有本地列表时不等待，首次加载时等 leader 发布
+    segment = universe_snapshot.get(wait=0.0 if _stock_list_cache is not None else 15.0)
+    if _stock_list_cache is not None and (segment is None or segment.version == _stock_list_version):
+        metrics.cache_hit("stock_list")
         return _stock_list_cache
-    
-    import akshare as ak
+    metrics.cache_miss("stock_list")
+
+    if segment is not None:
+        # 直接引用共享快照段中的列，不物化为 dict 列表
+        universe = StockUniverse.from_segment(segment)
+        _stock_list_version = segment.version
+    else:
+        # 共享快照不可用时退回到本进程自行下载
+        from data_provider import ak
+        universe = StockUniverse.from_records(_build_stock_list(ak.stock_info_a_code_name()))
+    _stock_list_cache = universe
+    return universe
+
+def _build_stock_list(df):
+    """把 stock_info_a_code_name 的结果转换为带市场、首字母与拼音全称的股票列表"""
     from pypinyin import lazy_pinyin, STYLE_FIRST_LETTER
-    
-    df = ak.stock_info_a_code_name()
 
     def get_initials(name):
         cleaned = str(name).replace('*', '').replace('ST', '').replace('Ａ', 'A').replace(' ', '')
@@ -428,11 +749,10 @@ def _get_stock_list():
             "initials": initials,
             "pinyin_full": pinyin_full
         })
-    _stock_list_cache = stocks
     return stocks
 
 @app.get("/api/search")
-def search_stocks(q: str = "", limit: int = 20):
+async def search_stocks(q: str = "", limit: int = 20):
     """
     股票搜索API
     支持：
@@ -440,62 +760,20 @@ def search_stocks(q: str = "", limit: int = 20):
     - 股票名称搜索 (如 茅台)
     - 拼音首字母搜索 (如 MT, gsmt)
     """
-    try:
-        stocks = _get_stock_list()
-        q = (q or "").strip().upper()
-        if not q:
-            return []
-        results = []
-        seen = set()
-
-        def add_stock_with_score(stock, score):
-            key = stock['code']
-            if key in seen:
-                return
-            stock_with_score = dict(stock)
-            stock_with_score['score'] = int(score)
-            results.append(stock_with_score)
-            seen.add(key)
-
-        # 优先代码精确/前缀匹配
-        if q.isdigit():
-            for stock in stocks:
-                code = stock['code']
-                if code == q.zfill(6):
-                    add_stock_with_score(stock, 1000)
-            if not any(r['code'] == q.zfill(6) for r in results):
-                for stock in stocks:
-                    if stock['code'].startswith(q):
-                        add_stock_with_score(stock, 800)
-                        if len(results) >= limit:
-                            break
-
-        # 拼音首字母、名称等多维度匹配
-        for stock in stocks:
-            code = stock['code']
-            name = stock['name']
-            initials = stock.get('initials', '')
-            pfull = stock.get('pinyin_full', '')
-            score = 0
-            if q in code:
-                score += 40
-            if q in name.upper():
-                score += 60
-            if initials.startswith(q):
-                score += 50
-            elif initials.find(q) != -1:
-                score += 20
-            if pfull.startswith(q):
-                score += 40
-            elif q and pfull.find(q) != -1:
-                score += 10
-            if score > 0:
-                add_stock_with_score(stock, score)
-            if len(results) >= limit:
-                break
+    if _stock_list_cache is None:
+        # 首次搜索需要下载股票列表，属于行情接口
+        try:
+            await executors.market.run(_get_stock_list)
+        except BulkheadFull:
+            raise
+        except Exception as e:
+            logger.error(f"Error loading stock list: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    return await executors.compute.run(_search_stocks, q, limit)
 
-        results.sort(key=lambda s: s.get('score', 0), reverse=True)
-        return results[:limit]
+def _search_stocks(q: str, limit: int):
+    try:
+        return _get_stock_list().search(q, limit)
     except Exception as e:
         logger.error(f"Error searching stocks: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -507,36 +785,109 @@ def search_stocks(q: str = "", limit: int = 20):
 # 若需流式，可后续添加 SSE endpoint 监听内部事件队列。
 
 # 实时买卖分析API
-from realtime_trade import get_trade_signal, get_realtime_data
+@app.get("/api/trade-signal/accuracy")
+async def get_trade_signal_accuracy():
+    """
+    已记录交易信号的实际准确率与收益（收盘后统计）
+    """
+    from realtime_trade import get_history_accuracy
+    return await executors.compute.run(get_history_accuracy)
 
 @app.get("/api/trade-signal/{symbol}")
-def get_trade_signal_api(symbol: str):
+async def get_trade_signal_api(symbol: str):
     """
     获取股票实时买卖信号
     返回买入/卖出建议、置信度、关键理由等
     """
     try:
         logger.info(f"Generating trade signal for {symbol}")
-        signal = get_trade_signal(symbol)
+        from realtime_trade import get_trade_signal
+        signal = await executors.market.run(get_trade_signal, symbol)
         return signal
+    except BulkheadFull:
+        raise
     except Exception as e:
         logger.error(f"Error generating trade signal: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/realtime/{symbol}")
-def get_realtime_data_api(symbol: str):
+async def get_realtime_data_api(symbol: str):
     """
     获取股票实时行情数据
     包括最新价、盘口、分时数据、资金流向等
     """
     try:
         logger.info(f"Fetching realtime data for {symbol}")
-        data = get_realtime_data(symbol)
+        from realtime_trade import get_realtime_data
+        data = await executors.market.run(get_realtime_data, symbol)
         return data
+    except BulkheadFull:
+        raise
     except Exception as e:
         logger.error(f"Error fetching realtime data: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class AlertRuleRequest(BaseModel):
+    client_id: str
+    symbol: str
+    field: str # price, change_pct, turnover_rate, amount, volume, RSI6, K, D, J, score
+    op: str # cross_above, cross_below, above, below, band_change
+    threshold: Optional[float] = None
+    once: bool = True
+    cooldown: float = 300.0
+
+@app.post("/api/alerts")
+async def create_alert(request: AlertRuleRequest):
+    """
+    登记盯盘条件，命中后通过 /api/alerts/stream 推送
+    """
+    import alerts
+    try:
+        rule = alerts.make_rule(request.client_id, request.symbol, request.field, request.op,
+                                request.threshold, request.once, request.cooldown)
+        rule = await executors.compute.run(alerts.store.add, rule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return rule.describe()
+
+@app.get("/api/alerts")
+async def list_alerts(client_id: str):
+    import alerts
+    rules = await executors.compute.run(alerts.store.for_client, client_id)
+    return {"rules": [r.describe() for r in rules]}
+
+@app.delete("/api/alerts/{rule_id}")
+async def delete_alert(rule_id: str, client_id: str):
+    import alerts
+    removed = await executors.compute.run(alerts.store.remove, [rule_id], client_id)
+    if not removed:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return {"removed": rule_id}
+
+@app.get("/api/alerts/stream")
+async def stream_alerts(client_id: str, request: Request):
+    """
+    SSE：每次全市场行情快照刷新后统一求值，命中的规则以 alert 事件推送；每 15 秒发送一次心跳注释
+    """
+    import alerts
+    queue = alerts.hub.subscribe(client_id)
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: alert\nid: {event['event_id']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            alerts.hub.unsubscribe(client_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 class TradeLogRequest(BaseModel):
     user_id: str
     symbol: str
@@ -546,10 +897,13 @@ class TradeLogRequest(BaseModel):
     reasons: list
 
 @app.post("/api/trade-log")
-def log_trade_view(request: TradeLogRequest):
+async def log_trade_view(request: TradeLogRequest):
     """
     记录用户查看买卖建议的日志（用于合规审计）
     """
+    return await executors.compute.run(_append_trade_log, request)
+
+def _append_trade_log(request: TradeLogRequest):
     try:
         log_entry = {
             "user_id": request.user_id,
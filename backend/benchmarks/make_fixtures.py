@@ -0,0 +1,137 @@
+"""
+生成基准测试使用的合成数据 (固定随机种子，结果可复现)。
+
+    python benchmarks/make_fixtures.py
+
+输出到 benchmarks/fixtures/：
+- stock_universe.csv  5000 只股票的 code/name，格式同 ak.stock_info_a_code_name()
+- daily_bars.csv      单只股票约 3 年日K，列名同 ak.stock_zh_a_hist()
+- minute_bars.csv     单只股票 5 个交易日的 1 分钟K，列名同 ak.stock_zh_a_hist_min_em()
+"""
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SEED = 20240101
+UNIVERSE_SIZE = 5000
+
+# 常见于 A 股简称的汉字，保证拼音首字母分布接近真实
+NAME_CHARS = (
+    "中国平安银行招商工商建设农业交通兴业浦发民生光大华夏北京上海深圳广州"
+    "贵州茅台五粮液泸州老窖洋河山西汾酒古井贡海天味业伊利乳业双汇发展牧原温氏"
+    "格力美的海尔智家科技电子信息通信软件网络数据智能云计算半导体芯片材料"
+    "新能源光伏风电储能锂电池汽车比亚迪长城长安宁德时代隆基绿能通威阳光电源"
+    "医药生物恒瑞迈瑞药明康德复星片仔癀云南白药爱尔眼科智飞长春高新"
+    "证券中信东方财富国泰君安华泰海通招商保险人寿太保新华地产万科保利金地"
+    "能源石油石化神华煤业有色金属紫金矿业洛阳钼业钢铁宝钢化工万华盐湖"
+    "航空航天中航工业船舶重工机械三一重工徐工恒立液压建筑中铁中建铁建"
+    "电力长江华能大唐国电水务环保传媒文化旅游酒店百货零售物流顺丰控股集团实业"
+)
+
+CODE_PREFIXES = [
+    ("600", 900), ("601", 500), ("603", 600), ("688", 500),
+    ("000", 600), ("001", 100), ("002", 900), ("300", 700), ("301", 100),
+    ("430", 30), ("830", 40), ("870", 30),
+]
+
+# 搜索基准会查询到的真实名称
+KNOWN_STOCKS = [
+    ("600519", "贵州茅台"), ("000001", "平安银行"), ("000858", "五粮液"),
+    ("300750", "宁德时代"), ("601318", "中国平安"), ("600036", "招商银行"),
+    ("002594", "比亚迪"), ("000333", "美的集团"), ("600276", "恒瑞医药"),
+    ("601012", "隆基绿能"),
+]
+
+
+def make_universe(rng: random.Random) -> pd.DataFrame:
+    codes = set(code for code, _ in KNOWN_STOCKS)
+    rows = list(KNOWN_STOCKS)
+    for prefix, count in CODE_PREFIXES:
+        made = 0
+        while made < count and len(rows) < UNIVERSE_SIZE:
+            code = f"{prefix}{rng.randrange(1000):03d}"
+            if code in codes:
+                continue
+            codes.add(code)
+            name = "".join(rng.choice(NAME_CHARS) for _ in range(rng.choice((2, 3, 4, 4, 4))))
+            roll = rng.random()
+            if roll < 0.03:
+                name = "*ST" + name[:3]
+            elif roll < 0.06:
+                name = "ST" + name[:3]
+            elif roll < 0.08:
+                name = name[:3] + "Ａ"
+            rows.append((code, name))
+            made += 1
+    # 补足到 UNIVERSE_SIZE
+    while len(rows) < UNIVERSE_SIZE:
+        code = f"{rng.randrange(1000000):06d}"
+        if code in codes:
+            continue
+        codes.add(code)
+        rows.append((code, "".join(rng.choice(NAME_CHARS) for _ in range(4))))
+    return pd.DataFrame(rows, columns=["code", "name"])
+
+
+def make_daily_bars(np_rng: np.random.Generator, days: int = 750) -> pd.DataFrame:
+    dates = pd.bdate_range("2023-01-03", periods=days)
+    close = 100 * np.exp(np.cumsum(np_rng.normal(0.0003, 0.018, days)))
+    open_ = close * (1 + np_rng.normal(0, 0.006, days))
+    high = np.maximum(open_, close) * (1 + np.abs(np_rng.normal(0, 0.008, days)))
+    low = np.minimum(open_, close) * (1 - np.abs(np_rng.normal(0, 0.008, days)))
+    volume = np_rng.integers(50_000, 500_000, days)
+    prev = np.concatenate([[close[0]], close[:-1]])
+    return pd.DataFrame({
+        "日期": dates.strftime("%Y-%m-%d"),
+        "股票代码": "600519",
+        "开盘": open_.round(2),
+        "收盘": close.round(2),
+        "最高": high.round(2),
+        "最低": low.round(2),
+        "成交量": volume,
+        "成交额": (volume * close * 100).round(2),
+        "振幅": ((high - low) / prev * 100).round(2),
+        "涨跌幅": ((close - prev) / prev * 100).round(2),
+        "涨跌额": (close - prev).round(2),
+        "换手率": np_rng.uniform(0.2, 5.0, days).round(2),
+    })
+
+
+def make_minute_bars(np_rng: np.random.Generator, sessions: int = 5) -> pd.DataFrame:
+    times = []
+    for day in pd.bdate_range("2024-06-03", periods=sessions):
+        for start, end in (("09:31", "11:30"), ("13:01", "15:00")):
+            times.extend(pd.date_range(f"{day.date()} {start}", f"{day.date()} {end}", freq="1min"))
+    n = len(times)
+    close = 100 * np.exp(np.cumsum(np_rng.normal(0, 0.0015, n)))
+    open_ = close * (1 + np_rng.normal(0, 0.0005, n))
+    high = np.maximum(open_, close) * (1 + np.abs(np_rng.normal(0, 0.0006, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(np_rng.normal(0, 0.0006, n)))
+    volume = np_rng.integers(100, 5_000, n)
+    return pd.DataFrame({
+        "时间": [t.strftime("%Y-%m-%d %H:%M:%S") for t in times],
+        "开盘": open_.round(2),
+        "收盘": close.round(2),
+        "最高": high.round(2),
+        "最低": low.round(2),
+        "成交量": volume,
+        "成交额": (volume * close * 100).round(2),
+        "均价": close.round(3),
+    })
+
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    rng = random.Random(SEED)
+    np_rng = np.random.default_rng(SEED)
+    make_universe(rng).to_csv(os.path.join(FIXTURE_DIR, "stock_universe.csv"), index=False)
+    make_daily_bars(np_rng).to_csv(os.path.join(FIXTURE_DIR, "daily_bars.csv"), index=False)
+    make_minute_bars(np_rng).to_csv(os.path.join(FIXTURE_DIR, "minute_bars.csv"), index=False)
+    print(f"Fixtures written to {FIXTURE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
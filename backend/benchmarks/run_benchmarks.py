@@ -0,0 +1,188 @@
+"""
+CPU 热路径微基准测试
+
+使用 benchmarks/fixtures 下的合成数据，不访问网络。在 backend 目录下运行：
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --filter search --repeat 50
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<commit>.json
+
+结果以 JSON 写入 benchmarks/results/<git commit>.json（同时更新 latest.json），
+--compare 会对比两次结果，任一用例中位数变慢超过 --threshold 时以非零状态退出。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures")
+RESULT_DIR = os.path.join(BENCH_DIR, "results")
+
+sys.path.insert(0, BACKEND_DIR)
+# 共享快照写到临时目录，不影响本机正在运行的后端
+os.environ.setdefault("SHARED_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="bench-snapshots-"))
+
+import pandas as pd
+
+SEARCH_QUERIES = ["600519", "600", "MT", "GZMT", "茅台", "ZGPA", "NINGDE", "XYZQ"]
+# 精确层无结果、需要模糊层补足的查询（拼音输错一个字母）
+FUZZY_QUERIES = ["GSMT", "ZGPQ", "GUIZOUMAOTAI"]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def load_fixtures() -> Dict[str, pd.DataFrame]:
+    return {
+        "universe": pd.read_csv(os.path.join(FIXTURE_DIR, "stock_universe.csv"), dtype={"code": str}),
+        "daily": pd.read_csv(os.path.join(FIXTURE_DIR, "daily_bars.csv"), dtype={"股票代码": str}),
+        "minute": pd.read_csv(os.path.join(FIXTURE_DIR, "minute_bars.csv")),
+    }
+
+
+def build_cases(fixtures: Dict[str, pd.DataFrame]) -> Dict[str, Callable[[], object]]:
+    """返回 {用例名: 无参可调用对象}"""
+    import app
+    from direct_analysis import calculate_technical_indicators
+    import multi_timeframe
+    from realtime_trade import RealtimeTradeAnalyzer
+
+    daily = fixtures["daily"]
+    minute = fixtures["minute"]
+    universe = fixtures["universe"]
+    analyzer = RealtimeTradeAnalyzer()
+
+    # search_stocks 读取共享快照中的股票列表，这里用合成股票池发布一版
+    import shared_snapshot
+    stocks = app._build_stock_list(universe)
+    shared_snapshot.write_segment(
+        app.universe_snapshot.path, {f: [s[f] for s in stocks] for f in app.UNIVERSE_FIELDS}
+    )
+    app._get_stock_list()
+
+    def search_all():
+        for q in SEARCH_QUERIES:
+            app._search_stocks(q, 20)
+
+    cases = {
+        # 指标函数已不再修改传入的 DataFrame，保留复制以便与历史结果直接对比
+        "indicators.calculate_technical_indicators": lambda: calculate_technical_indicators(daily.copy()),
+        "indicators.realtime_compute_indicators": lambda: analyzer.compute_indicators(daily.copy()),
+        "search.search_stocks_5000x8": search_all,
+        "universe.build_stock_list_5000": lambda: app._build_stock_list(universe),
+        "indicators.overlay_series_daily": lambda: app._indicator_series(daily, ["MA5", "MA10", "MA20", "BOLL", "MACD"], False),
+        "timeframes.analyze_minute_daily": lambda: multi_timeframe.analyze(minute, daily),
+        "kline.serialize_daily": lambda: app._kline_records(daily),
+        "kline.serialize_minute": lambda: app._kline_records(minute),
+    }
+    for q in SEARCH_QUERIES:
+        cases[f"search.q={q}"] = (lambda q=q: app._search_stocks(q, 20))
+    for q in FUZZY_QUERIES:
+        cases[f"search.fuzzy.q={q}"] = (lambda q=q: app._search_stocks(q, 20))
+    return cases
+
+
+def time_case(fn: Callable[[], object], repeat: int, warmup: int, max_seconds: float) -> Dict:
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > max_seconds and len(samples) >= 3:
+            break
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0] * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "p95_ms": round(p95 * 1000, 4),
+    }
+
+
+def compare(current: Dict, baseline_path: str, threshold: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = 0
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"  {name:<45} new")
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"  {name:<45} {base['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run CPU hot-path micro-benchmarks")
+    parser.add_argument("--filter", help="只运行名称包含该子串的用例")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="单个用例的时间上限")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="中位数变慢超过该比例视为回归")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    cases = build_cases(fixtures)
+
+    commit = _git_commit()
+    results = {}
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_case(fn, args.repeat, args.warmup, args.max_seconds)
+        r = results[name]
+        print(f"{name:<45} median {r['median_ms']:>10.3f} ms  p95 {r['p95_ms']:>10.3f} ms  ({r['runs']} runs)")
+
+    report = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    if not args.no_save:
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        for path in (os.path.join(RESULT_DIR, f"{commit}.json"), os.path.join(RESULT_DIR, "latest.json")):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {RESULT_DIR}/{commit}.json")
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{regressions} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
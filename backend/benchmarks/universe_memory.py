@@ -0,0 +1,97 @@
+"""
+股票池内存对比
+
+用 benchmarks/fixtures 下的合成股票池，比较旧布局（每只股票一个 dict）与列式 StockUniverse 的
+常驻内存，以及每次搜索的临时分配峰值。在 backend 目录下运行：
+
+    python benchmarks/universe_memory.py
+    python benchmarks/universe_memory.py --json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from typing import Callable, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("SHARED_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="bench-snapshots-"))
+
+import pandas as pd
+
+SEARCH_QUERIES = ["600519", "600", "MT", "GZMT", "茅台", "A"]
+
+
+def retained(build: Callable[[], object]) -> Dict:
+    """build() 返回对象后仍被其引用的内存"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return {"retained_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1)}
+
+
+def search_peak(search: Callable[[str], object]) -> Dict:
+    """每个查询的临时分配峰值"""
+    out = {}
+    for q in SEARCH_QUERIES:
+        search(q)
+        tracemalloc.start()
+        search(q)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        out[q] = round(peak / 1024, 1)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory of the dict-list and columnar stock universe")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    import app
+    import shared_snapshot
+    from stock_universe import FIELDS, StockUniverse
+
+    universe = pd.read_csv(os.path.join(FIXTURE_DIR, "stock_universe.csv"), dtype={"code": str})
+    stocks = app._build_stock_list(universe)
+    columns = {f: [s[f] for s in stocks] for f in FIELDS}
+    shared_snapshot.write_segment(app.universe_snapshot.path, columns)
+    segment = shared_snapshot.Segment(app.universe_snapshot.path)
+    columnar = StockUniverse.from_records(stocks)
+
+    report = {
+        "stocks": len(stocks),
+        "layout": {
+            # 旧布局：共享快照段物化为 dict 列表（原 _get_stock_list 的做法）
+            "dict_list": retained(lambda: [
+                dict(zip(FIELDS, values)) for values in zip(*(segment.column(f).tolist() for f in FIELDS))
+            ]),
+            "columnar": retained(lambda: StockUniverse.from_records(stocks)),
+            "columnar_from_segment": retained(lambda: StockUniverse.from_segment(segment)),
+        },
+        "search_peak_kb": search_peak(lambda q: columnar.search(q, 20)),
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"{report['stocks']} stocks")
+    for name, r in report["layout"].items():
+        print(f"  {name:<24} retained {r['retained_kb']:>9.1f} KB  build peak {r['peak_kb']:>9.1f} KB")
+    print("search allocation peak (top 20):")
+    for q, kb in report["search_peak_kb"].items():
+        print(f"  {q:<10} {kb:>8.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
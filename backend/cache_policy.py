@@ -0,0 +1,238 @@
+"""
+行情缓存时效策略 (Cache Policy)
+
+各处缓存原先按固定 TTL 过期：夜里和周末照样每隔几秒回源，盘中又可能拿着收盘前的数据。
+这里按 A 股交易日历（新浪 tool_trade_date_hist_sina，含节假日）与交易时段
+（09:30-11:30、13:00-15:00）计算每类数据的过期时刻：
+
+- 交易时段内取得的数据：session_ttl 秒后过期；
+- 午休、收盘后、夜间、周末及节假日取得的数据：行情已冻结，保持到下一次开盘
+  （13:00 或下一交易日 09:30）才过期；
+- 收盘后 settle 秒内（午休为 60 秒内）取得的数据可能还没定型（盘后固定价格交易、
+  日K收盘价与成交量的修正），只保持到 settle 结束，之后再取一次定型数据；
+- closed_ttl 不为空的数据（如人气榜）休市期间也在变化，休市时最多保持 closed_ttl 秒。
+
+    expires_at("spot", fetched_at)                  # 过期时刻 (Unix 时间戳)
+    is_expired("daily", fetched_at, session_ttl=300)
+
+所有日期与时刻都按北京时间（Asia/Shanghai）计算，与服务器所在时区无关（容器默认是 UTC）；
+market_now / market_today / market_time / market_timestamp 在北京时间的 naive datetime
+与 Unix 时间戳之间换算，其他模块判断交易日、按天分区时也应使用它们。
+
+交易日历缓存在 .data/calendar/trade_dates.json，每 TRADING_CALENDAR_REFRESH_DAYS（默认 30 天）
+或日历不覆盖当天时重新拉取；拉取失败且没有缓存时按周一至周五估计。
+"""
+import bisect
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+try:
+    MARKET_TZ = ZoneInfo("Asia/Shanghai")
+except ZoneInfoNotFoundError:  # 系统和 tzdata 包都没有时区数据；北京时间 1991 年后没有夏令时
+    MARKET_TZ = datetime.timezone(datetime.timedelta(hours=8), "Asia/Shanghai")
+CALENDAR_PATH = os.path.join(os.getcwd(), ".data", "calendar", "trade_dates.json")
+SESSIONS = (
+    (datetime.time(9, 30), datetime.time(11, 30)),
+    (datetime.time(13, 0), datetime.time(15, 0)),
+)
+MARKET_CLOSE = SESSIONS[-1][1]
+# 午休只需等上午最后一笔成交落地
+LUNCH_SETTLE = 60.0
+# 拉取日历失败后多久再试
+RETRY_SECONDS = 600.0
+
+
+def market_time(timestamp: float) -> datetime.datetime:
+    """Unix 时间戳 -> 北京时间（naive）"""
+    return datetime.datetime.fromtimestamp(timestamp, MARKET_TZ).replace(tzinfo=None)
+
+
+def market_timestamp(moment: datetime.datetime) -> float:
+    """北京时间（naive）-> Unix 时间戳"""
+    return moment.replace(tzinfo=MARKET_TZ).timestamp()
+
+
+def market_now() -> datetime.datetime:
+    return datetime.datetime.now(MARKET_TZ).replace(tzinfo=None)
+
+
+def market_today() -> datetime.date:
+    return market_now().date()
+
+
+class TradingCalendar:
+    def __init__(self, path: str = CALENDAR_PATH, refresh_days: float = 30.0):
+        self.path = path
+        self.refresh_seconds = refresh_days * 86400
+        self._ordinals: Optional[List[int]] = None
+        self._fetched_at = 0.0
+        self._checked = 0.0
+        self._failed_at = -RETRY_SECONDS
+        self._lock = threading.Lock()
+
+    # --- 日历数据 ---
+    def _read(self) -> Optional[Tuple[float, List[int]]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["fetched_at"], [datetime.date.fromisoformat(d).toordinal() for d in data["dates"]]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to read trading calendar: {e}")
+            return None
+
+    def _fetch(self) -> List[int]:
+        from data_provider import ak, staleness
+        df = ak.tool_trade_date_hist_sina()
+        if staleness(df) is not None:
+            raise RuntimeError("trading calendar upstream returned stale data")
+        dates = sorted({datetime.date.fromisoformat(str(d)[:10]) for d in df["trade_date"]})
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "dates": [d.isoformat() for d in dates]}, f)
+        os.replace(tmp_path, self.path)
+        return [d.toordinal() for d in dates]
+
+    def _covers(self, ordinals: Optional[List[int]], today: int) -> bool:
+        return bool(ordinals) and ordinals[0] <= today <= ordinals[-1]
+
+    def _dates(self) -> Optional[List[int]]:
+        # 每分钟最多检查一次是否需要重新加载
+        now = time.time()
+        if self._ordinals is not None and now - self._checked < 60:
+            return self._ordinals
+        with self._lock:
+            self._checked = now
+            today = market_today().toordinal()
+            if self._ordinals is None:
+                stored = self._read()
+                if stored is not None:
+                    self._fetched_at, self._ordinals = stored
+            if (now - self._fetched_at < self.refresh_seconds and self._covers(self._ordinals, today)) \
+                    or time.monotonic() - self._failed_at < RETRY_SECONDS:
+                return self._ordinals
+            try:
+                self._ordinals, self._fetched_at = self._fetch(), now
+            except Exception as e:
+                self._failed_at = time.monotonic()
+                logger.warning(f"Failed to fetch trading calendar, {'using cached' if self._ordinals else 'assuming weekdays'}: {e}")
+            return self._ordinals
+
+    # --- 交易日 ---
+    def is_trading_day(self, day: datetime.date) -> bool:
+        ordinals = self._dates()
+        ordinal = day.toordinal()
+        if ordinals and ordinals[0] <= ordinal <= ordinals[-1]:
+            i = bisect.bisect_left(ordinals, ordinal)
+            return ordinals[i] == ordinal
+        return day.weekday() < 5
+
+    def next_trading_day(self, day: datetime.date) -> datetime.date:
+        """严格晚于 day 的第一个交易日"""
+        day += datetime.timedelta(days=1)
+        for _ in range(60):
+            if self.is_trading_day(day):
+                return day
+            day += datetime.timedelta(days=1)
+        return day
+
+    def previous_trading_day(self, day: datetime.date) -> datetime.date:
+        """严格早于 day 的最后一个交易日"""
+        day -= datetime.timedelta(days=1)
+        for _ in range(60):
+            if self.is_trading_day(day):
+                return day
+            day -= datetime.timedelta(days=1)
+        return day
+
+    # --- 交易时段 ---
+    # 以下 moment 均为北京时间的 naive datetime
+    def in_session(self, moment: datetime.datetime) -> bool:
+        if not self.is_trading_day(moment.date()):
+            return False
+        t = moment.time()
+        return any(start <= t < end for start, end in SESSIONS)
+
+    def next_open(self, moment: datetime.datetime) -> datetime.datetime:
+        """晚于 moment 的下一次开盘（上午或下午）"""
+        if self.is_trading_day(moment.date()):
+            for start, _ in SESSIONS:
+                candidate = datetime.datetime.combine(moment.date(), start)
+                if candidate > moment:
+                    return candidate
+        return datetime.datetime.combine(self.next_trading_day(moment.date()), SESSIONS[0][0])
+
+    def last_session_end(self, moment: datetime.datetime) -> datetime.datetime:
+        """不晚于 moment 的最近一次休市时刻（11:30 或 15:00）"""
+        if self.is_trading_day(moment.date()):
+            for _, end in reversed(SESSIONS):
+                candidate = datetime.datetime.combine(moment.date(), end)
+                if candidate <= moment:
+                    return candidate
+        return datetime.datetime.combine(self.previous_trading_day(moment.date()), MARKET_CLOSE)
+
+    def last_close(self, moment: datetime.datetime) -> datetime.datetime:
+        """不晚于 moment 的最近一次收盘（交易日 15:00）"""
+        candidate = datetime.datetime.combine(moment.date(), MARKET_CLOSE)
+        if candidate <= moment and self.is_trading_day(moment.date()):
+            return candidate
+        return datetime.datetime.combine(self.previous_trading_day(moment.date()), MARKET_CLOSE)
+
+
+@dataclass(frozen=True)
+class Policy:
+    session_ttl: float
+    settle: float = 0.0
+    closed_ttl: Optional[float] = None
+
+
+# 各类行情数据的默认策略；session_ttl 可由各缓存自己的配置覆盖
+POLICIES = {
+    # 全市场实时行情、五档盘口：盘后固定价格交易 15:30 结束
+    "spot": Policy(session_ttl=15.0, settle=1800.0),
+    # 资金流向：收盘后还会修正一段时间
+    "fund_flow": Policy(session_ttl=60.0, settle=1800.0),
+    # 日K：盘中只有当天那一根在变，收盘后定型
+    "daily": Policy(session_ttl=300.0, settle=1800.0),
+    # 行业/概念板块涨跌
+    "board": Policy(session_ttl=60.0, settle=600.0),
+    # 人气榜按访问热度排名，休市时也在变化
+    "hot_rank": Policy(session_ttl=300.0, settle=600.0, closed_ttl=3600.0),
+}
+
+calendar = TradingCalendar(refresh_days=float(os.getenv("TRADING_CALENDAR_REFRESH_DAYS", "30")))
+
+
+def expires_at(kind: str, fetched_at: float, session_ttl: Optional[float] = None) -> float:
+    """fetched_at 时取得的 kind 类数据的过期时刻"""
+    policy = POLICIES[kind]
+    ttl = policy.session_ttl if session_ttl is None else session_ttl
+    fetched = market_time(fetched_at)
+    if calendar.in_session(fetched):
+        return fetched_at + ttl
+    end = calendar.last_session_end(fetched)
+    settle = policy.settle if end.time() == MARKET_CLOSE else min(policy.settle, LUNCH_SETTLE)
+    settled = market_timestamp(end + datetime.timedelta(seconds=settle))
+    if fetched_at < settled:
+        # 休市后尚未定型：定型后再取一次
+        return min(fetched_at + ttl, settled)
+    expiry = market_timestamp(calendar.next_open(fetched))
+    if policy.closed_ttl is not None:
+        expiry = min(expiry, fetched_at + policy.closed_ttl)
+    return expiry
+
+
+def is_expired(kind: str, fetched_at: float, session_ttl: Optional[float] = None,
+               now: Optional[float] = None) -> bool:
+    return (now if now is not None else time.time()) >= expires_at(kind, fetched_at, session_ttl)
@@ -0,0 +1,480 @@
+"""
+行情数据源抽象层
+
+后端所有 akshare 调用都经由这里的 `ak` 对象，调用写法与 akshare 模块完全一致：
+
+    from data_provider import ak
+    df = ak.stock_zh_a_hist(symbol="600519", period="daily", start_date="20230101", adjust="qfq")
+
+通过环境变量 STOCK_DATA_PROVIDER 切换实现：
+- live   (默认) 直接调用 akshare
+- record 调用 akshare 并把每次成功的返回值落盘到 STOCK_DATA_RECORD_DIR
+- replay 只从 STOCK_DATA_RECORD_DIR 回放录制结果，可注入延迟与错误，用于压测
+
+回放相关配置：
+- STOCK_REPLAY_LATENCY_MS   固定延迟 "50" 或均匀区间 "20-200"
+- STOCK_REPLAY_ERROR_RATE   随机失败概率，如 0.05
+- STOCK_REPLAY_FALLBACK=1   参数未录制时回放同一函数的任意录制结果
+
+除压测外，数据源外层默认包一层 GuardedProvider（UPSTREAM_GUARD=0 关闭）：
+每个 akshare 函数各自一个令牌桶限流和熔断器，调用失败、被限流或熔断打开时，
+若有该参数最近一次成功的结果则返回其副本，并在 DataFrame.attrs["stale"] 标注，
+可用 staleness(df) 读取；没有可用结果时抛出 UpstreamUnavailable 快速失败。
+
+- UPSTREAM_RATE_LIMITS            覆盖限流，如 "default=5:10,stock_zh_a_spot_em=0.5:2"（每秒速率:突发）
+- UPSTREAM_RATE_WAIT_SECONDS      取令牌最多等待的秒数，默认 2
+- UPSTREAM_BREAKER_FAILURES       连续失败多少次后熔断，默认 5
+- UPSTREAM_BREAKER_RESET_SECONDS  熔断后多久放行探测请求，默认 30
+- UPSTREAM_STALE_MAX_AGE_SECONDS  旧数据最长可用多久，默认 86400
+- UPSTREAM_STALE_MAX_ENTRIES      最多保留多少组参数的旧数据，默认 256
+
+录制命令（按前端常用接口预热指定股票）：
+    STOCK_DATA_PROVIDER=record python data_provider.py record --symbols 600519,000001
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import cache_policy
+import metrics
+import timing
+from resilience import STATE_VALUES, CircuitBreaker, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECORD_DIR = os.path.join(os.getcwd(), ".data", "recordings")
+
+
+class UpstreamError(RuntimeError):
+    """数据源调用失败（包括回放时注入的错误与未录制的请求）"""
+
+
+class UpstreamUnavailable(UpstreamError):
+    """调用被限流或熔断拒绝，且没有可用的旧数据"""
+
+    def __init__(self, func: str, reason: str, retry_after: int):
+        super().__init__(f"{func} unavailable ({reason}), retry after {retry_after}s")
+        self.func = func
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def call_key(func: str, args: Tuple, kwargs: Dict) -> str:
+    """同一函数同一组参数得到稳定的录制键"""
+    payload = json.dumps({"f": func, "a": list(args), "k": kwargs}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DataProvider:
+    """数据源基类：子类实现 call()，属性访问 ak.xxx(...) 会转发为 call("xxx", ...)"""
+    name = "base"
+
+    def call(self, func: str, *args, **kwargs) -> Any:
+        raise NotImplementedError
+
+    def __getattr__(self, func: str):
+        if func.startswith("_"):
+            raise AttributeError(func)
+
+        def caller(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        caller.__name__ = func
+        return caller
+
+
+class LiveProvider(DataProvider):
+    """直连 akshare，首次调用时才导入 akshare"""
+    name = "live"
+
+    def __init__(self):
+        self._ak = None
+
+    def call(self, func: str, *args, **kwargs) -> Any:
+        if self._ak is None:
+            import akshare
+            self._ak = akshare
+        return getattr(self._ak, func)(*args, **kwargs)
+
+
+class RecordingProvider(DataProvider):
+    """透传到内层数据源，并把成功的返回值按 函数/参数哈希 写入磁盘"""
+    name = "record"
+
+    def __init__(self, inner: DataProvider, record_dir: str = DEFAULT_RECORD_DIR):
+        self.inner = inner
+        self.record_dir = record_dir
+        self._lock = threading.Lock()
+
+    def call(self, func: str, *args, **kwargs) -> Any:
+        result = self.inner.call(func, *args, **kwargs)
+        try:
+            self._save(func, args, kwargs, result)
+        except Exception as e:
+            logger.warning(f"Failed to record {func}: {e}")
+        return result
+
+    def _save(self, func: str, args: Tuple, kwargs: Dict, result: Any):
+        key = call_key(func, args, kwargs)
+        func_dir = os.path.join(self.record_dir, func)
+        os.makedirs(func_dir, exist_ok=True)
+        tmp_path = os.path.join(func_dir, f"{key}.pkl.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(func_dir, f"{key}.pkl"))
+        entry = {
+            "func": func,
+            "args": list(args),
+            "kwargs": kwargs,
+            "key": key,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._lock:
+            with open(os.path.join(self.record_dir, "index.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+class ReplayProvider(DataProvider):
+    """从录制目录回放，支持注入延迟和错误率"""
+    name = "replay"
+
+    def __init__(self, record_dir: str = DEFAULT_RECORD_DIR, latency_ms: Tuple[float, float] = (0.0, 0.0),
+                 error_rate: float = 0.0, fallback: bool = False, seed: Optional[int] = None):
+        self.record_dir = record_dir
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.fallback = fallback
+        self._rng = random.Random(seed)
+        self._cache: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def call(self, func: str, *args, **kwargs) -> Any:
+        low, high = self.latency_ms
+        if high > 0:
+            time.sleep(self._rng.uniform(low, high) / 1000.0)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise UpstreamError(f"Injected replay error for {func}")
+
+        path = os.path.join(self.record_dir, func, f"{call_key(func, args, kwargs)}.pkl")
+        if not os.path.exists(path):
+            path = self._fallback_path(func) if self.fallback else None
+            if not path:
+                raise UpstreamError(f"No recording for {func}({args}, {kwargs})")
+        return self._load(path)
+
+    def _fallback_path(self, func: str) -> Optional[str]:
+        func_dir = os.path.join(self.record_dir, func)
+        if not os.path.isdir(func_dir):
+            return None
+        files = sorted(f for f in os.listdir(func_dir) if f.endswith(".pkl"))
+        if not files:
+            return None
+        return os.path.join(func_dir, self._rng.choice(files))
+
+    def _load(self, path: str) -> Any:
+        with self._lock:
+            if path not in self._cache:
+                with open(path, "rb") as f:
+                    self._cache[path] = pickle.load(f)
+            result = self._cache[path]
+        # 调用方常会在返回的 DataFrame 上追加列，回放时交出副本
+        return result.copy() if hasattr(result, "copy") else result
+
+
+# 全市场快照、板块列表等接口一次返回几千行，上游限流最严
+DEFAULT_RATE_LIMITS = {
+    "default": (5.0, 10.0),
+    "stock_zh_a_spot_em": (1.0, 2.0),
+    "stock_info_a_code_name": (0.2, 1.0),
+    "stock_board_industry_name_em": (1.0, 2.0),
+    "stock_board_concept_name_em": (1.0, 2.0),
+    # 板块成分股每天拉一遍全部板块，限速以免挤占交互请求
+    "stock_board_industry_cons_em": (2.0, 2.0),
+    "stock_board_concept_cons_em": (2.0, 2.0),
+    "stock_hot_rank_em": (1.0, 2.0),
+    "stock_individual_fund_flow_rank": (0.2, 1.0),
+}
+
+
+def _parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        try:
+            func, spec = item.split("=", 1)
+            rate, _, burst = spec.partition(":")
+            limits[func.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            logger.warning(f"Invalid UPSTREAM_RATE_LIMITS entry: {item}")
+    return limits
+
+
+class _Guard:
+    __slots__ = ("bucket", "breaker")
+
+    def __init__(self, bucket: TokenBucket, breaker: CircuitBreaker):
+        self.bucket = bucket
+        self.breaker = breaker
+
+
+class GuardedProvider(DataProvider):
+    """按函数限流与熔断，失败时回退到最近一次成功的结果"""
+    name = "guarded"
+
+    def __init__(self, inner: DataProvider, rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 rate_wait: float = 2.0, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 stale_max_age: float = 86400.0, stale_max_entries: int = 256):
+        self.inner = inner
+        self.rate_limits = rate_limits or dict(DEFAULT_RATE_LIMITS)
+        self.rate_wait = rate_wait
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.stale_max_age = stale_max_age
+        self.stale_max_entries = stale_max_entries
+        self._guards: Dict[str, _Guard] = {}
+        # call_key -> (成功时间, 结果副本)，按最近使用淘汰
+        self._last_good: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _guard(self, func: str) -> _Guard:
+        with self._lock:
+            guard = self._guards.get(func)
+            if guard is None:
+                rate, burst = self.rate_limits.get(func, self.rate_limits["default"])
+                guard = self._guards[func] = _Guard(
+                    TokenBucket(rate, burst),
+                    CircuitBreaker(self.failure_threshold, self.reset_seconds),
+                )
+            return guard
+
+    def call(self, func: str, *args, **kwargs) -> Any:
+        guard = self._guard(func)
+        key = call_key(func, args, kwargs)
+        try:
+            if not guard.breaker.allow():
+                metrics.UPSTREAM_REJECTED.labels(func, "circuit_open").inc()
+                return self._stale_or_raise(func, key, "circuit_open", guard.breaker.retry_in())
+            if not guard.bucket.acquire(self.rate_wait):
+                # 没拿到令牌不算上游故障，但若这是半开状态的探测请求需要归还名额
+                guard.breaker.release_probe()
+                metrics.UPSTREAM_REJECTED.labels(func, "rate_limited").inc()
+                return self._stale_or_raise(func, key, "rate_limited", 1.0 / max(guard.bucket.rate, 1e-3))
+            try:
+                result = self.inner.call(func, *args, **kwargs)
+            except Exception as e:
+                guard.breaker.record_failure()
+                stale = self._stale(func, key, "error")
+                if stale is None:
+                    raise
+                logger.warning(f"{func} failed, serving stale data: {e}")
+                return stale
+            guard.breaker.record_success()
+            self._remember(key, result)
+            return result
+        finally:
+            metrics.UPSTREAM_BREAKER_STATE.labels(func).set(STATE_VALUES[guard.breaker.state])
+
+    def _remember(self, key: str, result: Any):
+        # 只保留能带上过期标记的结果（DataFrame/Series），调用方可能原地修改返回值，存副本
+        if not hasattr(result, "attrs") or not hasattr(result, "copy"):
+            return
+        with self._lock:
+            self._last_good[key] = (time.time(), result.copy())
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self.stale_max_entries:
+                self._last_good.popitem(last=False)
+
+    def _stale(self, func: str, key: str, reason: str) -> Any:
+        with self._lock:
+            entry = self._last_good.get(key)
+            if entry is not None:
+                self._last_good.move_to_end(key)
+        if entry is None:
+            return None
+        saved_at, value = entry
+        age = time.time() - saved_at
+        if age > self.stale_max_age:
+            return None
+        metrics.UPSTREAM_STALE_SERVED.labels(func).inc()
+        result = value.copy()
+        result.attrs["stale"] = {
+            "reason": reason,
+            "age_seconds": round(age, 1),
+            "as_of": cache_policy.market_time(saved_at).isoformat(timespec="seconds"),
+        }
+        return result
+
+    def _stale_or_raise(self, func: str, key: str, reason: str, retry_in: float) -> Any:
+        stale = self._stale(func, key, reason)
+        if stale is None:
+            raise UpstreamUnavailable(func, reason, max(1, int(retry_in + 0.999)))
+        return stale
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """各函数的熔断状态与剩余令牌，供健康检查接口使用"""
+        with self._lock:
+            guards = dict(self._guards)
+        return {
+            func: {
+                **guard.breaker.snapshot(),
+                "rate_per_second": guard.bucket.rate,
+                "burst": guard.bucket.burst,
+                "tokens": round(guard.bucket.tokens, 2),
+            }
+            for func, guard in sorted(guards.items())
+        }
+
+
+def staleness(result: Any) -> Optional[Dict]:
+    """返回 GuardedProvider 标注的过期信息；新鲜数据返回 None"""
+    attrs = getattr(result, "attrs", None)
+    return attrs.get("stale") if attrs else None
+
+
+def _parse_latency(value: str) -> Tuple[float, float]:
+    if not value:
+        return (0.0, 0.0)
+    if "-" in value:
+        low, high = value.split("-", 1)
+        return (float(low), float(high))
+    return (float(value), float(value))
+
+
+def _create_inner(kind: str) -> DataProvider:
+    record_dir = os.getenv("STOCK_DATA_RECORD_DIR", DEFAULT_RECORD_DIR)
+    if kind == "record":
+        return RecordingProvider(LiveProvider(), record_dir)
+    if kind == "replay":
+        return ReplayProvider(
+            record_dir,
+            latency_ms=_parse_latency(os.getenv("STOCK_REPLAY_LATENCY_MS", "")),
+            error_rate=float(os.getenv("STOCK_REPLAY_ERROR_RATE", "0") or 0),
+            fallback=os.getenv("STOCK_REPLAY_FALLBACK", "0") == "1",
+        )
+    if kind != "live":
+        logger.warning(f"Unknown STOCK_DATA_PROVIDER={kind}, using live")
+    return LiveProvider()
+
+
+def create_provider(kind: Optional[str] = None) -> DataProvider:
+    kind = (kind or os.getenv("STOCK_DATA_PROVIDER", "live")).lower()
+    inner = _create_inner(kind)
+    if os.getenv("UPSTREAM_GUARD", "1") == "0":
+        return inner
+    return GuardedProvider(
+        inner,
+        rate_limits=_parse_rate_limits(os.getenv("UPSTREAM_RATE_LIMITS", "")),
+        rate_wait=float(os.getenv("UPSTREAM_RATE_WAIT_SECONDS", "2")),
+        failure_threshold=int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5")),
+        reset_seconds=float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30")),
+        stale_max_age=float(os.getenv("UPSTREAM_STALE_MAX_AGE_SECONDS", "86400")),
+        stale_max_entries=int(os.getenv("UPSTREAM_STALE_MAX_ENTRIES", "256")),
+    )
+
+
+_provider: DataProvider = create_provider()
+
+
+def get_provider() -> DataProvider:
+    return _provider
+
+
+def upstream_health() -> Dict[str, Dict]:
+    """当前数据源各函数的熔断/限流状态；未启用 GuardedProvider 时为空"""
+    return _provider.snapshot() if isinstance(_provider, GuardedProvider) else {}
+
+
+def set_provider(provider: DataProvider):
+    """替换全局数据源（压测、离线工具使用）"""
+    global _provider
+    _provider = provider
+    logger.info(f"Data provider set to {provider.name}")
+
+
+class _ProviderProxy:
+    """模块级 `ak` 对象，始终转发到当前的全局数据源，并记录调用指标"""
+
+    def __getattr__(self, func: str):
+        target = getattr(_provider, func)
+
+        def caller(*args, **kwargs):
+            with metrics.observe_upstream(func), timing.span(f"ak.{func}"):
+                return target(*args, **kwargs)
+
+        caller.__name__ = func
+        return caller
+
+
+ak = _ProviderProxy()
+
+
+def record_symbols(symbols: List[str]):
+    """按各个 API 实际使用的参数调用一遍，生成可回放的录制文件"""
+    # 录制要拿到真实返回，不经过限流/旧数据回退
+    if not isinstance(_provider, RecordingProvider):
+        set_provider(RecordingProvider(LiveProvider(), os.getenv("STOCK_DATA_RECORD_DIR", DEFAULT_RECORD_DIR)))
+
+    calls = [
+        ("stock_info_a_code_name", {}),
+        ("stock_zh_a_spot_em", {}),
+        ("stock_hot_rank_em", {}),
+        ("stock_board_industry_name_em", {}),
+        ("stock_board_concept_name_em", {}),
+        ("stock_individual_fund_flow_rank", {"indicator": "今日"}),
+        # 交易日历：没有录制时回放会退回按周一至周五估计
+        ("tool_trade_date_hist_sina", {}),
+    ]
+    from kline_store import DEFAULT_START, sina_symbol
+
+    for symbol in symbols:
+        code = symbol[-6:]
+        calls += [
+            ("stock_individual_info_em", {"symbol": code}),
+            # 日K存储：不复权日K + 后复权因子表；qfq 是因子表不可用时的直接复权回退
+            ("stock_zh_a_hist", {"symbol": code, "period": "daily", "start_date": DEFAULT_START, "adjust": ""}),
+            ("stock_zh_a_daily", {"symbol": sina_symbol(code), "adjust": "hfq-factor"}),
+            ("stock_zh_a_hist", {"symbol": code, "period": "daily", "start_date": DEFAULT_START, "adjust": "qfq"}),
+            ("stock_zh_a_hist_min_em", {"symbol": code, "period": "1", "adjust": "qfq"}),
+            ("stock_bid_ask_em", {"symbol": code}),
+            ("stock_financial_abstract_ths", {"symbol": code, "indicator": "按年度"}),
+        ]
+    for func, kwargs in calls:
+        try:
+            getattr(ak, func)(**kwargs)
+            print(f"recorded {func} {kwargs}")
+        except Exception as e:
+            print(f"failed   {func} {kwargs}: {e}")
+
+    # 板块成分股：按录制到的板块列表逐个录制，供 sectors 本地聚合回放
+    import sectors
+    for kind in sectors.engines:
+        list_func, cons_func = sectors.KINDS[kind]
+        try:
+            names = getattr(ak, list_func)()["板块名称"].astype(str)
+        except Exception as e:
+            print(f"failed   {list_func}: {e}")
+            continue
+        for name in names:
+            try:
+                getattr(ak, cons_func)(symbol=name)
+                print(f"recorded {cons_func} {{'symbol': {name!r}}}")
+            except Exception as e:
+                print(f"failed   {cons_func} {{'symbol': {name!r}}}: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Record akshare responses for replay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="录制指定股票在各接口上的返回")
+    rec.add_argument("--symbols", required=True, help="逗号分隔的股票代码")
+    args = parser.parse_args()
+    if args.command == "record":
+        record_symbols([s.strip() for s in args.symbols.split(",") if s.strip()])
@@ -1,7 +1,13 @@
 import logging
-import akshare as ak
+from data_provider import ak
 import pandas as pd
-from agents import llm
+import time
+from typing import Optional
+import fundamentals
+import indicators
+import kline_store
+import timing
+from timing import span
 
 logger = logging.getLogger(__name__)
 
@@ -13,40 +19,11 @@ def calculate_technical_indicators(df: pd.DataFrame) -> dict:
         if df.empty or len(df) < 30:
             return {}
 
-        # 1. MA (Moving Average)
-        df['MA5'] = df['收盘'].rolling(window=5).mean()
-        df['MA10'] = df['收盘'].rolling(window=10).mean()
-        df['MA20'] = df['收盘'].rolling(window=20).mean()
-        
-        # 2. MACD
-        # EMA12
-        df['EMA12'] = df['收盘'].ewm(span=12, adjust=False).mean()
-        # EMA26
-        df['EMA26'] = df['收盘'].ewm(span=26, adjust=False).mean()
-        # DIF
-        df['DIF'] = df['EMA12'] - df['EMA26']
-        # DEA
-        df['DEA'] = df['DIF'].ewm(span=9, adjust=False).mean()
-        # MACD
-        df['MACD'] = 2 * (df['DIF'] - df['DEA'])
-        
-        # 3. KDJ (Simplified)
-        low_list = df['最低'].rolling(window=9, min_periods=9).min()
-        high_list = df['最高'].rolling(window=9, min_periods=9).max()
-        rsv = (df['收盘'] - low_list) / (high_list - low_list) * 100
-        df['K'] = rsv.ewm(com=2, adjust=False).mean()
-        df['D'] = df['K'].ewm(com=2, adjust=False).mean()
-        df['J'] = 3 * df['K'] - 2 * df['D']
-
-        # 4. RSI (Relative Strength Index) - 6 days
-        delta = df['收盘'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=6).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=6).mean()
-        rs = gain / loss
-        df['RSI6'] = 100 - (100 / (1 + rs))
-
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
+        # MA / MACD / KDJ / RSI6 由指标注册表按依赖求值，不在 df 上追加列
+        values = indicators.evaluate(df, ["MA5", "MA10", "MA20", "MACD", "KDJ", "RSI6"])
+        latest = {name: series.iloc[-1] for name, series in values.items()}
+        prev = {name: series.iloc[-2] for name, series in values.items()}
+        latest['收盘'] = df['收盘'].iloc[-1]
 
         signals = {
             "ma_trend": "Bullish" if latest['MA5'] > latest['MA10'] > latest['MA20'] else "Bearish" if latest['MA5'] < latest['MA10'] < latest['MA20'] else "Neutral",
@@ -94,48 +71,68 @@ def calculate_technical_indicators(df: pd.DataFrame) -> dict:
         logger.error(f"Error calculating indicators: {e}")
         return {}
 
-def generate_analysis_report(symbol: str) -> str:
+def fetch_report_data(symbol: str) -> dict:
     """
-    Directly generates an analysis report without using CrewAI's complex agent loop.
-    This is more robust against network timeouts and complexity issues.
+    拉取直接分析所需的行情数据 (基本信息、日K、财务摘要)，单项失败时保留占位文本。
     """
     code = symbol[-6:]
-    logger.info(f"Starting direct analysis for {symbol} ({code})")
 
-    # 1. Fetch Data
-    info_str = "无法获取基本信息"
-    hist_str = "无法获取历史行情"
-    fin_str = "无法获取详细财务数据"
-    quant_data = {}
+    data = {
+        "info_str": "无法获取基本信息",
+        "hist_str": "无法获取历史行情",
+        "fin_str": "无法获取详细财务数据",
+        "hist_df": None,
+    }
 
     try:
         # 1.1 Info
-        info_df = ak.stock_individual_info_em(symbol=code)
-        info_str = info_df.to_string()
+        with span("info"):
+            info_df = ak.stock_individual_info_em(symbol=code)
+            data["info_str"] = info_df.to_string()
     except Exception as e:
         logger.error(f"Failed to fetch info: {e}")
 
     try:
         # 1.2 History (Last 60 days for calculation, show last 15 in prompt)
-        hist_df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date="20230101", adjust="qfq")
-        
-        # Calculate Quantitative Indicators
-        quant_data = calculate_technical_indicators(hist_df)
-        
-        hist_str = hist_df.tail(15).to_string()
+        with span("history"):
+            hist_df = kline_store.daily_bars(code, adjust="qfq", start_date="20230101")
+        data["hist_df"] = hist_df
+        data["hist_str"] = hist_df.tail(15).to_string()
     except Exception as e:
         logger.error(f"Failed to fetch history: {e}")
 
     try:
         # 1.3 Financials (Abstract) - Try a robust interface or skip if complex
         # Using a simple indicator if possible, or skip to save time/errors
-        fin_df = ak.stock_financial_abstract_ths(symbol=code, indicator="按年度")
-        fin_str = fin_df.tail(3).to_string()
+        with span("financials"):
+            fin_df = fundamentals.get_financial_abstract(code)
+            data["fin_str"] = fin_df.tail(3).to_string()
     except Exception as e:
         # Try fallback
         logger.warning(f"Failed to fetch financials, skipping: {e}")
 
-    # 2. Construct Prompt
+    return data
+
+def compute_report_indicators(data: dict) -> dict:
+    """基于 fetch_report_data 的日K计算量化指标"""
+    hist_df = data.get("hist_df")
+    if hist_df is None:
+        return {}
+    with span("indicators"):
+        return calculate_technical_indicators(hist_df)
+
+def require_market_data(data: dict, quant_data: dict):
+    """日K拉取失败或不足以计算指标时抛出 ValueError；这种情况下 prompt 只有占位文本，不应据此生成报告"""
+    if data.get("hist_df") is None:
+        raise ValueError("failed to fetch daily history")
+    if not quant_data:
+        raise ValueError(f"not enough daily history to compute indicators ({len(data['hist_df'])} bars)")
+
+def build_report_prompt(symbol: str, data: dict, quant_data: dict) -> str:
+    info_str = data["info_str"]
+    hist_str = data["hist_str"]
+    fin_str = data["fin_str"]
+
     quant_section = ""
     if quant_data:
         quant_section = f"""
@@ -183,11 +180,58 @@ def generate_analysis_report(symbol: str) -> str:
 请用专业的金融术语，但保持通俗易懂。字数在 600 字左右。重点在于量化数据的解读和具体的买卖点位推荐。
 """
 
-    # 3. Call LLM
+    return prompt
+
+def invoke_report_llm(prompt: str) -> str:
+    # LLM 客户端依赖导入较慢，首次生成报告时才加载
+    from llm_client import get_llm
+    from llm_gateway import INTERACTIVE, priority
     try:
         logger.info("Sending prompt to LLM...")
-        response = llm.invoke(prompt)
+        with span("llm"), priority(INTERACTIVE):
+            response = get_llm().invoke(prompt)
         return response.content
     except Exception as e:
         logger.error(f"LLM call failed: {e}")
         return f"分析生成失败，原因：{str(e)}。请稍后重试。"
+
+async def acall_report_llm(prompt: str, level: Optional[int] = None) -> str:
+    """异步调用 LLM 生成报告，失败时抛出异常；level 缺省为交互优先级"""
+    from llm_client import aget_llm
+    from llm_gateway import INTERACTIVE, priority
+    llm = await aget_llm()
+    with priority(INTERACTIVE if level is None else level):
+        response = await llm.ainvoke(prompt)
+    return response.content
+
+async def ainvoke_report_llm(prompt: str) -> str:
+    """异步版本：等待 LLM 时不占用线程，请求以交互优先级进入网关"""
+    started = time.perf_counter()
+    try:
+        logger.info("Sending prompt to LLM...")
+        return await acall_report_llm(prompt)
+    except Exception as e:
+        logger.error(f"LLM call failed: {e}")
+        return f"分析生成失败，原因：{str(e)}。请稍后重试。"
+    finally:
+        # span() 按线程记录采样对象，不适合在事件循环线程上使用，这里直接累计耗时
+        timer = timing.current()
+        if timer is not None:
+            timer.add("llm", (time.perf_counter() - started) * 1000)
+
+def generate_analysis_report(symbol: str) -> str:
+    """
+    Directly generates an analysis report without using CrewAI's complex agent loop.
+    This is more robust against network timeouts and complexity issues.
+    """
+    logger.info(f"Starting direct analysis for {symbol} ({symbol[-6:]})")
+
+    # 1. Fetch Data
+    data = fetch_report_data(symbol)
+    quant_data = compute_report_indicators(data)
+
+    # 2. Construct Prompt
+    prompt = build_report_prompt(symbol, data, quant_data)
+
+    # 3. Call LLM
+    return invoke_report_llm(prompt)
@@ -0,0 +1,130 @@
+"""
+按上游类型隔离的线程池 (bulkhead)
+
+所有路由都是 async，阻塞调用按类型放到各自容量有限的线程池里执行：
+- market   akshare 行情/资料接口
+- llm      CrewAI（直接分析的 LLM 调用经由 llm_gateway 异步执行，不占用线程）
+- compute  指标计算、搜索、序列化等本地 CPU 工作
+
+每个池子有 工作线程数 + 排队上限，超过上限立即抛出 BulkheadFull，
+由 app.py 转换为 429/503 并带上 Retry-After，而不是让请求无限堆积。
+容量通过环境变量 BULKHEAD_<NAME>_WORKERS / BULKHEAD_<NAME>_QUEUE 调整。
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BULKHEAD_PENDING = metrics.gauge("bulkhead_pending", "Tasks running or queued per bulkhead", ["bulkhead"])
+BULKHEAD_REJECTED = metrics.counter("bulkhead_rejected_total", "Tasks rejected because the bulkhead was full", ["bulkhead"])
+BULKHEAD_WAIT = metrics.histogram("bulkhead_queue_wait_seconds", "Time tasks spend queued before a worker picks them up", ["bulkhead"])
+
+
+class BulkheadFull(Exception):
+    def __init__(self, name: str, status_code: int, retry_after: int):
+        super().__init__(f"{name} capacity exhausted, retry after {retry_after}s")
+        self.name = name
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_workers: int, max_queue: int, status_code: int = 503):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.status_code = status_code
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"bulkhead-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+        # 任务平均执行时间的指数移动平均，用于估算 Retry-After
+        self._avg_seconds = 1.0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def retry_after(self) -> int:
+        waves = max(1, math.ceil(self._pending / self.max_workers))
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                BULKHEAD_REJECTED.labels(self.name).inc()
+                raise BulkheadFull(self.name, self.status_code, self.retry_after())
+            self._pending += 1
+        BULKHEAD_PENDING.labels(self.name).inc()
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+        BULKHEAD_PENDING.labels(self.name).dec()
+
+    def _timed(self, fn: Callable, submitted: float, *args, **kwargs):
+        started = time.perf_counter()
+        BULKHEAD_WAIT.labels(self.name).observe(started - submitted)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """在本池中执行阻塞函数；池满时立即抛出 BulkheadFull"""
+        self._acquire()
+        # 复制上下文，让 timing.span 等基于 contextvar 的逻辑在工作线程里继续生效
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, self._timed, fn, time.perf_counter(), *args, **kwargs)
+        try:
+            future = self._executor.submit(call)
+        except Exception:
+            self._release()
+            raise
+        # 客户端断开导致协程被取消时，线程仍在执行，计数以任务真正结束为准
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "avg_seconds": round(self._avg_seconds, 3),
+        }
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using {default}")
+        return default
+
+
+def _create(name: str, workers: int, queue: int, status_code: int) -> Bulkhead:
+    key = name.upper()
+    return Bulkhead(
+        name,
+        max_workers=_env_int(f"BULKHEAD_{key}_WORKERS", workers),
+        max_queue=_env_int(f"BULKHEAD_{key}_QUEUE", queue),
+        status_code=status_code,
+    )
+
+
+market = _create("market", workers=16, queue=64, status_code=503)
+# LLM 调用昂贵且慢，排队满时提示客户端稍后重试
+llm = _create("llm", workers=4, queue=16, status_code=429)
+compute = _create("compute", workers=max(2, os.cpu_count() or 2), queue=64, status_code=503)
+
+BULKHEADS = {b.name: b for b in (market, llm, compute)}
@@ -0,0 +1,119 @@
+"""
+全市场资金流向快照 (Fund Flow)
+
+原来每次 /api/realtime、/api/trade-signal 都要为单只股票下载 stock_individual_fund_flow
+的全部历史再取最后一行。这里改为由共享快照的 leader 进程按 FUND_FLOW_TTL（默认 60 秒）
+拉取一次全市场排行 stock_individual_fund_flow_rank(今日)，按代码排序写入共享内存段，
+各 worker 的单股查询只是一次内存二分查找。
+
+leader 每次刷新时把当日数据写入 .data/fund_flow/<YYYYMMDD>.pkl：当天的分区随刷新覆盖，
+收盘后停留在最终值，以前的分区不再改写，history() 按日拼出单只股票的资金流序列。
+"""
+import datetime
+import functools
+import logging
+import os
+import pickle
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import cache_policy
+import shared_snapshot
+from shared_snapshot import Column, SharedSnapshot
+
+logger = logging.getLogger(__name__)
+
+FLOW_DIR = os.path.join(os.getcwd(), ".data", "fund_flow")
+SESSION_OPEN = datetime.time(9, 30)
+
+# 散户资金按小单统计
+FLOW_NUMERIC = {
+    "main_net_inflow": "今日主力净流入-净额",
+    "main_net_inflow_pct": "今日主力净流入-净占比",
+    "super_large_net_inflow": "今日超大单净流入-净额",
+    "large_net_inflow": "今日大单净流入-净额",
+    "medium_net_inflow": "今日中单净流入-净额",
+    "retail_net_inflow": "今日小单净流入-净额",
+    "retail_net_inflow_pct": "今日小单净流入-净占比",
+}
+
+
+def build_flow_columns() -> Dict[str, Column]:
+    """stock_individual_fund_flow_rank -> 按代码排序的列，并写入当日分区"""
+    import pandas as pd
+    from data_provider import UpstreamError, ak, staleness
+
+    df = ak.stock_individual_fund_flow_rank(indicator="今日")
+    if staleness(df):
+        raise UpstreamError("fund flow snapshot upstream returned stale data")
+    df = df.assign(代码=df["代码"].astype(str).str.zfill(6)).sort_values("代码")
+    columns: Dict[str, Column] = {"code": df["代码"].to_numpy().astype("S6")}
+    for field, source in FLOW_NUMERIC.items():
+        if source in df.columns:
+            columns[field] = pd.to_numeric(df[source], errors="coerce").fillna(0).to_numpy(dtype="<f8")
+        else:
+            columns[field] = np.zeros(len(df), dtype="<f8")
+    try:
+        _write_partition(columns)
+    except Exception as e:
+        logger.warning(f"Failed to persist fund flow partition: {e}")
+    return columns
+
+
+def _write_partition(columns: Dict[str, Column], now: Optional[datetime.datetime] = None):
+    """只在交易日开盘后写当日分区；开盘前的排行仍是上一交易日的数据，已在上一次写入"""
+    import pandas as pd
+
+    now = now or cache_policy.market_now()
+    if not cache_policy.calendar.is_trading_day(now.date()) or now.time() < SESSION_OPEN:
+        return
+    frame = pd.DataFrame({name: values for name, values in columns.items() if name != "code"})
+    frame.insert(0, "code", columns["code"].astype(str))
+    os.makedirs(FLOW_DIR, exist_ok=True)
+    path = os.path.join(FLOW_DIR, f"{now:%Y%m%d}.pkl")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=64)
+def _load_partition(path: str, mtime: float):
+    with open(path, "rb") as f:
+        return pickle.load(f).set_index("code")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+snapshot = SharedSnapshot("fund_flow", build_flow_columns, ttl=_env_float("FUND_FLOW_TTL", 60.0), policy="fund_flow")
+
+
+def flow_row(code: str, wait: float = 5.0) -> Optional[Dict]:
+    """单只股票的当日资金流向，快照不可用或代码不存在时返回 None"""
+    return shared_snapshot.lookup_row(snapshot, code, wait)
+
+
+def history(code: str, days: int = 20) -> List[Dict]:
+    """按交易日从旧到新返回单只股票最近 days 个分区中的资金流向"""
+    code = code[-6:]
+    try:
+        names = sorted(n for n in os.listdir(FLOW_DIR) if n.endswith(".pkl"))[-days:]
+    except FileNotFoundError:
+        return []
+    rows = []
+    for name in names:
+        path = os.path.join(FLOW_DIR, name)
+        try:
+            frame = _load_partition(path, os.path.getmtime(path))
+        except Exception as e:
+            logger.warning(f"Failed to read fund flow partition {name}: {e}")
+            continue
+        if code in frame.index:
+            rows.append({"date": name[:-4], **frame.loc[code].to_dict()})
+    return rows
@@ -0,0 +1,176 @@
+"""
+财务摘要缓存 (Fundamentals)
+
+stock_financial_abstract_ths(按年度) 一年只在年报披露时变化一次，却在每次直接分析和
+CrewAI 的 Get Stock Financials 工具里都要拉取。这里按 股票代码 + 最新报告期 持久化到
+.data/fundamentals/<code>.pkl，并按披露节奏决定何时回源：
+
+- 已包含上一年度年报：数据已是最新，只按 FUNDAMENTALS_MAX_AGE_DAYS（默认 90 天）低频校验，兜住更正公告；
+- 尚缺上一年度年报且处于披露窗口（默认 1-4 月）：每 FUNDAMENTALS_WINDOW_TTL（默认 1 天）校验一次；
+- 尚缺且不在窗口内（晚披露/停牌等）：每 FUNDAMENTALS_OFF_WINDOW_TTL（默认 7 天）校验一次。
+
+需要校验时先返回已有数据，在后台线程回源 (stale-while-revalidate)，请求路径上只有
+首次见到某只股票时才会同步拉取。多个 worker 共用同一目录，后台校验前先重读磁盘，
+其它进程刚校验过就直接采用。
+"""
+import datetime
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import cache_policy
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FUNDAMENTALS_DIR = os.path.join(os.getcwd(), ".data", "fundamentals")
+INDICATOR = "按年度"
+PERIOD_COLUMN = "报告期"
+
+REVALIDATIONS = metrics.counter("fundamentals_revalidations_total", "Fundamentals revalidations by outcome", ["outcome"])
+
+
+def _parse_months(raw: str):
+    return {int(m) for m in raw.split(",") if m.strip()}
+
+
+def latest_period(df) -> Optional[str]:
+    """财务摘要中最新的报告期（按年度时为年份）"""
+    if df is None or df.empty or PERIOD_COLUMN not in df.columns:
+        return None
+    return str(max(df[PERIOD_COLUMN].astype(str)))
+
+
+class FundamentalsCache:
+    def __init__(self, directory: str = FUNDAMENTALS_DIR, window_months=(1, 2, 3, 4),
+                 window_ttl: float = 86400.0, off_window_ttl: float = 7 * 86400.0,
+                 max_age: float = 90 * 86400.0, retry_seconds: float = 600.0):
+        self.directory = directory
+        self.window_months = set(window_months)
+        self.window_ttl = window_ttl
+        self.off_window_ttl = off_window_ttl
+        self.max_age = max_age
+        self.retry_seconds = retry_seconds
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._last_attempt: Dict[str, float] = {}
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="fundamentals")
+
+    # --- 存储 ---
+    def _path(self, code: str) -> str:
+        return os.path.join(self.directory, f"{code}.pkl")
+
+    def _read(self, code: str) -> Optional[Dict]:
+        try:
+            with open(self._path(code), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read fundamentals for {code}: {e}")
+            return None
+
+    def _write(self, code: str, entry: Dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(code)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    # --- 校验策略 ---
+    def ttl(self, entry: Dict, today: Optional[datetime.date] = None) -> float:
+        today = today or cache_policy.market_today()
+        period = entry.get("period")
+        if period is not None and period[:4].isdigit() and int(period[:4]) >= today.year - 1:
+            return self.max_age
+        return self.window_ttl if today.month in self.window_months else self.off_window_ttl
+
+    def needs_revalidation(self, entry: Dict, now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        return now - entry["checked_at"] >= self.ttl(entry)
+
+    # --- 读取 ---
+    def get(self, symbol: str):
+        """返回财务摘要 DataFrame；已有数据需要校验时在后台回源，先返回旧数据"""
+        code = symbol[-6:]
+        with self._lock:
+            entry = self._entries.get(code)
+        if entry is None:
+            entry = self._read(code)
+            if entry is not None:
+                with self._lock:
+                    self._entries[code] = entry
+        if entry is None:
+            metrics.cache_miss("fundamentals")
+            return self._fetch(code)["df"]
+
+        metrics.cache_hit("fundamentals")
+        if self.needs_revalidation(entry):
+            self._schedule(code)
+        return entry["df"]
+
+    def _fetch(self, code: str, previous: Optional[Dict] = None) -> Dict:
+        from data_provider import ak, staleness
+        df = ak.stock_financial_abstract_ths(symbol=code, indicator=INDICATOR)
+        period = latest_period(df)
+        if staleness(df) is not None:
+            # 上游保护返回的旧数据：可以先用，但不算一次成功的校验
+            REVALIDATIONS.labels("stale").inc()
+            return previous or {"code": code, "period": period, "df": df, "checked_at": 0.0}
+        if previous is not None and previous.get("period") == period and len(previous["df"]) == len(df):
+            outcome = "unchanged"
+        else:
+            outcome = "updated" if previous is not None else "fetched"
+        entry = {"code": code, "period": period, "df": df, "checked_at": time.time()}
+        self._write(code, entry)
+        with self._lock:
+            self._entries[code] = entry
+        REVALIDATIONS.labels(outcome).inc()
+        if outcome == "updated":
+            logger.info(f"Fundamentals for {code} updated: period {previous.get('period')} -> {period}")
+        return entry
+
+    def _schedule(self, code: str):
+        now = time.monotonic()
+        with self._lock:
+            if code in self._inflight or now - self._last_attempt.get(code, -self.retry_seconds) < self.retry_seconds:
+                return
+            self._inflight.add(code)
+            self._last_attempt[code] = now
+        self._pool.submit(self._revalidate, code)
+
+    def _revalidate(self, code: str):
+        try:
+            on_disk = self._read(code)
+            if on_disk is not None and not self.needs_revalidation(on_disk):
+                # 其它 worker 刚校验过
+                with self._lock:
+                    self._entries[code] = on_disk
+                return
+            with self._lock:
+                previous = self._entries.get(code)
+            self._fetch(code, previous=previous)
+        except Exception as e:
+            REVALIDATIONS.labels("error").inc()
+            logger.warning(f"Fundamentals revalidation failed for {code}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(code)
+
+
+cache = FundamentalsCache(
+    window_months=_parse_months(os.getenv("FUNDAMENTALS_WINDOW_MONTHS", "1,2,3,4")),
+    window_ttl=float(os.getenv("FUNDAMENTALS_WINDOW_TTL", "86400")),
+    off_window_ttl=float(os.getenv("FUNDAMENTALS_OFF_WINDOW_TTL", str(7 * 86400))),
+    max_age=float(os.getenv("FUNDAMENTALS_MAX_AGE_DAYS", "90")) * 86400,
+)
+
+
+def get_financial_abstract(symbol: str):
+    return cache.get(symbol)
@@ -0,0 +1,101 @@
+"""
+启动导入耗时预算
+
+在子进程中以 `python -X importtime` 导入目标模块（默认 app），按顶层包汇总自身耗时，
+并检查不应在启动时加载的重依赖（CrewAI / LangChain / openai / akshare）：
+
+    python import_budget.py
+    python import_budget.py --budget-ms 800 --top 20
+    python import_budget.py --module realtime_trade --allow pandas
+
+总耗时超过 --budget-ms 或加载了禁止的包时以非零状态退出，可放进 CI。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 只在 agent 模式 / 真实取数时才需要的包
+FORBIDDEN = ["crewai", "langchain_openai", "langchain_core", "langchain", "openai", "akshare"]
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """返回 (子进程总耗时毫秒, [(模块名, 自身微秒, 累计微秒)])"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"import {module} failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return wall_ms, rows
+
+
+def summarize(rows: List[Tuple[str, int, int]]) -> Dict[str, Dict]:
+    """按顶层包汇总自身耗时"""
+    packages: Dict[str, Dict] = defaultdict(lambda: {"self_ms": 0.0, "modules": 0})
+    for name, self_us, _ in rows:
+        pkg = packages[name.split(".")[0]]
+        pkg["self_ms"] += self_us / 1000
+        pkg["modules"] += 1
+    return dict(packages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import-time budget of the API module")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="导入总耗时上限（毫秒）")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--allow", default="", help="逗号分隔，从禁止列表中放行的包")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    wall_ms, rows = measure(args.module)
+    packages = summarize(rows)
+    import_ms = sum(p["self_ms"] for p in packages.values())
+    allowed = {p.strip() for p in args.allow.split(",") if p.strip()}
+    loaded_forbidden = sorted(p for p in FORBIDDEN if p in packages and p not in allowed)
+    ranked = sorted(packages.items(), key=lambda item: item[1]["self_ms"], reverse=True)[:args.top]
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "import_ms": round(import_ms, 1),
+            "process_ms": round(wall_ms, 1),
+            "budget_ms": args.budget_ms,
+            "forbidden_loaded": loaded_forbidden,
+            "top": {name: {"self_ms": round(p["self_ms"], 1), "modules": p["modules"]} for name, p in ranked},
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(f"import {args.module}: {import_ms:.1f} ms in imports, {wall_ms:.1f} ms process total "
+              f"(budget {args.budget_ms:.0f} ms)")
+        print(f"\n{'package':<28}{'self ms':>10}{'modules':>10}")
+        for name, p in ranked:
+            print(f"{name:<28}{p['self_ms']:>10.1f}{p['modules']:>10}")
+        if loaded_forbidden:
+            print(f"\nLoaded at import time but should be lazy: {', '.join(loaded_forbidden)}")
+
+    if import_ms > args.budget_ms or loaded_forbidden:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+技术指标注册表 (Indicators)
+
+每个指标声明自己依赖的序列（行情基础列或其它指标的输出）与产出的序列，请求一组指标时按依赖
+关系拓扑排序求值，共享的中间结果（EMA、收盘价差分、20 日均线等）只计算一次，
+没有被请求、也不被依赖的指标不计算。
+
+    values = evaluate(df, ["MACD", "BOLL"])     # {序列名: Series}，含中间结果
+    groups = compute(df, ["MACD", "BOLL"])      # {指标名: {序列名: Series}}
+
+df 为 akshare 日K/分钟K（开盘/收盘/最高/最低/成交量 列）。新增指标只需用 @register 声明。
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+BASE_COLUMNS = {"open": "开盘", "close": "收盘", "high": "最高", "low": "最低", "volume": "成交量"}
+
+
+@dataclass(frozen=True)
+class Indicator:
+    name: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    fn: Callable[..., object]
+    public: bool = True
+    description: str = ""
+
+
+REGISTRY: Dict[str, Indicator] = {}
+_PRODUCERS: Dict[str, str] = {}
+
+
+def register(name: str, inputs: Sequence[str], outputs: Sequence[str] = None, public: bool = True,
+             description: str = ""):
+    """注册指标；fn 以输入序列为关键字参数，单输出返回 Series，多输出返回 {序列名: Series}"""
+    outputs = tuple(outputs or (name,))
+
+    def decorator(fn):
+        for output in outputs:
+            if output in _PRODUCERS or output in BASE_COLUMNS:
+                raise ValueError(f"Series {output} is already produced by {_PRODUCERS.get(output, 'base data')}")
+            _PRODUCERS[output] = name
+        REGISTRY[name] = Indicator(name, tuple(inputs), outputs, fn, public, description)
+        return fn
+    return decorator
+
+
+def available() -> List[Dict]:
+    return [
+        {"name": i.name, "inputs": list(i.inputs), "outputs": list(i.outputs), "description": i.description}
+        for i in REGISTRY.values() if i.public
+    ]
+
+
+def plan(names: Iterable[str]) -> List[Indicator]:
+    """请求的指标及其全部依赖，按拓扑顺序排列"""
+    order: List[Indicator] = []
+    state: Dict[str, str] = {}
+
+    def visit(name: str, path: Tuple[str, ...]):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Indicator dependency cycle: {' -> '.join(path + (name,))}")
+        if name not in REGISTRY:
+            raise KeyError(name)
+        state[name] = "visiting"
+        for series in REGISTRY[name].inputs:
+            if series not in BASE_COLUMNS:
+                visit(_PRODUCERS[series], path + (name,))
+        state[name] = "done"
+        order.append(REGISTRY[name])
+
+    for name in names:
+        visit(name, ())
+    return order
+
+
+def evaluate(df: pd.DataFrame, names: Iterable[str]) -> Dict[str, pd.Series]:
+    """按依赖顺序计算，返回所有已计算的序列（不修改 df）"""
+    values: Dict[str, pd.Series] = {}
+    for indicator in plan(names):
+        kwargs = {}
+        for series in indicator.inputs:
+            if series not in values:
+                values[series] = df[BASE_COLUMNS[series]]
+            kwargs[series] = values[series]
+        result = indicator.fn(**kwargs)
+        if isinstance(result, dict):
+            values.update(result)
+        else:
+            values[indicator.outputs[0]] = result
+    return values
+
+
+def compute(df: pd.DataFrame, names: Sequence[str]) -> Dict[str, Dict[str, pd.Series]]:
+    values = evaluate(df, names)
+    return {name: {series: values[series] for series in REGISTRY[name].outputs} for name in names}
+
+
+# --- 指标定义 ---
+
+def _moving_average(window: int):
+    def fn(close):
+        return close.rolling(window=window).mean()
+    return fn
+
+
+for _window in (5, 10, 20, 60):
+    register(f"MA{_window}", ["close"], description=f"{_window} 日均线")(_moving_average(_window))
+
+
+@register("EMA12", ["close"], public=False)
+def _ema12(close):
+    return close.ewm(span=12, adjust=False).mean()
+
+
+@register("EMA26", ["close"], public=False)
+def _ema26(close):
+    return close.ewm(span=26, adjust=False).mean()
+
+
+@register("MACD", ["EMA12", "EMA26"], outputs=["DIF", "DEA", "MACD"], description="MACD (12, 26, 9)")
+def _macd(EMA12, EMA26):
+    dif = EMA12 - EMA26
+    dea = dif.ewm(span=9, adjust=False).mean()
+    return {"DIF": dif, "DEA": dea, "MACD": 2 * (dif - dea)}
+
+
+@register("RSV", ["close", "high", "low"], public=False)
+def _rsv(close, high, low):
+    low_list = low.rolling(window=9, min_periods=9).min()
+    high_list = high.rolling(window=9, min_periods=9).max()
+    return (close - low_list) / (high_list - low_list) * 100
+
+
+@register("KDJ", ["RSV"], outputs=["K", "D", "J"], description="KDJ (9, 3, 3)")
+def _kdj(RSV):
+    k = RSV.ewm(com=2, adjust=False).mean()
+    d = k.ewm(com=2, adjust=False).mean()
+    return {"K": k, "D": d, "J": 3 * k - 2 * d}
+
+
+@register("DELTA", ["close"], public=False)
+def _delta(close):
+    return close.diff()
+
+
+def _rsi(window: int):
+    def fn(DELTA):
+        gain = (DELTA.where(DELTA > 0, 0)).rolling(window=window).mean()
+        loss = (-DELTA.where(DELTA < 0, 0)).rolling(window=window).mean()
+        return 100 - (100 / (1 + gain / loss))
+    return fn
+
+
+for _window in (6, 14):
+    register(f"RSI{_window}", ["DELTA"], description=f"{_window} 日 RSI")(_rsi(_window))
+
+
+@register("STD20", ["close"], public=False)
+def _std20(close):
+    return close.rolling(window=20).std()
+
+
+@register("BOLL", ["MA20", "STD20"], outputs=["UPPER", "MID", "LOWER"], description="布林带 (20, 2)")
+def _boll(MA20, STD20):
+    return {"UPPER": MA20 + 2 * STD20, "MID": MA20, "LOWER": MA20 - 2 * STD20}
+
+
+@register("OBV", ["DELTA", "volume"], description="能量潮")
+def _obv(DELTA, volume):
+    return (np.sign(DELTA) * volume).fillna(0).cumsum()
@@ -0,0 +1,272 @@
+"""
+日K存储与复权 (Kline Store)
+
+/api/kline、实时信号、直接分析等处原先各自按 adjust=qfq/hfq/"" 拉取完整日K，每种复权方式都是
+一次完整下载；一次除权除息又会让所有前复权历史失效。这里每只股票只保存一份不复权日K和
+一张后复权因子表（新浪 stock_zh_a_daily(adjust="hfq-factor")，每次除权一行），
+持久化到 .data/kline/<code>.pkl，读取时按日期查因子、向量化相乘：
+
+- hfq：价格 × 当日后复权因子
+- qfq：价格 × 当日后复权因子 / 最新后复权因子
+- ""：原样返回
+
+日K按 cache_policy 的 "daily" 策略过期（交易时段内 KLINE_BARS_TTL，默认 300 秒；收盘定型后
+保持到下一交易日开盘），过期后只增量拉取最后一根及之后的K线；因子表按
+KLINE_FACTORS_TTL（默认 12 小时）校验，增量K线中出现除权缺口（涨跌幅与不复权收盘价
+变化对不上）时立即重拉因子表。除权只新增一行因子，已存的不复权K线无需重下。
+回源失败时返回已存数据，并按上游保护的约定在 attrs["stale"] 标注。
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import cache_policy
+import metrics
+
+logger = logging.getLogger(__name__)
+
+KLINE_DIR = os.path.join(os.getcwd(), ".data", "kline")
+ADJUSTS = ("", "qfq", "hfq")
+PRICE_COLUMNS = ["开盘", "收盘", "最高", "最低"]
+DEFAULT_START = "20230101"
+# 涨跌幅与不复权收盘价变化相差超过该值（百分点）视为除权日
+EX_RIGHTS_GAP = 0.5
+
+REFRESHES = metrics.counter("kline_store_refreshes_total", "Kline store upstream refreshes by kind and outcome",
+                            ["kind", "outcome"])
+
+
+def sina_symbol(code: str) -> str:
+    """新浪接口的带交易所前缀代码"""
+    # 北交所新代码 920xxx 与沪市 9 开头的 B 股区分开
+    if code.startswith(("4", "8", "92")):
+        return f"bj{code}"
+    if code.startswith(("6", "9")):
+        return f"sh{code}"
+    return f"sz{code}"
+
+
+def factor_table(df: pd.DataFrame) -> pd.DataFrame:
+    """hfq-factor 结果 -> 按除权日升序的 (date, hfq_factor)"""
+    table = pd.DataFrame({
+        "date": pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]"),
+        "hfq_factor": df["hfq_factor"].to_numpy(dtype=float),
+    })
+    return table.sort_values("date", ignore_index=True)
+
+
+def adjustment(dates, factors: pd.DataFrame, adjust: str) -> np.ndarray:
+    """每根K线对应的复权乘数"""
+    dates = pd.to_datetime(dates).to_numpy().astype("datetime64[D]")
+    if adjust not in ("qfq", "hfq") or factors is None or factors.empty:
+        return np.ones(len(dates))
+    ex_dates = factors["date"].to_numpy()
+    hfq = factors["hfq_factor"].to_numpy()
+    idx = np.searchsorted(ex_dates, dates, side="right") - 1
+    # 首个除权日之前按因子 1 计
+    multiplier = np.where(idx >= 0, hfq[np.maximum(idx, 0)], 1.0)
+    if adjust == "qfq":
+        multiplier = multiplier / hfq[-1]
+    return multiplier
+
+
+def apply_adjustment(raw: pd.DataFrame, factors: pd.DataFrame, adjust: str) -> pd.DataFrame:
+    """不复权日K -> 指定复权方式；涨跌幅、振幅是比例，各复权方式下相同，只缩放价格与涨跌额"""
+    out = raw.copy()
+    if adjust not in ("qfq", "hfq") or out.empty:
+        return out
+    multiplier = adjustment(out["日期"], factors, adjust)
+    columns = [c for c in PRICE_COLUMNS + ["涨跌额"] if c in out.columns]
+    out[columns] = np.round(out[columns].to_numpy(dtype=float) * multiplier[:, None], 2)
+    return out
+
+
+def has_ex_rights_gap(bars: pd.DataFrame, previous_close: Optional[float]) -> bool:
+    """新增K线中是否有除权缺口：交易所公布的涨跌幅按除权后的昨收计算，与不复权收盘价变化不一致"""
+    if bars.empty or "涨跌幅" not in bars.columns:
+        return False
+    close = bars["收盘"].to_numpy(dtype=float)
+    prev = np.concatenate(([previous_close if previous_close else np.nan], close[:-1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        implied = (close / prev - 1) * 100
+    gap = np.abs(implied - bars["涨跌幅"].to_numpy(dtype=float))
+    return bool(np.nanmax(gap, initial=0.0) > EX_RIGHTS_GAP)
+
+
+class KlineStore:
+    def __init__(self, directory: str = KLINE_DIR, bars_ttl: float = 300.0, factors_ttl: float = 43200.0,
+                 memory_entries: int = 256):
+        self.directory = directory
+        self.bars_ttl = bars_ttl
+        self.factors_ttl = factors_ttl
+        self.memory_entries = memory_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._code_locks: Dict[str, threading.Lock] = {}
+
+    # --- 存储 ---
+    def _path(self, code: str) -> str:
+        return os.path.join(self.directory, f"{code}.pkl")
+
+    def _read(self, code: str) -> Optional[Dict]:
+        try:
+            with open(self._path(code), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read kline store for {code}: {e}")
+            return None
+
+    def _write(self, code: str, entry: Dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(code)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _remember(self, code: str, entry: Dict):
+        with self._lock:
+            self._entries[code] = entry
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.memory_entries:
+                self._entries.popitem(last=False)
+
+    def _code_lock(self, code: str) -> threading.Lock:
+        with self._lock:
+            return self._code_locks.setdefault(code, threading.Lock())
+
+    # --- 读取 ---
+    def get(self, symbol: str, adjust: str = "qfq", start_date: str = DEFAULT_START) -> pd.DataFrame:
+        """返回 start_date 起的日K，列与 stock_zh_a_hist 一致"""
+        if adjust not in ADJUSTS:
+            raise ValueError(f"Unsupported adjust: {adjust!r}")
+        code = symbol[-6:]
+        # 同一只股票的并发请求只回源一次
+        with self._code_lock(code):
+            entry, stale = self._current(code, start_date)
+        if adjust and entry["factors"] is None:
+            # 因子表暂时拿不到时退回上游直接复权，不返回错误的价格
+            from data_provider import ak
+            REFRESHES.labels("factors", "bypass").inc()
+            return ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start_date, adjust=adjust)
+        bars = entry["bars"]
+        bars = bars[_dates(bars) >= pd.Timestamp(start_date)].reset_index(drop=True)
+        out = apply_adjustment(bars, entry["factors"], adjust)
+        if stale:
+            out.attrs["stale"] = stale
+        return out
+
+    def _current(self, code: str, start_date: str):
+        with self._lock:
+            entry = self._entries.get(code)
+        if entry is None:
+            entry = self._read(code)
+        if entry is None or entry["start"] > start_date:
+            metrics.cache_miss("kline_store")
+            return self._fetch_full(code, start_date, entry)
+
+        metrics.cache_hit("kline_store")
+        stale = None
+        now = time.time()
+        refresh_factors = entry["factors"] is None or now - entry["factors_checked_at"] >= self.factors_ttl
+        if cache_policy.is_expired("daily", entry["bars_checked_at"], self.bars_ttl, now):
+            entry, stale, ex_rights = self._refresh_bars(code, entry)
+            refresh_factors = refresh_factors or ex_rights
+        if refresh_factors:
+            entry = self._refresh_factors(code, entry)
+        self._remember(code, entry)
+        return entry, stale
+
+    def _fetch_full(self, code: str, start_date: str, previous: Optional[Dict]):
+        from data_provider import ak, staleness
+        bars = ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start_date, adjust="")
+        stale = staleness(bars)
+        if stale is not None and previous is not None:
+            # 上游保护返回的旧数据：继续用已存的（起始日期较晚的）K线
+            REFRESHES.labels("bars", "stale").inc()
+            return previous, stale
+        entry = {"code": code, "start": start_date, "bars": bars.reset_index(drop=True),
+                 "bars_checked_at": 0.0 if stale else time.time(),
+                 "factors": None, "factors_checked_at": 0.0}
+        entry = self._refresh_factors(code, entry, persist=stale is None)
+        REFRESHES.labels("bars", "stale" if stale else "fetched").inc()
+        self._remember(code, entry)
+        return entry, stale
+
+    def _refresh_bars(self, code: str, entry: Dict):
+        """只拉最后一根（可能仍在变化的当日K线）及之后的K线"""
+        from data_provider import ak, staleness
+        bars = entry["bars"]
+        last = _dates(bars).iloc[-1].strftime("%Y%m%d") if not bars.empty else entry["start"]
+        try:
+            new = ak.stock_zh_a_hist(symbol=code, period="daily", start_date=last, adjust="")
+        except Exception as e:
+            REFRESHES.labels("bars", "error").inc()
+            logger.warning(f"Kline refresh failed for {code}, serving stored bars: {e}")
+            return entry, _stale_marker("error", entry["bars_checked_at"]), False
+        stale = staleness(new)
+        if stale is not None:
+            REFRESHES.labels("bars", "stale").inc()
+            return entry, _stale_marker(stale.get("reason", "stale"), entry["bars_checked_at"]), False
+
+        kept = bars[_dates(bars) < _dates(new).iloc[0]] if not new.empty else bars
+        previous_close = float(kept["收盘"].iloc[-1]) if not kept.empty else None
+        entry = dict(entry, bars=pd.concat([kept, new], ignore_index=True) if not new.empty else bars,
+                     bars_checked_at=time.time())
+        self._write(code, entry)
+        REFRESHES.labels("bars", "updated" if len(new) > 1 else "unchanged").inc()
+        return entry, None, has_ex_rights_gap(new, previous_close)
+
+    def _refresh_factors(self, code: str, entry: Dict, persist: bool = True) -> Dict:
+        from data_provider import ak, staleness
+        try:
+            df = ak.stock_zh_a_daily(symbol=sina_symbol(code), adjust="hfq-factor")
+        except Exception as e:
+            REFRESHES.labels("factors", "error").inc()
+            logger.warning(f"Adjustment factor refresh failed for {code}: {e}")
+            if persist and entry["factors"] is None:
+                self._write(code, entry)
+            return entry
+        factors = factor_table(df)
+        if staleness(df) is not None:
+            REFRESHES.labels("factors", "stale").inc()
+            return entry if entry["factors"] is not None else dict(entry, factors=factors)
+        changed = entry["factors"] is None or not factors.equals(entry["factors"])
+        entry = dict(entry, factors=factors, factors_checked_at=time.time())
+        if persist:
+            self._write(code, entry)
+        REFRESHES.labels("factors", "updated" if changed else "unchanged").inc()
+        return entry
+
+
+def _dates(bars: pd.DataFrame) -> pd.Series:
+    # stock_zh_a_hist 的日期列是 datetime.date，录制/回放数据里可能是字符串
+    return pd.to_datetime(bars["日期"])
+
+
+def _stale_marker(reason: str, checked_at: float) -> Dict:
+    return {
+        "reason": reason,
+        "age_seconds": round(time.time() - checked_at, 1),
+        "as_of": cache_policy.market_time(checked_at).isoformat(timespec="seconds"),
+    }
+
+
+store = KlineStore(
+    bars_ttl=float(os.getenv("KLINE_BARS_TTL", "300")),
+    factors_ttl=float(os.getenv("KLINE_FACTORS_TTL", "43200")),
+    memory_entries=int(os.getenv("KLINE_MEMORY_ENTRIES", "256")),
+)
+
+
+def daily_bars(symbol: str, adjust: str = "qfq", start_date: str = DEFAULT_START) -> pd.DataFrame:
+    return store.get(symbol, adjust, start_date)
@@ -0,0 +1,92 @@
+"""
+LLM 客户端（延迟构建）
+
+langchain_openai / openai 导入较慢，这里在第一次调用 get_llm() 时才导入并构建
+ChatOpenAI，只用到行情接口的 worker 完全不加载这套依赖。
+直接分析与 CrewAI 共用同一个实例，HTTP 请求经由 llm_gateway 统一调度。
+"""
+import asyncio
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+import metrics
+
+load_dotenv()
+
+MODEL = "qwen-plus"  # 阿里云建议使用 qwen-plus 作为主力模型，性价比和稳定性较好
+
+_llm = None
+_lock = threading.Lock()
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """记录 LLM 调用的并发数、耗时与 token 用量 (直接分析与 CrewAI 共用同一个 llm)"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, "ok")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        model = (response.llm_output or {}).get("model_name") or self.model
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                metrics.LLM_TOKENS.labels(model, kind.split("_")[0]).inc(usage[kind])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+    def _start(self, run_id):
+        self._started[run_id] = time.perf_counter()
+        metrics.LLM_IN_FLIGHT.inc()
+
+    def _finish(self, run_id, outcome):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        metrics.LLM_IN_FLIGHT.dec()
+        metrics.LLM_CALLS.labels(self.model, outcome).inc()
+        metrics.LLM_LATENCY.labels(self.model).observe(time.perf_counter() - started)
+
+
+def get_llm():
+    """返回共享的 ChatOpenAI 实例，首次调用时构建"""
+    global _llm
+    if _llm is not None:
+        return _llm
+    with _lock:
+        if _llm is None:
+            import httpx
+            from langchain_openai import ChatOpenAI
+            from llm_gateway import GatewayAsyncTransport, GatewayTransport, gateway
+
+            # 超时、重试与并发都由网关按请求截止时间控制，客户端自身不再重试
+            _llm = ChatOpenAI(
+                model=MODEL,
+                temperature=0.5,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_API_BASE"),
+                http_client=httpx.Client(transport=GatewayTransport(gateway), timeout=None),
+                http_async_client=httpx.AsyncClient(transport=GatewayAsyncTransport(gateway), timeout=None),
+                max_retries=0,
+                callbacks=[LLMMetricsCallback(MODEL)]
+            )
+    return _llm
+
+
+async def aget_llm():
+    """在事件循环中获取 LLM；首次构建需要导入 langchain，放到线程池里做"""
+    if _llm is not None:
+        return _llm
+    return await asyncio.get_running_loop().run_in_executor(None, get_llm)
@@ -0,0 +1,352 @@
+"""
+LLM 请求网关
+
+直接分析与 CrewAI 的所有 LLM HTTP 请求都经过这里：
+- 一个共享的 httpx.AsyncClient（连接池）运行在独立的事件循环线程上；
+- 全局并发上限 LLM_MAX_CONCURRENCY，排队按优先级放行：交互请求（直接分析报告）
+  先于后台请求（CrewAI），并为交互请求预留 LLM_INTERACTIVE_RESERVE 个名额；
+- 每个请求有截止时间，排队与重试都计入其中。遇到连接错误、超时、429/5xx 时
+  指数退避重试，剩余时间不足以完成一次尝试时不再重试。
+
+langchain 的 ChatOpenAI 通过 GatewayTransport / GatewayAsyncTransport 接入，
+优先级与截止时间由调用方用 `with llm_gateway.priority(INTERACTIVE):` 指定。
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import httpx
+
+import metrics
+from llm_router import load_router
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+GATEWAY_IN_FLIGHT = metrics.gauge("llm_gateway_in_flight", "LLM requests holding a gateway slot", ["priority"])
+GATEWAY_QUEUED = metrics.gauge("llm_gateway_queued", "LLM requests waiting for a gateway slot", ["priority"])
+GATEWAY_WAIT = metrics.histogram("llm_gateway_queue_wait_seconds", "Time LLM requests wait for a gateway slot", ["priority"])
+GATEWAY_RETRIES = metrics.counter("llm_gateway_retries_total", "LLM request retries by reason", ["reason"])
+GATEWAY_EXPIRED = metrics.counter("llm_gateway_deadline_exceeded_total", "LLM requests that ran out of time", ["priority", "stage"])
+
+
+class LLMDeadlineExceeded(httpx.TimeoutException):
+    """排队或重试耗尽了请求的截止时间"""
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using {default}")
+        return default
+
+
+DEFAULT_DEADLINES = {
+    INTERACTIVE: _env_float("LLM_INTERACTIVE_DEADLINE", 120.0),
+    BACKGROUND: _env_float("LLM_BACKGROUND_DEADLINE", 600.0),
+}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=BACKGROUND)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+_target: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_latency_target", default=None)
+
+
+@contextmanager
+def priority(level: int, deadline_seconds: Optional[float] = None, latency_target: Optional[float] = None):
+    """
+    为当前上下文中的 LLM 调用设置优先级；deadline_seconds 给出时所有调用共享这一截止时间，
+    否则每次请求各自使用该优先级的默认时限。latency_target 供模型路由选择模型（秒）。
+    """
+    p_token = _priority.set(level)
+    d_token = _deadline.set(time.monotonic() + deadline_seconds if deadline_seconds else None)
+    t_token = _target.set(latency_target)
+    try:
+        yield
+    finally:
+        _priority.reset(p_token)
+        _deadline.reset(d_token)
+        _target.reset(t_token)
+
+
+def current_request_budget() -> Tuple[int, float, Optional[float]]:
+    """返回 (优先级, 绝对截止时间 monotonic, 延迟目标秒数或 None)"""
+    level = _priority.get()
+    deadline = _deadline.get()
+    if deadline is None:
+        deadline = time.monotonic() + DEFAULT_DEADLINES[level]
+    return level, deadline, _target.get()
+
+
+class _PriorityLimiter:
+    """只在网关事件循环内使用的优先级信号量"""
+
+    def __init__(self, capacity: int, interactive_reserve: int):
+        self.capacity = capacity
+        self.background_limit = max(1, capacity - interactive_reserve)
+        self.active = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def _can_run(self, level: int) -> bool:
+        total = self.active[INTERACTIVE] + self.active[BACKGROUND]
+        if total >= self.capacity:
+            return False
+        return level == INTERACTIVE or self.active[BACKGROUND] < self.background_limit
+
+    def _take(self, level: int):
+        self.active[level] += 1
+        GATEWAY_IN_FLIGHT.labels(PRIORITY_NAMES[level]).inc()
+
+    def queued(self, level: int) -> int:
+        return sum(1 for p, _, f in self._waiters if p == level and not f.done())
+
+    async def acquire(self, level: int, timeout: float):
+        # 只有同级或更高优先级的请求在排队时才需要排在它们后面；
+        # 后台请求因后台名额用完而排队时，交互请求照样可以占用预留名额
+        if self._can_run(level) and not any(p <= level and not f.done() for p, _, f in self._waiters):
+            self._take(level)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (level, next(self._seq), future))
+        GATEWAY_QUEUED.labels(PRIORITY_NAMES[level]).inc()
+        self._grant()
+        try:
+            await asyncio.wait_for(future, max(0.0, timeout))
+        except BaseException:
+            # 超时/取消与放行同时发生时，名额已经记在本请求名下，需要归还
+            if future.done() and not future.cancelled():
+                self.release(level)
+            raise
+        finally:
+            GATEWAY_QUEUED.labels(PRIORITY_NAMES[level]).dec()
+
+    def release(self, level: int):
+        self.active[level] -= 1
+        GATEWAY_IN_FLIGHT.labels(PRIORITY_NAMES[level]).dec()
+        self._grant()
+
+    def _grant(self):
+        """按优先级与排队顺序放行；暂时不能运行的等待者（后台名额已满）留在队列中，不挡住其后的交互请求"""
+        waiting = []
+        for entry in sorted(self._waiters):
+            level, _, future = entry
+            if future.done():
+                continue
+            if self._can_run(level):
+                self._take(level)
+                future.set_result(None)
+            else:
+                waiting.append(entry)
+        # 有序列表本身就是合法的堆
+        self._waiters = waiting
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int = 8, interactive_reserve: int = 2, max_connections: int = 16,
+                 attempt_timeout: float = 120.0, connect_timeout: float = 10.0, max_attempts: int = 4,
+                 backoff_base: float = 1.0, min_attempt_seconds: float = 5.0, router=None):
+        self.max_concurrency = max_concurrency
+        self.interactive_reserve = interactive_reserve
+        self.max_connections = max_connections
+        self.attempt_timeout = attempt_timeout
+        self.connect_timeout = connect_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.min_attempt_seconds = min_attempt_seconds
+        # llm_router.ModelRouter，配置了多个模型时按延迟选择并对冲
+        self.router = router
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._limiter: Optional[_PriorityLimiter] = None
+        self._start_lock = threading.Lock()
+
+    # --- 事件循环线程 ---
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._client = httpx.AsyncClient(limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ))
+                    self._limiter = _PriorityLimiter(self.max_concurrency, self.interactive_reserve)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="llm-gateway", daemon=True).start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    # --- 请求 ---
+    async def _send(self, request: httpx.Request, level: int, deadline: float,
+                    target: Optional[float]) -> httpx.Response:
+        if self.router is None or not self.router.routable(request):
+            return await self._send_one(request, level, deadline)
+        name = PRIORITY_NAMES[level]
+        target = target or self.router.targets.get(name, DEFAULT_DEADLINES[level])
+        target = max(0.0, min(target, deadline - time.monotonic()))
+        return await self.router.dispatch(
+            request, name, target, lambda routed, tracker: self._send_one(routed, level, deadline, tracker),
+        )
+
+    async def _send_one(self, request: httpx.Request, level: int, deadline: float,
+                        tracker=None) -> httpx.Response:
+        """占用一个并发名额发送单个请求（含重试）；tracker 为 llm_router.AttemptTracker，记录每次尝试的耗时"""
+        name = PRIORITY_NAMES[level]
+        queued_at = time.monotonic()
+        try:
+            await self._limiter.acquire(level, deadline - queued_at)
+        except asyncio.TimeoutError:
+            GATEWAY_EXPIRED.labels(name, "queue").inc()
+            raise LLMDeadlineExceeded(f"LLM request waited {time.monotonic() - queued_at:.1f}s for a slot", request=request)
+        GATEWAY_WAIT.labels(name).observe(time.monotonic() - queued_at)
+        try:
+            return await self._send_with_retries(request, level, deadline, tracker)
+        finally:
+            self._limiter.release(level)
+
+    async def _send_with_retries(self, request: httpx.Request, level: int, deadline: float,
+                                 tracker=None) -> httpx.Response:
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                GATEWAY_EXPIRED.labels(PRIORITY_NAMES[level], "attempt").inc()
+                raise LLMDeadlineExceeded("LLM request deadline exceeded before attempt", request=request)
+            timeout = httpx.Timeout(min(self.attempt_timeout, remaining),
+                                    connect=min(self.connect_timeout, remaining))
+            retry_reason, retry_after, response = None, None, None
+            try:
+                outgoing = self._client.build_request(
+                    request.method, request.url, headers=request.headers, content=request.content, timeout=timeout,
+                )
+                if tracker is not None:
+                    tracker.sent()
+                response = await self._client.send(outgoing)
+                body = await response.aread()
+                if tracker is not None:
+                    tracker.finished(response.status_code < 400)
+                if response.status_code in RETRY_STATUS:
+                    retry_reason = str(response.status_code)
+                    retry_after = _retry_after(response)
+            except httpx.TransportError as e:
+                if tracker is not None:
+                    tracker.finished(False)
+                retry_reason = type(e).__name__
+                if not self._can_retry(attempt, deadline, None):
+                    if isinstance(e, httpx.TimeoutException) and deadline - time.monotonic() <= 0:
+                        GATEWAY_EXPIRED.labels(PRIORITY_NAMES[level], "attempt").inc()
+                    raise
+            if retry_reason is None or not self._can_retry(attempt, deadline, retry_after):
+                return _detached_response(response, body, request)
+            delay = self._backoff(attempt, retry_after)
+            GATEWAY_RETRIES.labels(retry_reason).inc()
+            logger.warning(f"LLM request failed ({retry_reason}), retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = self.backoff_base * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+        return max(delay, retry_after or 0.0)
+
+    def _can_retry(self, attempt: int, deadline: float, retry_after: Optional[float]) -> bool:
+        """还有重试次数，且退避之后剩余时间仍够完成一次尝试"""
+        if attempt >= self.max_attempts:
+            return False
+        wait = max(self.backoff_base * (2 ** (attempt - 1)) * 1.5, retry_after or 0.0)
+        return deadline - time.monotonic() - wait >= self.min_attempt_seconds
+
+    def send_sync(self, request: httpx.Request) -> httpx.Response:
+        """供工作线程中的同步客户端调用，阻塞到结果返回"""
+        level, deadline, target = current_request_budget()
+        loop = self._ensure_started()
+        request.read()
+        future = asyncio.run_coroutine_threadsafe(self._send(request, level, deadline, target), loop)
+        return future.result()
+
+    async def send_async(self, request: httpx.Request) -> httpx.Response:
+        """供其他事件循环（如 FastAPI 主循环）调用"""
+        level, deadline, target = current_request_budget()
+        loop = self._ensure_started()
+        await request.aread()
+        future = asyncio.run_coroutine_threadsafe(self._send(request, level, deadline, target), loop)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        limiter = self._limiter
+        stats = {"max_concurrency": self.max_concurrency, "started": limiter is not None}
+        if limiter is not None:
+            stats.update({
+                "interactive_reserve": self.interactive_reserve,
+                "active": {PRIORITY_NAMES[k]: v for k, v in limiter.active.items()},
+                "queued": {PRIORITY_NAMES[k]: limiter.queued(k) for k in PRIORITY_NAMES},
+            })
+        if self.router is not None:
+            stats["router"] = self.router.snapshot()
+        return stats
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _detached_response(response: httpx.Response, body: bytes, request: httpx.Request) -> httpx.Response:
+    """把网关循环上读完的响应复制成与调用方客户端无关的 Response（正文已解压）"""
+    headers = [(k, v) for k, v in response.headers.multi_items()
+               if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+    return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+
+class GatewayTransport(httpx.BaseTransport):
+    """同步 httpx.Client 的传输层，转发到网关"""
+
+    def __init__(self, gateway: "LLMGateway"):
+        self.gateway = gateway
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.gateway.send_sync(request)
+
+
+class GatewayAsyncTransport(httpx.AsyncBaseTransport):
+    """异步 httpx.AsyncClient 的传输层，转发到网关"""
+
+    def __init__(self, gateway: "LLMGateway"):
+        self.gateway = gateway
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.gateway.send_async(request)
+
+
+gateway = LLMGateway(
+    max_concurrency=int(_env_float("LLM_MAX_CONCURRENCY", 8)),
+    interactive_reserve=int(_env_float("LLM_INTERACTIVE_RESERVE", 2)),
+    max_connections=int(_env_float("LLM_MAX_CONNECTIONS", 16)),
+    attempt_timeout=_env_float("LLM_ATTEMPT_TIMEOUT", 120.0),
+    max_attempts=int(_env_float("LLM_MAX_ATTEMPTS", 4)),
+    router=load_router(),
+)
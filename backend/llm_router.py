@@ -0,0 +1,345 @@
+"""
+按延迟选择模型的 LLM 路由
+
+LLM_ROUTER_CONFIG 指向一个 JSON 配置时启用，例如：
+
+    {
+      "models": [
+        {"name": "qwen-plus",  "model": "qwen-plus",  "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1", "api_key_env": "OPENAI_API_KEY"},
+        {"name": "qwen-turbo", "model": "qwen-turbo", "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1", "api_key_env": "OPENAI_API_KEY", "hedge_after": 15}
+      ],
+      "targets": {"interactive": 30, "background": 180},
+      "hedge_after": 20
+    }
+
+models 的顺序即偏好顺序。每个 /chat/completions 请求：
+1. 按各模型最近 window 秒内的 p90 延迟与错误率排序：满足本次延迟目标的健康模型按偏好顺序在前，
+   其余按预估延迟；没有足够样本的模型视为满足目标。
+2. 发往第一个模型；主请求拿到网关并发名额、真正发出后超过 hedge_after（默认取该模型的 p90，
+   上限为延迟目标）仍未返回时，向第二个模型发出对冲请求，先成功者胜出，另一个取消；
+   主请求失败时直接改发下一个模型。
+3. 请求的 model 字段、URL 与密钥按所选模型改写，每次决策写日志并计入指标。
+
+延迟按单次 HTTP 尝试计量（网关排队与重试退避不计入）；对冲落败被取消的请求只知道延迟的下界，
+按删失样本记录，p90 用 Kaplan-Meier 估计。
+
+可以用 llm_stub_server.py 在本地起几个不同延迟/错误率的假模型来验证路由行为。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUTER_DECISIONS = metrics.counter("llm_router_decisions_total", "Model routing decisions by chosen model and reason", ["model", "reason"])
+ROUTER_REQUESTS = metrics.counter("llm_router_requests_total", "Routed LLM requests by model and outcome", ["model", "outcome"])
+ROUTER_HEDGES = metrics.counter("llm_router_hedges_total", "Hedged LLM requests by primary and secondary model", ["primary", "secondary", "winner"])
+ROUTER_P90 = metrics.gauge("llm_router_p90_seconds", "Rolling p90 latency per model", ["model"])
+
+CHAT_PATH = "/chat/completions"
+
+# send(改写后的请求, AttemptTracker) -> 响应
+Send = Callable[[httpx.Request, "AttemptTracker"], Awaitable[httpx.Response]]
+
+
+@dataclass
+class ModelEndpoint:
+    name: str
+    model: str
+    base_url: str
+    api_key: str = ""
+    hedge_after: Optional[float] = None
+
+
+class ModelStats:
+    """最近 window 秒内的延迟与成败；censored 样本（被取消的请求）的真实延迟不小于记录值"""
+
+    def __init__(self, window: float = 300.0, max_samples: int = 200):
+        self.window = window
+        self._samples: Deque[Tuple[float, float, bool, bool]] = deque(maxlen=max_samples)
+
+    def record(self, latency: float, ok: bool, censored: bool = False):
+        self._samples.append((time.monotonic(), latency, ok, censored))
+
+    def _recent(self) -> List[Tuple[float, float, bool, bool]]:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def summary(self) -> Dict:
+        samples = self._recent()
+        # 同一延迟上完成的样本排在删失样本之前（Kaplan-Meier 的惯例）
+        latencies = sorted((latency, censored) for _, latency, ok, censored in samples if ok)
+        errors = sum(1 for _, _, ok, _ in samples if not ok)
+
+        def quantile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            at_risk, survival = len(latencies), 1.0
+            for latency, censored in latencies:
+                if not censored:
+                    survival *= 1 - 1 / at_risk
+                    if 1 - survival >= q:
+                        return latency
+                at_risk -= 1
+            # 删失样本太多，分位数只知道下界
+            return latencies[-1][0]
+
+        return {
+            "samples": len(samples),
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "p50": quantile(0.5),
+            "p90": quantile(0.9),
+        }
+
+
+class AttemptTracker:
+    """
+    一个模型上的一次路由请求。网关在拿到并发名额后、每次 HTTP 尝试前后调用 sent / finished，
+    延迟只计单次尝试；in_flight 在第一次真正发出时置位，对冲从这时开始计时。
+    """
+
+    def __init__(self, router: "ModelRouter", endpoint: ModelEndpoint):
+        self.router = router
+        self.endpoint = endpoint
+        self.in_flight = asyncio.Event()
+        self.first_sent_at: Optional[float] = None
+        self._sent_at: Optional[float] = None
+
+    def sent(self):
+        self._sent_at = time.monotonic()
+        if self.first_sent_at is None:
+            self.first_sent_at = self._sent_at
+            self.in_flight.set()
+
+    def finished(self, ok: bool):
+        if self._sent_at is not None:
+            self.router.observe(self.endpoint, time.monotonic() - self._sent_at, ok)
+            self._sent_at = None
+
+    def cancelled(self):
+        """对冲落败被取消：已耗时只是延迟的下界，按删失样本记录，避免慢模型一直被当作"未知"或被低估"""
+        if self._sent_at is not None:
+            self.router.observe(self.endpoint, time.monotonic() - self._sent_at, True, censored=True)
+            self._sent_at = None
+
+
+class ModelRouter:
+    def __init__(self, endpoints: List[ModelEndpoint], targets: Dict[str, float], hedge_after: float = 20.0,
+                 min_samples: int = 5, max_error_rate: float = 0.5, window: float = 300.0):
+        if not endpoints:
+            raise ValueError("ModelRouter needs at least one model")
+        self.endpoints = endpoints
+        self.targets = targets
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.stats = {e.name: ModelStats(window) for e in endpoints}
+        self.recent_decisions: Deque[Dict] = deque(maxlen=50)
+
+    # --- 选择 ---
+    def rank(self, target: float) -> List[Tuple[ModelEndpoint, str]]:
+        ranked = []
+        for index, endpoint in enumerate(self.endpoints):
+            s = self.stats[endpoint.name].summary()
+            enough = s["samples"] >= self.min_samples
+            healthy = not enough or s["error_rate"] <= self.max_error_rate
+            estimate = s["p90"] if enough and s["p90"] is not None else None
+            meets = estimate is None or estimate <= target
+            if not healthy:
+                key, reason = (2, index), "unhealthy_fallback"
+            elif meets:
+                key, reason = (0, index), "meets_target" if enough else "unexplored"
+            else:
+                key, reason = (1, estimate), "fastest_available"
+            ranked.append((key, endpoint, reason))
+        ranked.sort(key=lambda item: item[0])
+        return [(endpoint, reason) for _, endpoint, reason in ranked]
+
+    def _hedge_delay(self, endpoint: ModelEndpoint, target: float) -> float:
+        if endpoint.hedge_after is not None:
+            return endpoint.hedge_after
+        s = self.stats[endpoint.name].summary()
+        if s["samples"] >= self.min_samples and s["p90"] is not None:
+            return min(s["p90"], target)
+        return min(self.hedge_after, target)
+
+    # --- 改写 ---
+    @staticmethod
+    def routable(request: httpx.Request) -> bool:
+        if request.method != "POST" or not request.url.path.endswith(CHAT_PATH):
+            return False
+        try:
+            return not json.loads(request.content).get("stream")
+        except ValueError:
+            return False
+
+    @staticmethod
+    def rewrite(request: httpx.Request, endpoint: ModelEndpoint) -> httpx.Request:
+        body = json.loads(request.content)
+        body["model"] = endpoint.model
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+        if endpoint.api_key:
+            headers["authorization"] = f"Bearer {endpoint.api_key}"
+        url = endpoint.base_url.rstrip("/") + CHAT_PATH
+        return httpx.Request("POST", url, headers=headers, content=json.dumps(body).encode("utf-8"))
+
+    # --- 发送 ---
+    def observe(self, endpoint: ModelEndpoint, latency: float, ok: bool, censored: bool = False):
+        stats = self.stats[endpoint.name]
+        stats.record(latency, ok, censored)
+        p90 = stats.summary()["p90"]
+        if p90 is not None:
+            ROUTER_P90.labels(endpoint.name).set(p90)
+
+    async def _attempt(self, tracker: AttemptTracker, request: httpx.Request, send: Send) -> httpx.Response:
+        endpoint = tracker.endpoint
+        try:
+            response = await send(self.rewrite(request, endpoint), tracker)
+        except asyncio.CancelledError:
+            tracker.cancelled()
+            raise
+        except Exception:
+            ROUTER_REQUESTS.labels(endpoint.name, "error").inc()
+            raise
+        ROUTER_REQUESTS.labels(endpoint.name, "ok" if response.status_code < 400 else "error").inc()
+        return response
+
+    def _start(self, pending: Dict[asyncio.Task, AttemptTracker], endpoint: ModelEndpoint,
+               request: httpx.Request, send: Send):
+        tracker = AttemptTracker(self, endpoint)
+        pending[asyncio.ensure_future(self._attempt(tracker, request, send))] = tracker
+
+    async def dispatch(self, request: httpx.Request, level_name: str, target: float, send: Send) -> httpx.Response:
+        """
+        按排序发送，必要时对冲或改发下一个模型，返回第一个成功的响应（都失败时返回/抛出最后一个结果）。
+        send(request, tracker) 负责排队与发送，并在每次 HTTP 尝试前后调用 tracker.sent / tracker.finished。
+        """
+        ranked = self.rank(target)
+        primary, reason = ranked[0]
+        self._log_decision(level_name, target, primary, reason, ranked)
+        pending: Dict[asyncio.Task, AttemptTracker] = {}
+        self._start(pending, primary, request, send)
+        remaining = [endpoint for endpoint, _ in ranked[1:]]
+        hedged = None
+        last_result = None
+        try:
+            while pending:
+                timeout, sent = None, None
+                if hedged is None and remaining and len(pending) == 1:
+                    (current,) = pending.values()
+                    if current.first_sent_at is None:
+                        # 还在网关排队：等它真正发出后才开始对冲计时
+                        sent = asyncio.ensure_future(current.in_flight.wait())
+                    else:
+                        timeout = max(0.0, self._hedge_delay(current.endpoint, target)
+                                      - (time.monotonic() - current.first_sent_at))
+                try:
+                    done, _ = await asyncio.wait([*pending, *([sent] if sent else [])], timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if sent is not None:
+                        sent.cancel()
+                done = [task for task in done if task in pending]
+                if not done:
+                    if sent is not None:
+                        continue
+                    # 在途请求超过对冲阈值仍未返回：并行发往下一个模型
+                    secondary = hedged = remaining.pop(0)
+                    logger.info(f"LLM hedge: {current.endpoint.name} in flight longer than "
+                                f"{self._hedge_delay(current.endpoint, target):.1f}s, also sending to {secondary.name}")
+                    ROUTER_DECISIONS.labels(secondary.name, "hedge").inc()
+                    hedged_from = current.endpoint
+                    self._start(pending, secondary, request, send)
+                    continue
+                for task in done:
+                    endpoint = pending.pop(task).endpoint
+                    last_result = task
+                    if task.exception() is None and task.result().status_code < 400:
+                        if hedged is not None:
+                            ROUTER_HEDGES.labels(hedged_from.name, hedged.name, endpoint.name).inc()
+                        return task.result()
+                    logger.warning(f"LLM model {endpoint.name} failed: "
+                                   f"{task.exception() or task.result().status_code}")
+                if not pending and remaining:
+                    # 已有请求都失败：改发下一个模型
+                    fallback = remaining.pop(0)
+                    logger.info(f"LLM fallback to {fallback.name}")
+                    ROUTER_DECISIONS.labels(fallback.name, "fallback").inc()
+                    self._start(pending, fallback, request, send)
+        finally:
+            for task in pending:
+                task.cancel()
+        if last_result.exception() is not None:
+            raise last_result.exception()
+        return last_result.result()
+
+    def _log_decision(self, level_name: str, target: float, endpoint: ModelEndpoint, reason: str,
+                      ranked: List[Tuple[ModelEndpoint, str]]):
+        s = self.stats[endpoint.name].summary()
+        decision = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "priority": level_name,
+            "target_seconds": target,
+            "model": endpoint.name,
+            "reason": reason,
+            "p90": s["p90"],
+            "error_rate": round(s["error_rate"], 3),
+            "ranking": [e.name for e, _ in ranked],
+        }
+        self.recent_decisions.append(decision)
+        ROUTER_DECISIONS.labels(endpoint.name, reason).inc()
+        p90 = f"{s['p90']:.2f}s" if s["p90"] is not None else "n/a"
+        logger.info(f"LLM route {level_name} target={target:.0f}s -> {endpoint.name} ({reason}, p90={p90}, "
+                    f"err={s['error_rate']:.0%}, ranking={decision['ranking']})")
+
+    def snapshot(self) -> Dict:
+        return {
+            "models": {
+                e.name: {"model": e.model, "base_url": e.base_url, **self.stats[e.name].summary()}
+                for e in self.endpoints
+            },
+            "targets": self.targets,
+            "recent_decisions": list(self.recent_decisions)[-10:],
+        }
+
+
+def load_router(path: Optional[str] = None) -> Optional[ModelRouter]:
+    """读取 LLM_ROUTER_CONFIG；未配置时返回 None（所有请求直接发往 ChatOpenAI 配置的模型）"""
+    path = path or os.getenv("LLM_ROUTER_CONFIG")
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    endpoints = []
+    for item in config["models"]:
+        api_key = item.get("api_key") or os.getenv(item.get("api_key_env", "OPENAI_API_KEY"), "")
+        endpoints.append(ModelEndpoint(
+            name=item.get("name", item["model"]),
+            model=item["model"],
+            base_url=item.get("base_url") or os.getenv("OPENAI_API_BASE", ""),
+            api_key=api_key,
+            hedge_after=item.get("hedge_after"),
+        ))
+    targets = {"interactive": 30.0, "background": 180.0}
+    targets.update(config.get("targets", {}))
+    router = ModelRouter(
+        endpoints,
+        targets=targets,
+        hedge_after=float(config.get("hedge_after", 20.0)),
+        min_samples=int(config.get("min_samples", 5)),
+        max_error_rate=float(config.get("max_error_rate", 0.5)),
+        window=float(config.get("window_seconds", 300.0)),
+    )
+    logger.info(f"LLM router enabled with models {[e.name for e in endpoints]}")
+    return router
@@ -0,0 +1,79 @@
+"""
+本地 OpenAI 兼容的假模型服务，用于测试 LLM 网关与模型路由
+
+    python llm_stub_server.py --port 9001 --latency-ms 200-800
+    python llm_stub_server.py --port 9002 --latency-ms 3000-6000 --error-rate 0.2
+
+实现 POST /v1/chat/completions（非流式）与 GET /v1/models。
+每个请求按 --latency-ms 随机延迟，以 --error-rate 的概率返回 503；
+回复内容包含服务名与模型名，便于确认请求被路由到了哪里。
+GET /stats 返回已处理的请求数、当前并发与最大并发。
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(name: str, latency_ms: tuple, error_rate: float, seed: int = None) -> FastAPI:
+    app = FastAPI(title=f"LLM stub {name}")
+    rng = random.Random(seed)
+    state = {"requests": 0, "errors": 0, "active": 0, "max_active": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            await asyncio.sleep(rng.uniform(*latency_ms) / 1000.0)
+            if rng.random() < error_rate:
+                state["errors"] += 1
+                return JSONResponse({"error": {"message": f"{name} overloaded", "type": "server_error"}}, status_code=503)
+            prompt = body["messages"][-1].get("content", "") if body.get("messages") else ""
+            content = f"[{name}/{body.get('model')}] {str(prompt)[:80]}"
+            return {
+                "id": f"chatcmpl-{state['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(str(prompt)), "completion_tokens": len(content),
+                          "total_tokens": len(str(prompt)) + len(content)},
+            }
+        finally:
+            state["active"] -= 1
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": name, "object": "model", "owned_by": "stub"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return state
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--name", help="服务名，默认 stub-<port>")
+    parser.add_argument("--latency-ms", default="200-800", help="固定 \"500\" 或区间 \"200-800\"")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    low, _, high = args.latency_ms.partition("-")
+    latency = (float(low), float(high or low))
+    app = create_app(args.name or f"stub-{args.port}", latency, args.error_rate, args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+端到端压测脚本
+
+按目标 RPS 以开环方式（不等待上一个请求返回）向后端发送混合请求，
+统计吞吐量、错误数以及各接口的延迟分位数。
+
+建议配合回放数据源运行后端，避免压到真实的行情接口：
+
+    STOCK_DATA_PROVIDER=replay STOCK_REPLAY_LATENCY_MS=30-300 STOCK_REPLAY_FALLBACK=1 \\
+        uvicorn app:app --port 8000 --workers 4
+    python loadtest.py --rps 50 --duration 60 --symbols 600519,000001
+
+接口权重可用 --mix 调整，例如 --mix search=5,kline=3,realtime=1,trade-signal=1,hot=1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_MIX = {"search": 4, "kline": 3, "realtime": 1, "trade-signal": 1, "hot": 1}
+SEARCH_TERMS = ["600519", "000001", "MT", "GZMT", "PAYH", "茅台", "银行", "300"]
+
+
+def build_request(endpoint: str, symbol: str, rng: random.Random):
+    """返回 (method, path, params)"""
+    if endpoint == "search":
+        return "GET", "/api/search", {"q": rng.choice(SEARCH_TERMS), "limit": 20}
+    if endpoint == "kline":
+        return "GET", "/api/kline", {"symbol": symbol, "period": "daily", "adjust": "qfq"}
+    if endpoint == "realtime":
+        return "GET", f"/api/realtime/{symbol}", None
+    if endpoint == "trade-signal":
+        return "GET", f"/api/trade-signal/{symbol}", None
+    if endpoint == "hot":
+        return "GET", "/api/hot", None
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Dict[str, Dict[str, int]], elapsed: float) -> Dict:
+    endpoints = {}
+    total = 0
+    total_ok = 0
+    for endpoint in sorted(set(latencies) | set(statuses)):
+        values = sorted(latencies.get(endpoint, []))
+        counts = statuses.get(endpoint, {})
+        ok = sum(v for k, v in counts.items() if k.startswith("2"))
+        count = sum(counts.values())
+        total += count
+        total_ok += ok
+        endpoints[endpoint] = {
+            "requests": count,
+            "ok": ok,
+            "errors": count - ok,
+            "status": dict(counts),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p90_ms": round(percentile(values, 90) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+        }
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": total,
+        "ok": total_ok,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "ok_rps": round(total_ok / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+async def run(base_url: str, rps: float, duration: float, mix: Dict[str, int], symbols: List[str],
+              timeout: float, max_in_flight: int, seed: int) -> Dict:
+    rng = random.Random(seed)
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = []
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def fire(endpoint: str, method: str, path: str, params):
+            async with in_flight:
+                started = time.perf_counter()
+                try:
+                    resp = await client.request(method, path, params=params)
+                    status = str(resp.status_code)
+                except httpx.TimeoutException:
+                    status = "timeout"
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies[endpoint].append(time.perf_counter() - started)
+                statuses[endpoint][status] += 1
+
+        interval = 1.0 / rps
+        started = time.perf_counter()
+        next_at = started
+        sent = 0
+        while time.perf_counter() - started < duration:
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, path, params = build_request(endpoint, rng.choice(symbols), rng)
+            tasks.append(asyncio.create_task(fire(endpoint, method, path, params)))
+            sent += 1
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        send_elapsed = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    report = summarize(latencies, statuses, elapsed)
+    report["target_rps"] = rps
+    report["offered_rps"] = round(sent / send_elapsed, 2) if send_elapsed else 0.0
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\nTarget {report['target_rps']} rps, offered {report['offered_rps']} rps, "
+          f"completed {report['requests']} requests in {report['elapsed_seconds']}s "
+          f"({report['throughput_rps']} rps, {report['ok_rps']} ok rps)")
+    print(f"{'endpoint':<14}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:<14}{e['requests']:>7}{e['errors']:>8}{e['p50_ms']:>10}{e['p90_ms']:>10}"
+              f"{e['p99_ms']:>10}{e['max_ms']:>10}")
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown endpoints: {sorted(unknown)}")
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the stock API at a target request rate")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="发送时长 (秒)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--symbols", default="600519,000001", help="逗号分隔，需已录制")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
+    report = asyncio.run(run(args.base_url, args.rps, args.duration, args.mix, symbols,
+                             args.timeout, args.max_in_flight, args.seed))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
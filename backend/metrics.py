@@ -0,0 +1,267 @@
+"""
+进程内指标采集，输出 Prometheus 文本格式 (text/plain; version=0.0.4)
+
+只实现本项目用到的 Counter / Gauge / Histogram 三种类型，避免额外依赖。
+注意：uvicorn 多 worker 部署时每个进程各自计数，抓取到的是单个 worker 的视图。
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 覆盖毫秒级搜索到分钟级 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _default(self):
+        # 无标签指标直接在自身上调用 inc()/observe()
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = float(value)
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def track_inprogress(self):
+        return self._default().track_inprogress()
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = ("le", _format_value(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# --- HTTP ---
+HTTP_LATENCY = histogram("http_request_duration_seconds", "HTTP request latency by route", ["method", "path", "status"])
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+# --- akshare 上游 ---
+UPSTREAM_CALLS = counter("upstream_calls_total", "akshare calls by function and outcome", ["func", "outcome"])
+UPSTREAM_LATENCY = histogram("upstream_call_duration_seconds", "akshare call latency by function", ["func"])
+UPSTREAM_BREAKER_STATE = gauge("upstream_breaker_state", "Circuit breaker state per akshare function (0=closed, 1=half-open, 2=open)", ["func"])
+UPSTREAM_REJECTED = counter("upstream_rejected_total", "akshare calls rejected before reaching upstream", ["func", "reason"])
+UPSTREAM_STALE_SERVED = counter("upstream_stale_served_total", "Last known good values served in place of a failed or rejected call", ["func"])
+
+# --- 缓存 ---
+CACHE_REQUESTS = counter("cache_requests_total", "Cache lookups by cache name and result", ["cache", "result"])
+
+# --- CrewAI / LLM ---
+CREW_IN_FLIGHT = gauge("crew_runs_in_flight", "CrewAI runs currently executing")
+CREW_LATENCY = histogram("crew_run_duration_seconds", "CrewAI run latency")
+LLM_IN_FLIGHT = gauge("llm_calls_in_flight", "LLM calls currently executing")
+LLM_CALLS = counter("llm_calls_total", "LLM calls by model and outcome", ["model", "outcome"])
+LLM_LATENCY = histogram("llm_call_duration_seconds", "LLM call latency by model", ["model"])
+LLM_TOKENS = counter("llm_tokens_total", "LLM tokens by model and type", ["model", "type"])
+
+
+@contextmanager
+def observe_upstream(func: str):
+    """记录一次 akshare 调用的耗时与结果"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_CALLS.labels(func, "error").inc()
+        raise
+    else:
+        UPSTREAM_CALLS.labels(func, "ok").inc()
+    finally:
+        UPSTREAM_LATENCY.labels(func).observe(time.perf_counter() - started)
+
+
+def cache_hit(cache: str):
+    CACHE_REQUESTS.labels(cache, "hit").inc()
+
+
+def cache_miss(cache: str):
+    CACHE_REQUESTS.labels(cache, "miss").inc()
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,157 @@
+"""
+多周期共振 (Multi-Timeframe)
+
+交易信号原先只看日线指标。这里把一次拉取的 1 分钟K线（stock_zh_a_hist_min_em period="1"）
+在本地向量化聚合成 5/15/30/60 分钟K线和当日日K，再用 indicators 注册表分别求值，
+得到每个周期的多空倾向以及跨周期的一致程度，不增加任何上游请求。
+
+分钟K线按 A 股交易时段切分：上午 09:30-11:30、下午 13:00-15:00 共 240 分钟，
+N 分钟K线以区间右端时刻为标签（与行情软件一致，60 分钟K线为 10:30/11:30/14:00/15:00），
+09:30 集合竞价那一根并入第一根K线。聚合用 np.*.reduceat 一次完成。
+
+东方财富的 1 分钟K线只有最近 5 个交易日，聚合出的日K不够计算日线指标，
+因此日线周期使用已拉取的日K历史，只把其后缺失的交易日用分钟聚合结果补上。
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import indicators
+
+INTRADAY_TIMEFRAMES = (5, 15, 30, 60)
+DAILY = "daily"
+
+# 判断多空倾向用到的指标
+INDICATOR_SET = ["MA5", "MA10", "MA20", "MACD", "KDJ"]
+# 少于该根数的周期不参与共振统计（MA20 需要 20 根；5 个交易日的 60 分钟K线正好 20 根）
+MIN_BARS = 20
+
+SESSION_MINUTES = 240
+_MORNING_OPEN = 9 * 60 + 30
+_AFTERNOON_OPEN = 13 * 60
+_MORNING_MINUTES = 120
+
+
+class MinuteBars:
+    """解析一次 1 分钟K线，供多个周期重复聚合"""
+
+    def __init__(self, df: pd.DataFrame):
+        times = pd.to_datetime(df["时间"])
+        order = np.argsort(times.to_numpy(), kind="stable")
+        stamps = times.to_numpy()[order]
+        self.days = stamps.astype("datetime64[D]")
+        clock = (stamps - self.days).astype("timedelta64[m]").astype(np.int64)
+        # 交易时段内的第几分钟 (1..240)，午休与盘前盘后的时刻归到最近的时段边界
+        session = np.where(clock >= _AFTERNOON_OPEN, _MORNING_MINUTES + clock - _AFTERNOON_OPEN, clock - _MORNING_OPEN)
+        self.session_minute = np.clip(session, 1, SESSION_MINUTES)
+        self.columns = {
+            name: df[name].to_numpy(dtype=float)[order]
+            for name in ("开盘", "收盘", "最高", "最低", "成交量", "成交额") if name in df
+        }
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def _aggregate(self, keys: np.ndarray):
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        ends = np.append(starts[1:], len(keys)) - 1
+        c = self.columns
+        bars = {
+            "开盘": c["开盘"][starts],
+            "收盘": c["收盘"][ends],
+            "最高": np.maximum.reduceat(c["最高"], starts),
+            "最低": np.minimum.reduceat(c["最低"], starts),
+            "成交量": np.add.reduceat(c["成交量"], starts),
+        }
+        if "成交额" in c:
+            bars["成交额"] = np.add.reduceat(c["成交额"], starts)
+        return starts, bars
+
+    def resample(self, minutes: int) -> pd.DataFrame:
+        """聚合为 N 分钟K线，列名与 stock_zh_a_hist_min_em 一致"""
+        if len(self) == 0:
+            return pd.DataFrame(columns=["时间", "开盘", "收盘", "最高", "最低", "成交量"])
+        bucket = -(-self.session_minute // minutes)
+        keys = self.days.astype(np.int64) * 1000 + bucket
+        starts, bars = self._aggregate(keys)
+        end = np.minimum(bucket[starts] * minutes, SESSION_MINUTES)
+        clock = np.where(end <= _MORNING_MINUTES, _MORNING_OPEN + end, _AFTERNOON_OPEN + end - _MORNING_MINUTES)
+        labels = self.days[starts].astype("datetime64[m]") + clock.astype("timedelta64[m]")
+        return pd.DataFrame({"时间": pd.to_datetime(labels), **bars})
+
+    def daily(self) -> pd.DataFrame:
+        """聚合为日K，列名与 stock_zh_a_hist 一致"""
+        if len(self) == 0:
+            return pd.DataFrame(columns=["日期", "开盘", "收盘", "最高", "最低", "成交量"])
+        starts, bars = self._aggregate(self.days.astype(np.int64))
+        return pd.DataFrame({"日期": pd.to_datetime(self.days[starts]), **bars})
+
+
+def extend_daily(history: Optional[pd.DataFrame], intraday: pd.DataFrame) -> pd.DataFrame:
+    """日K历史之后缺失的交易日用分钟聚合的日K补齐"""
+    if history is None or history.empty:
+        return intraday
+    last = pd.to_datetime(history["日期"]).max()
+    newer = intraday[intraday["日期"] > last]
+    if newer.empty:
+        return history
+    return pd.concat([history, newer], ignore_index=True)
+
+
+def frames(minute_df: Optional[pd.DataFrame], daily_df: Optional[pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
+    """1 分钟K线 -> {周期: K线}，周期名与 /api/kline 的 period 参数一致"""
+    out: Dict[str, pd.DataFrame] = {}
+    if minute_df is not None and not minute_df.empty:
+        bars = MinuteBars(minute_df)
+        for minutes in INTRADAY_TIMEFRAMES:
+            out[str(minutes)] = bars.resample(minutes)
+        out[DAILY] = extend_daily(daily_df, bars.daily())
+    elif daily_df is not None and not daily_df.empty:
+        out[DAILY] = daily_df
+    return out
+
+
+def timeframe_state(df: pd.DataFrame) -> Dict:
+    """单个周期的多空倾向：MACD、收盘相对 MA20、MA5 相对 MA10、K 相对 D 四项投票"""
+    if len(df) < MIN_BARS:
+        return {"bars": int(len(df)), "bias": None}
+    values = indicators.evaluate(df, INDICATOR_SET)
+    latest = {name: float(series.iloc[-1]) for name, series in values.items()}
+    close = float(df["收盘"].iloc[-1])
+    votes = (
+        np.sign(latest["DIF"] - latest["DEA"])
+        + np.sign(close - latest["MA20"])
+        + np.sign(latest["MA5"] - latest["MA10"])
+        + np.sign(latest["K"] - latest["D"])
+    )
+    votes = int(np.nan_to_num(votes))
+    return {
+        "bars": int(len(df)),
+        "bias": "看多" if votes >= 2 else "看空" if votes <= -2 else "中性",
+        "votes": votes,
+        "close": round(close, 2),
+        "MA20": round(latest["MA20"], 2),
+        "DIF": round(latest["DIF"], 4),
+        "DEA": round(latest["DEA"], 4),
+        "K": round(latest["K"], 2),
+        "D": round(latest["D"], 2),
+    }
+
+
+def confluence(states: Dict[str, Dict]) -> Dict:
+    """跨周期一致程度：agreement = (看多周期数 - 看空周期数) / 有效周期数，范围 [-1, 1]"""
+    biases = [s["bias"] for s in states.values() if s.get("bias")]
+    bullish = biases.count("看多")
+    bearish = biases.count("看空")
+    return {
+        "timeframes": len(biases),
+        "bullish": bullish,
+        "bearish": bearish,
+        "agreement": round((bullish - bearish) / len(biases), 2) if biases else 0.0,
+    }
+
+
+def analyze(minute_df: Optional[pd.DataFrame], daily_df: Optional[pd.DataFrame] = None) -> Dict:
+    states = {name: timeframe_state(df) for name, df in frames(minute_df, daily_df).items()}
+    return {"timeframes": states, "confluence": confluence(states)}
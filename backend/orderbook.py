@@ -0,0 +1,139 @@
+"""
+五档盘口环形缓冲 (Order Book)
+
+每次 /api/realtime、/api/trade-signal 拉取 stock_bid_ask_em 后，把五档买卖价量写入该股票的
+环形缓冲。缓冲是预分配的 NumPy 结构化数组（每只股票 ORDERBOOK_CAPACITY 条，默认 120），
+股票数超过 ORDERBOOK_MAX_SYMBOLS（默认 500）时淘汰最久未访问的，内存上限固定。
+
+features() 只读缓冲，不产生额外的上游请求，提供：
+- imbalance_l1 / imbalance_l5：最新快照一档/五档委托量失衡 (买-卖)/(买+卖)，范围 [-1, 1]
+- imbalance_mean：窗口内五档失衡均值；imbalance_trend：最新值相对窗口均值的变化
+- bid_depth / ask_depth：五档挂单金额；depth_change：买卖总挂单金额相对窗口起点的变化率
+- spread_bps：买一卖一价差（基点）
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+LEVELS = 5
+LEVEL_NAMES = ("一", "二", "三", "四", "五")
+BID_PRICE_ITEMS = [f"买{n}" for n in LEVEL_NAMES]
+BID_VOLUME_ITEMS = [f"买{n}量" for n in LEVEL_NAMES]
+ASK_PRICE_ITEMS = [f"卖{n}" for n in LEVEL_NAMES]
+ASK_VOLUME_ITEMS = [f"卖{n}量" for n in LEVEL_NAMES]
+BOOK_ITEMS = BID_PRICE_ITEMS + BID_VOLUME_ITEMS + ASK_PRICE_ITEMS + ASK_VOLUME_ITEMS
+
+SNAPSHOT_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("bid_price", "<f8", (LEVELS,)),
+    ("bid_volume", "<f8", (LEVELS,)),
+    ("ask_price", "<f8", (LEVELS,)),
+    ("ask_volume", "<f8", (LEVELS,)),
+])
+
+
+def parse_book(df) -> np.ndarray:
+    """stock_bid_ask_em 的 item/value 表 -> 形状 (4, LEVELS) 的数组：买价、买量、卖价、卖量"""
+    values = dict(zip(df["item"].to_numpy(), df["value"].to_numpy()))
+    book = np.array([_to_float(values.get(item, 0)) for item in BOOK_ITEMS], dtype="<f8")
+    return book.reshape(4, LEVELS)
+
+
+def _to_float(value) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if value != value else value
+
+
+class OrderBookRing:
+    """单只股票的定长快照环形缓冲"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=SNAPSHOT_DTYPE)
+        self._next = 0
+        self._count = 0
+
+    def push(self, book: np.ndarray, ts: Optional[float] = None):
+        slot = self._buffer[self._next]
+        slot["ts"] = ts if ts is not None else time.time()
+        slot["bid_price"], slot["bid_volume"], slot["ask_price"], slot["ask_volume"] = book
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def view(self, last: Optional[int] = None) -> np.ndarray:
+        """按时间从旧到新返回最近 last 条（拷贝）"""
+        n = self._count if last is None else min(last, self._count)
+        start = (self._next - n) % self.capacity
+        if start + n <= self.capacity:
+            return self._buffer[start:start + n].copy()
+        return np.concatenate((self._buffer[start:], self._buffer[:self._next]))
+
+
+class OrderBookStore:
+    def __init__(self, capacity: int = 120, max_symbols: int = 500):
+        self.capacity = capacity
+        self.max_symbols = max_symbols
+        self._rings: "OrderedDict[str, OrderBookRing]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, code: str, book: np.ndarray, ts: Optional[float] = None):
+        with self._lock:
+            ring = self._rings.get(code)
+            if ring is None:
+                ring = self._rings[code] = OrderBookRing(self.capacity)
+                while len(self._rings) > self.max_symbols:
+                    self._rings.popitem(last=False)
+            else:
+                self._rings.move_to_end(code)
+            ring.push(book, ts)
+
+    def history(self, code: str, last: Optional[int] = None) -> np.ndarray:
+        with self._lock:
+            ring = self._rings.get(code)
+            if ring is None:
+                return np.zeros(0, dtype=SNAPSHOT_DTYPE)
+            return ring.view(last)
+
+    def features(self, code: str, window: int = 20) -> Dict:
+        snaps = self.history(code, window)
+        if len(snaps) == 0:
+            return {}
+        bid_vol = snaps["bid_volume"].sum(axis=1)
+        ask_vol = snaps["ask_volume"].sum(axis=1)
+        total = bid_vol + ask_vol
+        imbalance = np.divide(bid_vol - ask_vol, total, out=np.zeros_like(total), where=total > 0)
+        depth = (snaps["bid_price"] * snaps["bid_volume"]).sum(axis=1) + (snaps["ask_price"] * snaps["ask_volume"]).sum(axis=1)
+
+        latest = snaps[-1]
+        bid1_vol, ask1_vol = latest["bid_volume"][0], latest["ask_volume"][0]
+        l1_total = bid1_vol + ask1_vol
+        bid1, ask1 = latest["bid_price"][0], latest["ask_price"][0]
+        mid = (bid1 + ask1) / 2
+        return {
+            "samples": int(len(snaps)),
+            "span_seconds": round(float(snaps["ts"][-1] - snaps["ts"][0]), 1),
+            "imbalance_l1": round(float((bid1_vol - ask1_vol) / l1_total), 4) if l1_total > 0 else 0.0,
+            "imbalance_l5": round(float(imbalance[-1]), 4),
+            "imbalance_mean": round(float(imbalance.mean()), 4),
+            "imbalance_trend": round(float(imbalance[-1] - imbalance.mean()), 4),
+            "bid_depth": round(float((latest["bid_price"] * latest["bid_volume"]).sum()), 2),
+            "ask_depth": round(float((latest["ask_price"] * latest["ask_volume"]).sum()), 2),
+            "depth_change": round(float(depth[-1] / depth[0] - 1), 4) if depth[0] > 0 else 0.0,
+            "spread_bps": round(float((ask1 - bid1) / mid * 10000), 2) if bid1 > 0 and ask1 > 0 else None,
+        }
+
+
+store = OrderBookStore(
+    capacity=int(os.getenv("ORDERBOOK_CAPACITY", "120")),
+    max_symbols=int(os.getenv("ORDERBOOK_MAX_SYMBOLS", "500")),
+)
@@ -0,0 +1,341 @@
+"""
+实时信号参数寻优 (Parameter Sweep)
+
+对 SignalParams 中的权重/阈值做网格搜索，在股票池的历史数据上回测并按指标排名。
+
+做法：
+1. 拉取股票池日K，按与 RealtimeTradeAnalyzer.calculate_indicators 相同的公式
+   一次性算出 K、RSI6、MACD 交叉、布林位置以及 N 日远期收益。
+   这些指标数值与被寻优的参数无关，只需计算一次。
+2. 把特征矩阵写入 .data/sweep 下的内存映射文件，进程池中的 worker 以只读方式
+   映射同一文件（共享页缓存，不做拷贝、不做 pickle 传输）。
+3. 每个参数组合在全部 (股票, 交易日) 上向量化打分，统计方向准确率、平均收益、夏普等。
+
+换手率、主力资金、盘口委比、盘口缓冲及多周期共振特征属于实时数据，没有可用的历史序列，回测时保持默认值。
+
+用法：
+    python param_sweep.py --symbols 600519,000001,300750
+    python param_sweep.py --hot 100 --workers 8 --rank-by sharpe --top 20
+    python param_sweep.py --hot 100 --grid my_grid.json --save-best .data/sweep/best_params.json
+
+把 --save-best 输出的文件路径配置到环境变量 SIGNAL_PARAMS_PATH 即可在线上生效。
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from signal_params import SignalParams
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SWEEP_DIR = os.path.join(os.getcwd(), ".data", "sweep")
+
+FEATURES = ("k", "rsi6", "macd_cross", "boll_pos", "fwd_ret")
+
+# 默认搜索网格 (约 2.6 万组)，可用 --grid 指定 JSON 文件覆盖
+DEFAULT_GRID = {
+    "kdj_oversold": [15, 20, 25],
+    "kdj_overbought": [75, 80, 85],
+    "kdj_weight": [5, 10, 15, 20],
+    "rsi_oversold": [25, 30, 35],
+    "rsi_overbought": [65, 70, 75],
+    "rsi_weight": [5, 10, 15],
+    "macd_cross_weight": [0, 10, 20],
+    "boll_weight": [0, 8, 16],
+    "buy_band": [55, 60, 65],
+}
+
+RANK_METRICS = ("sharpe", "avg_return", "accuracy")
+
+# worker 进程内的全局状态，由 _init_worker 填充
+_features = None
+_settings = {}
+
+
+def load_universe(symbols: Optional[str], hot: int) -> List[str]:
+    """确定回测股票池"""
+    if symbols:
+        return [s.strip()[-6:] for s in symbols.split(",") if s.strip()]
+    from data_provider import ak
+    df = ak.stock_hot_rank_em().head(hot)
+    codes = []
+    for code in df['代码'].astype(str):
+        if code.upper().startswith(('SH', 'SZ')):
+            code = code[2:]
+        codes.append(code)
+    return codes
+
+
+def feature_frame(df: pd.DataFrame, horizon: int) -> pd.DataFrame:
+    """
+    计算单只股票的特征序列，公式与 RealtimeTradeAnalyzer.calculate_indicators 保持一致
+    """
+    close = df['收盘'].astype(float)
+
+    ema12 = close.ewm(span=12, adjust=False).mean()
+    ema26 = close.ewm(span=26, adjust=False).mean()
+    dif = ema12 - ema26
+    dea = dif.ewm(span=9, adjust=False).mean()
+    golden = (dif.shift(1) < dea.shift(1)) & (dif > dea)
+    death = (dif.shift(1) > dea.shift(1)) & (dif < dea)
+
+    low_list = df['最低'].rolling(window=9, min_periods=9).min()
+    high_list = df['最高'].rolling(window=9, min_periods=9).max()
+    rsv = (close - low_list) / (high_list - low_list) * 100
+    k = rsv.ewm(com=2, adjust=False).mean()
+
+    delta = close.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=6).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=6).mean()
+    rsi6 = 100 - (100 / (1 + gain / loss))
+
+    mid = close.rolling(window=20).mean()
+    std = close.rolling(window=20).std()
+    upper = mid + 2 * std
+    lower = mid - 2 * std
+
+    out = pd.DataFrame({
+        "k": k,
+        "rsi6": rsi6,
+        "macd_cross": golden.astype(float) - death.astype(float),
+        "boll_pos": (close < lower).astype(float) - (close > upper).astype(float),
+        "fwd_ret": close.shift(-horizon) / close - 1,
+    })
+    # 线上要求至少 30 根K线才出指标；末尾 horizon 行没有远期收益
+    out = out.iloc[30:]
+    return out[out['fwd_ret'].notna()]
+
+
+def build_feature_store(codes: List[str], start_date: str, horizon: int, refresh: bool = False) -> Dict:
+    """
+    下载历史并把特征矩阵写入内存映射文件，返回描述该文件的元数据。
+    相同 (股票池, 起始日期, 持有期) 的特征文件会被复用。
+    """
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    key = hashlib.md5(f"{','.join(sorted(codes))}|{start_date}|{horizon}".encode()).hexdigest()[:12]
+    data_path = os.path.join(SWEEP_DIR, f"features_{key}.f8")
+    meta_path = os.path.join(SWEEP_DIR, f"features_{key}.json")
+
+    if not refresh and os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        logger.info(f"Reusing feature store {data_path} ({meta['rows']} rows)")
+        return meta
+
+    from data_provider import ak
+    frames = []
+    used = []
+    for code in codes:
+        try:
+            df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start_date, adjust="qfq")
+            if df.empty or len(df) < 30 + horizon:
+                continue
+            frames.append(feature_frame(df, horizon))
+            used.append(code)
+        except Exception as e:
+            logger.warning(f"Skipping {code}: {e}")
+
+    if not frames:
+        raise RuntimeError("No usable history for the requested universe")
+
+    rows = sum(len(f) for f in frames)
+    mm = np.memmap(data_path, dtype="f8", mode="w+", shape=(len(FEATURES), rows))
+    offset = 0
+    for frame in frames:
+        n = len(frame)
+        mm[:, offset:offset + n] = frame[list(FEATURES)].to_numpy(dtype="f8").T
+        offset += n
+    mm.flush()
+    del mm
+
+    meta = {
+        "path": data_path,
+        "rows": rows,
+        "features": list(FEATURES),
+        "symbols": used,
+        "start_date": start_date,
+        "horizon": horizon,
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    logger.info(f"Built feature store for {len(used)} symbols, {rows} rows -> {data_path}")
+    return meta
+
+
+def open_features(path: str, rows: int) -> np.memmap:
+    """以只读方式映射特征矩阵，多个进程映射同一文件时共享物理内存"""
+    return np.memmap(path, dtype="f8", mode="r", shape=(len(FEATURES), rows))
+
+
+def _init_worker(path: str, rows: int, horizon: int, min_trades: int):
+    global _features, _settings
+    _features = open_features(path, rows)
+    _settings = {"horizon": horizon, "min_trades": min_trades}
+
+
+def _band_term(values: np.ndarray, low: float, high: float, cache: Optional[Dict], key: str) -> np.ndarray:
+    """(values < low) - (values > high)，同一阈值对在 worker 内只计算一次"""
+    cache_key = (key, low, high)
+    if cache is not None and cache_key in cache:
+        return cache[cache_key]
+    term = (values < low).astype("f4") - (values > high)
+    if cache is not None:
+        cache[cache_key] = term
+    return term
+
+
+def evaluate(params: SignalParams, feats: np.ndarray, horizon: int, min_trades: int,
+             cache: Optional[Dict] = None) -> Optional[Dict]:
+    """在全部样本上向量化打分并统计回测指标"""
+    k, rsi6, cross, boll, fwd = feats
+
+    score = np.full(k.shape, float(params.base_score), dtype="f4")
+    score += params.macd_cross_weight * cross
+    score += params.kdj_weight * _band_term(k, params.kdj_oversold, params.kdj_overbought, cache, "kdj")
+    score += params.rsi_weight * _band_term(rsi6, params.rsi_oversold, params.rsi_overbought, cache, "rsi")
+    score += params.boll_weight * boll
+    np.clip(score, 0, 100, out=score)
+
+    # 买入评级做多、卖出评级做空、观望不计
+    direction = (score >= params.buy_band).astype("i1") - (score < params.hold_band)
+    mask = direction != 0
+    trades = int(mask.sum())
+    if trades < min_trades:
+        return None
+
+    realized = direction[mask] * fwd[mask]
+    buys = direction == 1
+    sells = direction == -1
+    std = realized.std()
+    return {
+        "trades": trades,
+        "buys": int(buys.sum()),
+        "sells": int(sells.sum()),
+        "accuracy": float((realized > 0).mean()),
+        "buy_hit_rate": float((fwd[buys] > 0).mean()) if buys.any() else None,
+        "sell_hit_rate": float((fwd[sells] < 0).mean()) if sells.any() else None,
+        "avg_return": float(realized.mean()),
+        "sharpe": float(realized.mean() / std * math.sqrt(252 / horizon)) if std > 0 else 0.0,
+    }
+
+
+def _run_chunk(chunk: List[Dict]) -> List[Dict]:
+    feats = np.asarray(_features)
+    cache = _settings.setdefault("term_cache", {})
+    results = []
+    for overrides in chunk:
+        params = SignalParams.from_dict(overrides)
+        metrics = evaluate(params, feats, _settings["horizon"], _settings["min_trades"], cache)
+        if metrics is not None:
+            results.append({"params": overrides, "metrics": metrics})
+    return results
+
+
+def expand_grid(grid: Dict[str, List]) -> List[Dict]:
+    names = sorted(grid)
+    combos = []
+    for values in itertools.product(*(grid[n] for n in names)):
+        combo = dict(zip(names, values))
+        # 过滤掉阈值倒挂的无效组合
+        if combo.get("kdj_oversold", 0) >= combo.get("kdj_overbought", 100):
+            continue
+        if combo.get("rsi_oversold", 0) >= combo.get("rsi_overbought", 100):
+            continue
+        if combo.get("hold_band", 40) > combo.get("buy_band", 60):
+            continue
+        combos.append(combo)
+    return combos
+
+
+def sweep(meta: Dict, grid: Dict[str, List], workers: int, min_trades: int, chunk_size: int = 200) -> List[Dict]:
+    combos = expand_grid(grid)
+    chunks = [combos[i:i + chunk_size] for i in range(0, len(combos), chunk_size)]
+    logger.info(f"Evaluating {len(combos)} combinations on {meta['rows']} samples with {workers} workers")
+
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(meta["path"], meta["rows"], meta["horizon"], min_trades),
+    ) as pool:
+        futures = [pool.submit(_run_chunk, chunk) for chunk in chunks]
+        for i, future in enumerate(as_completed(futures), 1):
+            results.extend(future.result())
+            if i % 20 == 0 or i == len(futures):
+                logger.info(f"{i}/{len(futures)} chunks done ({time.perf_counter() - started:.1f}s)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid-search SignalParams over historical bars")
+    parser.add_argument("--symbols", help="逗号分隔的股票代码，缺省使用人气榜")
+    parser.add_argument("--hot", type=int, default=50, help="未指定 --symbols 时取人气榜前 N 只")
+    parser.add_argument("--start", default="20200101", help="历史起始日期 YYYYMMDD")
+    parser.add_argument("--horizon", type=int, default=5, help="持有天数 (远期收益窗口)")
+    parser.add_argument("--grid", help="JSON 网格文件 {param: [values]}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--min-trades", type=int, default=200)
+    parser.add_argument("--rank-by", choices=RANK_METRICS, default="sharpe")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--refresh", action="store_true", help="忽略已有特征文件，重新下载")
+    parser.add_argument("--out", default=os.path.join(SWEEP_DIR, "results.json"))
+    parser.add_argument("--save-best", help="把排名第一的参数写入该路径 (供 SIGNAL_PARAMS_PATH 使用)")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+
+    codes = load_universe(args.symbols, args.hot)
+    meta = build_feature_store(codes, args.start, args.horizon, refresh=args.refresh)
+
+    started = time.perf_counter()
+    results = sweep(meta, grid, args.workers, args.min_trades)
+    elapsed = time.perf_counter() - started
+    results.sort(key=lambda r: r["metrics"][args.rank_by], reverse=True)
+
+    baseline = evaluate(SignalParams(), np.asarray(open_features(meta["path"], meta["rows"])), args.horizon, 0)
+    report = {
+        "symbols": meta["symbols"],
+        "samples": meta["rows"],
+        "horizon": args.horizon,
+        "rank_by": args.rank_by,
+        "evaluated": len(expand_grid(grid)),
+        "elapsed_seconds": round(elapsed, 2),
+        "baseline": baseline,
+        "top": results[:args.top],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"Evaluated {report['evaluated']} combinations in {elapsed:.1f}s")
+    print(f"Baseline: {baseline}")
+    for i, r in enumerate(results[:args.top], 1):
+        m = r["metrics"]
+        print(f"{i:>3}. sharpe={m['sharpe']:.2f} avg={m['avg_return'] * 100:.2f}% acc={m['accuracy'] * 100:.1f}% "
+              f"trades={m['trades']} {r['params']}")
+
+    if args.save_best and results:
+        best = SignalParams.from_dict(results[0]["params"])
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_best)), exist_ok=True)
+        with open(args.save_best, "w", encoding="utf-8") as f:
+            json.dump({"params": best.to_dict(), "metrics": results[0]["metrics"]}, f, ensure_ascii=False, indent=2)
+        print(f"Best params saved to {args.save_best}")
+
+
+if __name__ == "__main__":
+    main()
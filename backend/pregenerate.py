@@ -0,0 +1,178 @@
+"""
+收盘后批量预生成分析报告 (Pre-generation)
+
+对人气榜前 N 只与当日推荐股票提前跑一遍直接分析，结果写入 report_store，
+下一个交易时段内 /api/analyze 对这些股票直接返回存储的报告，不再现场调用 LLM。
+每次运行后还会结算交易信号准确率（signal_store.update_accuracy）。
+
+流水线分两段：
+1. 行情拉取 + 指标计算 + 构建 prompt：线程池并发 (--fetch-workers)，受上游限速保护。
+2. LLM 生成：异步并发 (--llm-concurrency)，请求以后台优先级进入 llm_gateway，
+   与白天的交互请求共用网关时也不会挤占交互预留。
+失败的股票只记日志，不写入存储，线上请求会照常现场生成。
+
+用法：
+    python pregenerate.py                       # 人气榜前 50 + 推荐股票
+    python pregenerate.py --top 100 --llm-concurrency 4
+    python pregenerate.py --symbols 600519,000001 --force
+    python pregenerate.py --daemon --at 15:40   # 常驻，每个交易日收盘后运行一次
+
+也可以用 cron 调度，例如：
+    40 15 * * 1-5  cd /path/to/backend && python pregenerate.py >> .data/pregenerate.log 2>&1
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import cache_policy
+import report_store
+import signal_store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_targets(symbols: Optional[str], top: int, recommended: bool = True) -> List[str]:
+    """确定预生成股票池：人气榜前 N 只 + 推荐股票，去重并保持顺序"""
+    if symbols:
+        return list(dict.fromkeys(s.strip()[-6:] for s in symbols.split(",") if s.strip()))
+
+    import shared_snapshot
+    codes = []
+    try:
+        rank = shared_snapshot.head(shared_snapshot.hot_rank, top)
+        if rank is None:
+            raise RuntimeError("hot rank snapshot unavailable")
+        codes.extend(row["code"] for row in rank["rows"])
+    except Exception as e:
+        logger.warning(f"Failed to fetch hot rank: {e}")
+    if recommended:
+        try:
+            from app import _get_recommended_stocks
+            codes.extend(item["code"] for item in _get_recommended_stocks())
+        except Exception as e:
+            logger.warning(f"Failed to fetch recommended stocks: {e}")
+    return list(dict.fromkeys(codes))
+
+
+def prepare(symbol: str) -> Dict:
+    """第一段：拉取数据、计算指标并构建 prompt"""
+    from direct_analysis import build_report_prompt, compute_report_indicators, fetch_report_data, require_market_data
+    data = fetch_report_data(symbol)
+    quant_data = compute_report_indicators(data)
+    # 没有行情数据的报告会在下一个交易时段内被当作有效报告返回，宁可不存
+    require_market_data(data, quant_data)
+    return {"symbol": symbol, "prompt": build_report_prompt(symbol, data, quant_data)}
+
+
+async def run_pipeline(codes: List[str], fetch_workers: int, llm_concurrency: int, force: bool = False) -> Dict:
+    from direct_analysis import acall_report_llm
+    from llm_gateway import BACKGROUND
+
+    if not force:
+        skipped = [c for c in codes if report_store.load_fresh(c) is not None]
+        codes = [c for c in codes if c not in skipped]
+    else:
+        skipped = []
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(llm_concurrency)
+    results = {"generated": [], "failed": {}, "skipped": skipped}
+
+    async def generate(symbol: str, pool: ThreadPoolExecutor):
+        started = time.perf_counter()
+        try:
+            prepared = await loop.run_in_executor(pool, prepare, symbol)
+        except Exception as e:
+            logger.warning(f"Data preparation failed for {symbol}: {e}")
+            results["failed"][symbol] = f"data: {e}"
+            return
+        # 数据准备与 LLM 生成重叠进行：信号量只限制同时在途的 LLM 请求数
+        async with semaphore:
+            llm_started = time.perf_counter()
+            try:
+                report = await acall_report_llm(prepared["prompt"], level=BACKGROUND)
+            except Exception as e:
+                logger.warning(f"LLM generation failed for {symbol}: {e}")
+                results["failed"][symbol] = f"llm: {e}"
+                return
+        report_store.save(symbol, report, {
+            "mode": "direct",
+            "llm_seconds": round(time.perf_counter() - llm_started, 2),
+            "total_seconds": round(time.perf_counter() - started, 2),
+        })
+        results["generated"].append(symbol)
+        logger.info(f"Pre-generated report for {symbol} in {time.perf_counter() - started:.1f}s")
+
+    with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="pregen-fetch") as pool:
+        await asyncio.gather(*(generate(code, pool) for code in codes))
+    return results
+
+
+def run_once(args) -> Dict:
+    codes = load_targets(args.symbols, args.top, recommended=not args.no_recommended)
+    logger.info(f"Pre-generating reports for {len(codes)} stocks")
+    started = time.perf_counter()
+    results = asyncio.run(run_pipeline(codes, args.fetch_workers, args.llm_concurrency, force=args.force))
+    summary = {
+        "date": cache_policy.market_today().isoformat(),
+        "targets": len(codes),
+        "generated": len(results["generated"]),
+        "skipped": len(results["skipped"]),
+        "failed": results["failed"],
+        "elapsed_seconds": round(time.perf_counter() - started, 2),
+    }
+    try:
+        # 同一收盘后时点顺带结算交易信号准确率
+        summary["signal_accuracy"] = signal_store.update_accuracy()["last_30_days"]
+    except Exception as e:
+        logger.warning(f"Failed to update signal accuracy: {e}")
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return summary
+
+
+def _next_run(at: datetime.time, now: datetime.datetime) -> datetime.datetime:
+    candidate = datetime.datetime.combine(now.date(), at)
+    if candidate <= now:
+        candidate += datetime.timedelta(days=1)
+    if not cache_policy.calendar.is_trading_day(candidate.date()):
+        candidate = datetime.datetime.combine(cache_policy.calendar.next_trading_day(candidate.date()), at)
+    return candidate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate analysis reports after market close")
+    parser.add_argument("--symbols", help="逗号分隔的股票代码，缺省使用人气榜 + 推荐股票")
+    parser.add_argument("--top", type=int, default=int(os.getenv("PREGENERATE_TOP", "50")), help="人气榜前 N 只")
+    parser.add_argument("--no-recommended", action="store_true", help="不包含 /api/recommend 的推荐股票")
+    parser.add_argument("--fetch-workers", type=int, default=4, help="行情拉取并发数")
+    parser.add_argument("--llm-concurrency", type=int, default=int(os.getenv("PREGENERATE_LLM_CONCURRENCY", "4")),
+                        help="同时在途的 LLM 请求数")
+    parser.add_argument("--force", action="store_true", help="已有本时段有效报告的股票也重新生成")
+    parser.add_argument("--daemon", action="store_true", help="常驻进程，每个交易日 --at 时刻运行一次")
+    parser.add_argument("--at", default=os.getenv("PREGENERATE_AT", "15:40"), help="--daemon 的运行时刻 HH:MM")
+    args = parser.parse_args()
+
+    if not args.daemon:
+        summary = run_once(args)
+        raise SystemExit(1 if summary["targets"] and not summary["generated"] and not summary["skipped"] else 0)
+
+    at = datetime.datetime.strptime(args.at, "%H:%M").time()
+    while True:
+        next_run = _next_run(at, cache_policy.market_now())
+        logger.info(f"Next pre-generation run at {next_run.isoformat(timespec='minutes')}")
+        time.sleep(max(0.0, (next_run - cache_policy.market_now()).total_seconds()))
+        try:
+            run_once(args)
+        except Exception as e:
+            logger.error(f"Pre-generation run failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
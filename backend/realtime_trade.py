@@ -1,68 +1,76 @@
 import logging
-import akshare as ak
+from data_provider import ak, staleness
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import json
+from signal_params import SignalParams
+import fund_flow
+import indicators
+import kline_store
+import multi_timeframe
+import orderbook
+import shared_snapshot
+import signal_store
+from timing import span
 
 logger = logging.getLogger(__name__)
 
+# compute_indicators 用到的指标，由 indicators 注册表按依赖一次求值
+INDICATOR_SET = ["MA5", "MA10", "MA20", "MA60", "MACD", "KDJ", "RSI6", "RSI14", "BOLL", "OBV"]
+
+
+def _mark_stale(data: Dict, df) -> Dict:
+    """上游熔断时返回的是旧数据，在结果里带上过期信息"""
+    stale = staleness(df)
+    if stale and data:
+        data["stale"] = stale
+    return data
+
 class RealtimeTradeAnalyzer:
-    def __init__(self):
-        self.history_accuracy = {
-            "total_predictions": 0,
-            "correct_predictions": 0,
-            "avg_return": 0.0,
-            "last_30_days": []
-        }
+    def __init__(self, params: Optional[SignalParams] = None):
+        self.params = params or SignalParams.load()
     
     def get_realtime_data(self, code: str) -> Dict:
+        return self._collect_realtime(code)[0]
+    
+    def _collect_realtime(self, code: str) -> Tuple[Dict, Optional[pd.DataFrame]]:
+        """实时数据汇总，以及原始 1 分钟K线（供多周期分析复用，不再重复拉取）"""
         try:
             code = code[-6:]
             
             spot_data = {}
             try:
-                df_spot = ak.stock_zh_a_spot_em()
-                stock_row = df_spot[df_spot['代码'] == code]
-                if not stock_row.empty:
-                    row = stock_row.iloc[0]
-                    spot_data = {
-                        "code": code,
-                        "name": row.get('名称', ''),
-                        "price": float(row.get('最新价', 0)),
-                        "open": float(row.get('今开', 0)),
-                        "high": float(row.get('最高', 0)),
-                        "low": float(row.get('最低', 0)),
-                        "volume": float(row.get('成交量', 0)),
-                        "amount": float(row.get('成交额', 0)),
-                        "change_pct": float(row.get('涨跌幅', 0)),
-                        "change_amt": float(row.get('涨跌额', 0)),
-                        "turnover_rate": float(row.get('换手率', 0)) if '换手率' in row else 0,
-                        "pe_ratio": float(row.get('市盈率-动态', 0)) if '市盈率-动态' in row else 0,
-                        "pb_ratio": float(row.get('市净率', 0)) if '市净率' in row else 0,
-                        "total_mv": float(row.get('总市值', 0)) if '总市值' in row else 0,
-                        "circ_mv": float(row.get('流通市值', 0)) if '流通市值' in row else 0,
-                    }
+                # 全市场快照由共享快照的 leader 进程统一刷新，这里只按代码查一行
+                row = shared_snapshot.spot_row(code)
+                if row is not None:
+                    spot_data = {"code": code, "name": row["name"]}
+                    spot_data.update({field: float(row[field]) for field in shared_snapshot.SPOT_NUMERIC})
+                    spot_data["as_of"] = row["as_of"]
+                    if row.get("stale"):
+                        spot_data["stale"] = row["stale"]
             except Exception as e:
                 logger.warning(f"Failed to get spot data: {e}")
             
             bid_ask_data = self._get_bid_ask_data(code)
             
-            minute_data = self._get_minute_data(code)
+            minute_df = self._fetch_minute(code)
+            minute_data = self._summarize_minute(minute_df)
             
             flow_data = self._get_money_flow(code)
             
             return {
                 "spot": spot_data,
                 "bid_ask": bid_ask_data,
+                "order_book": orderbook.store.features(code, self.params.ob_window),
                 "minute": minute_data,
                 "money_flow": flow_data,
                 "timestamp": datetime.now().isoformat()
-            }
+            }, minute_df
         except Exception as e:
             logger.error(f"Error getting realtime data: {e}")
-            return {"error": str(e)}
+            return {"error": str(e)}, None
     
     def _get_bid_ask_data(self, code: str) -> Dict:
         try:
@@ -70,51 +78,39 @@ class RealtimeTradeAnalyzer:
             if df.empty:
                 return {}
             
-            data = {}
-            for _, row in df.iterrows():
-                item = row['item']
-                value = row['value']
-                data[item] = value
+            book = orderbook.parse_book(df)
+            if staleness(df) is None:
+                # 熔断返回的旧盘口不进入环形缓冲，避免污染滚动特征
+                orderbook.store.record(code, book)
             
-            return {
-                "bid1_price": float(data.get('买一', 0)),
-                "bid1_volume": float(data.get('买一量', 0)),
-                "bid2_price": float(data.get('买二', 0)),
-                "bid2_volume": float(data.get('买二量', 0)),
-                "bid3_price": float(data.get('买三', 0)),
-                "bid3_volume": float(data.get('买三量', 0)),
-                "bid4_price": float(data.get('买四', 0)),
-                "bid4_volume": float(data.get('买四量', 0)),
-                "bid5_price": float(data.get('买五', 0)),
-                "bid5_volume": float(data.get('买五量', 0)),
-                "ask1_price": float(data.get('卖一', 0)),
-                "ask1_volume": float(data.get('卖一量', 0)),
-                "ask2_price": float(data.get('卖二', 0)),
-                "ask2_volume": float(data.get('卖二量', 0)),
-                "ask3_price": float(data.get('卖三', 0)),
-                "ask3_volume": float(data.get('卖三量', 0)),
-                "ask4_price": float(data.get('卖四', 0)),
-                "ask4_volume": float(data.get('卖四量', 0)),
-                "ask5_price": float(data.get('卖五', 0)),
-                "ask5_volume": float(data.get('卖五量', 0)),
-            }
+            data = {}
+            for side, prices, volumes in (("bid", book[0], book[1]), ("ask", book[2], book[3])):
+                for level in range(orderbook.LEVELS):
+                    data[f"{side}{level + 1}_price"] = float(prices[level])
+                    data[f"{side}{level + 1}_volume"] = float(volumes[level])
+            return _mark_stale(data, df)
         except Exception as e:
             logger.warning(f"Failed to get bid-ask data: {e}")
             return {}
     
-    def _get_minute_data(self, code: str) -> Dict:
+    def _fetch_minute(self, code: str) -> Optional[pd.DataFrame]:
         try:
             df = ak.stock_zh_a_hist_min_em(symbol=code, period="1", adjust="qfq")
-            if df.empty:
-                return {}
-            
-            df['time'] = pd.to_datetime(df['时间'])
+            return None if df.empty else df
+        except Exception as e:
+            logger.warning(f"Failed to get minute data: {e}")
+            return None
+    
+    def _summarize_minute(self, df: Optional[pd.DataFrame]) -> Dict:
+        if df is None:
+            return {}
+        try:
             latest = df.iloc[-1]
             
             avg_price = df['收盘'].mean()
             total_volume = df['成交量'].sum()
             
-            return {
+            return _mark_stale({
                 "latest_price": float(latest['收盘']),
                 "latest_volume": float(latest['成交量']),
                 "avg_price": float(avg_price),
@@ -122,72 +118,47 @@ class RealtimeTradeAnalyzer:
                 "high": float(df['最高'].max()),
                 "low": float(df['最低'].min()),
                 "data_points": len(df)
-            }
+            }, df)
         except Exception as e:
             logger.warning(f"Failed to get minute data: {e}")
             return {}
     
     def _get_money_flow(self, code: str) -> Dict:
         try:
-            df = ak.stock_individual_fund_flow(stock=code, market="sh" if code.startswith("6") else "sz")
-            if df.empty:
+            # 全市场资金流排行由共享快照的 leader 进程按间隔刷新，这里只按代码查一行
+            row = fund_flow.flow_row(code)
+            if row is None:
                 return {}
-            
-            latest = df.iloc[-1]
-            return {
-                "main_net_inflow": float(latest.get('主力净流入-净额', 0)),
-                "main_net_inflow_pct": float(latest.get('主力净流入-净占比', 0)),
-                "retail_net_inflow": float(latest.get('散户净流入-净额', 0)),
-                "retail_net_inflow_pct": float(latest.get('散户净流入-净占比', 0)),
-            }
+            flow = {field: float(row[field]) for field in fund_flow.FLOW_NUMERIC}
+            flow["as_of"] = row["as_of"]
+            if row.get("stale"):
+                flow["stale"] = row["stale"]
+            return flow
         except Exception as e:
             logger.warning(f"Failed to get money flow: {e}")
             return {}
     
+    def _fetch_daily(self, code: str) -> Optional[pd.DataFrame]:
+        try:
+            return kline_store.daily_bars(code, adjust="qfq", start_date="20230101")
+        except Exception as e:
+            logger.error(f"Error calculating indicators: {e}")
+            return None
+    
     def calculate_indicators(self, code: str) -> Dict:
+        df = self._fetch_daily(code)
+        return self.compute_indicators(df) if df is not None else {}
+    
+    def compute_indicators(self, df: pd.DataFrame) -> Dict:
         try:
-            df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date="20230101", adjust="qfq")
             if df.empty or len(df) < 30:
                 return {}
             
-            df['MA5'] = df['收盘'].rolling(window=5).mean()
-            df['MA10'] = df['收盘'].rolling(window=10).mean()
-            df['MA20'] = df['收盘'].rolling(window=20).mean()
-            df['MA60'] = df['收盘'].rolling(window=60).mean()
-            
-            df['EMA12'] = df['收盘'].ewm(span=12, adjust=False).mean()
-            df['EMA26'] = df['收盘'].ewm(span=26, adjust=False).mean()
-            df['DIF'] = df['EMA12'] - df['EMA26']
-            df['DEA'] = df['DIF'].ewm(span=9, adjust=False).mean()
-            df['MACD'] = 2 * (df['DIF'] - df['DEA'])
-            
-            low_list = df['最低'].rolling(window=9, min_periods=9).min()
-            high_list = df['最高'].rolling(window=9, min_periods=9).max()
-            rsv = (df['收盘'] - low_list) / (high_list - low_list) * 100
-            df['K'] = rsv.ewm(com=2, adjust=False).mean()
-            df['D'] = df['K'].ewm(com=2, adjust=False).mean()
-            df['J'] = 3 * df['K'] - 2 * df['D']
-            
-            delta = df['收盘'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=6).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=6).mean()
-            rs = gain / loss
-            df['RSI6'] = 100 - (100 / (1 + rs))
-            
-            delta14 = df['收盘'].diff()
-            gain14 = (delta14.where(delta14 > 0, 0)).rolling(window=14).mean()
-            loss14 = (-delta14.where(delta14 < 0, 0)).rolling(window=14).mean()
-            rs14 = gain14 / loss14
-            df['RSI14'] = 100 - (100 / (1 + rs14))
-            
-            df['MID'] = df['收盘'].rolling(window=20).mean()
-            df['UPPER'] = df['MID'] + 2 * df['收盘'].rolling(window=20).std()
-            df['LOWER'] = df['MID'] - 2 * df['收盘'].rolling(window=20).std()
-            
-            df['OBV'] = (np.sign(df['收盘'].diff()) * df['成交量']).fillna(0).cumsum()
-            
-            latest = df.iloc[-1]
-            prev = df.iloc[-2]
+            values = indicators.evaluate(df, INDICATOR_SET)
+            latest = {name: series.iloc[-1] for name, series in values.items()}
+            prev = {name: series.iloc[-2] for name, series in values.items()}
+            latest['收盘'] = df['收盘'].iloc[-1]
+            p = self.params
             
             return {
                 "MA": {
@@ -207,12 +178,12 @@ class RealtimeTradeAnalyzer:
                     "K": round(latest['K'], 2),
                     "D": round(latest['D'], 2),
                     "J": round(latest['J'], 2),
-                    "signal": "超买" if latest['K'] > 80 else "超卖" if latest['K'] < 20 else "正常"
+                    "signal": "超买" if latest['K'] > p.kdj_overbought else "超卖" if latest['K'] < p.kdj_oversold else "正常"
                 },
                 "RSI": {
                     "RSI6": round(latest['RSI6'], 2),
                     "RSI14": round(latest['RSI14'], 2),
-                    "signal": "超买" if latest['RSI6'] > 70 else "超卖" if latest['RSI6'] < 30 else "正常"
+                    "signal": "超买" if latest['RSI6'] > p.rsi_overbought else "超卖" if latest['RSI6'] < p.rsi_oversold else "正常"
                 },
                 "BOLL": {
                     "UPPER": round(latest['UPPER'], 2),
@@ -223,7 +194,7 @@ class RealtimeTradeAnalyzer:
                 },
                 "OBV": {
                     "value": round(latest['OBV'], 0),
-                    "trend": "上升" if latest['OBV'] > df.iloc[-5]['OBV'] else "下降"
+                    "trend": "上升" if latest['OBV'] > values['OBV'].iloc[-5] else "下降"
                 }
             }
         except Exception as e:
@@ -232,10 +203,17 @@ class RealtimeTradeAnalyzer:
     
     def generate_trade_signal(self, code: str) -> Dict:
         try:
-            realtime_data = self.get_realtime_data(code)
-            indicators = self.calculate_indicators(code)
-            
-            score = 50
+            with span("realtime"):
+                realtime_data, minute_df = self._collect_realtime(code)
+            with span("indicators"):
+                daily_df = self._fetch_daily(code)
+                indicators = self.compute_indicators(daily_df) if daily_df is not None else {}
+            with span("timeframes"):
+                # 分钟/日K都来自上面已拉取的数据，本地聚合，不再请求上游
+                timeframes = self._analyze_timeframes(minute_df, daily_df)
+            p = self.params
+            
+            score = p.base_score
             reasons = []
             risk_warnings = []
             
@@ -245,7 +223,7 @@ class RealtimeTradeAnalyzer:
                 change_pct = spot.get('change_pct', 0)
                 turnover_rate = spot.get('turnover_rate', 0)
                 
-                if abs(change_pct) >= 9.9:
+                if abs(change_pct) >= p.limit_pct:
                     if change_pct > 0:
                         return {
                             "action": "观望",
@@ -265,11 +243,11 @@ class RealtimeTradeAnalyzer:
                             "special_status": "跌停"
                         }
                 
-                if turnover_rate > 20:
-                    score += 5
+                if turnover_rate > p.turnover_high:
+                    score += p.turnover_weight
                     reasons.append(f"换手率{turnover_rate:.1f}%较高，市场活跃")
-                elif turnover_rate < 3:
-                    score -= 5
+                elif turnover_rate < p.turnover_low:
+                    score -= p.turnover_weight
                     reasons.append(f"换手率{turnover_rate:.1f}%较低，流动性不足")
             
             money_flow = realtime_data.get('money_flow', {})
@@ -277,11 +255,11 @@ class RealtimeTradeAnalyzer:
                 main_inflow = money_flow.get('main_net_inflow', 0)
                 main_inflow_pct = money_flow.get('main_net_inflow_pct', 0)
                 
-                if main_inflow > 0 and main_inflow_pct > 5:
-                    score += 15
+                if main_inflow > 0 and main_inflow_pct > p.main_inflow_pct:
+                    score += p.main_inflow_weight
                     reasons.append(f"主力净流入{main_inflow/10000:.0f}万，占比{main_inflow_pct:.1f}%")
-                elif main_inflow < 0 and main_inflow_pct < -5:
-                    score -= 15
+                elif main_inflow < 0 and main_inflow_pct < -p.main_inflow_pct:
+                    score -= p.main_inflow_weight
                     reasons.append(f"主力净流出{abs(main_inflow)/10000:.0f}万，占比{abs(main_inflow_pct):.1f}%")
             
             bid_ask = realtime_data.get('bid_ask', {})
@@ -293,68 +271,76 @@ class RealtimeTradeAnalyzer:
                 
                 if bid_vol > 0 and ask_vol > 0:
                     bid_ask_ratio = bid_vol / ask_vol
-                    if bid_ask_ratio > 1.5:
-                        score += 10
+                    if bid_ask_ratio > p.bid_ask_strong:
+                        score += p.bid_ask_weight
                         reasons.append(f"买盘力量较强，委比{bid_ask_ratio:.2f}")
-                    elif bid_ask_ratio < 0.67:
-                        score -= 10
+                    elif bid_ask_ratio < p.bid_ask_weak:
+                        score -= p.bid_ask_weight
                         reasons.append(f"卖盘压力较大，委比{bid_ask_ratio:.2f}")
             
+            order_book = realtime_data.get('order_book', {})
+            if order_book.get('samples', 0) >= p.ob_min_samples:
+                imbalance = order_book['imbalance_mean']
+                if imbalance > p.ob_imbalance:
+                    score += p.ob_imbalance_weight
+                    reasons.append(f"近{order_book['samples']}次盘口买方持续占优，失衡度{imbalance:.2f}")
+                elif imbalance < -p.ob_imbalance:
+                    score -= p.ob_imbalance_weight
+                    reasons.append(f"近{order_book['samples']}次盘口卖方持续占优，失衡度{imbalance:.2f}")
+                
+                depth_change = order_book['depth_change']
+                if depth_change < -p.ob_depth_drop:
+                    score -= p.ob_depth_weight
+                    reasons.append(f"五档挂单金额下降{abs(depth_change) * 100:.0f}%，流动性变薄")
+            
             if indicators:
                 macd = indicators.get('MACD', {})
                 if macd.get('signal') == '金叉':
-                    score += 10
+                    score += p.macd_cross_weight
                     reasons.append("MACD金叉，短期趋势向好")
                 elif macd.get('signal') == '死叉':
-                    score -= 10
+                    score -= p.macd_cross_weight
                     reasons.append("MACD死叉，短期趋势转弱")
                 
                 kdj = indicators.get('KDJ', {})
                 k_value = kdj.get('K', 50)
-                if k_value < 20:
-                    score += 15
+                if k_value < p.kdj_oversold:
+                    score += p.kdj_weight
                     reasons.append(f"KDJ超卖(K={k_value:.1f})，存在反弹机会")
-                elif k_value > 80:
-                    score -= 15
+                elif k_value > p.kdj_overbought:
+                    score -= p.kdj_weight
                     reasons.append(f"KDJ超买(K={k_value:.1f})，注意回调风险")
                 
                 rsi = indicators.get('RSI', {})
                 rsi6 = rsi.get('RSI6', 50)
-                if rsi6 < 30:
-                    score += 10
+                if rsi6 < p.rsi_oversold:
+                    score += p.rsi_weight
                     reasons.append(f"RSI超卖(RSI6={rsi6:.1f})")
-                elif rsi6 > 70:
-                    score -= 10
+                elif rsi6 > p.rsi_overbought:
+                    score -= p.rsi_weight
                     reasons.append(f"RSI超买(RSI6={rsi6:.1f})")
                 
                 boll = indicators.get('BOLL', {})
                 position = boll.get('position', '')
                 if position == '下轨下方':
-                    score += 8
+                    score += p.boll_weight
                     reasons.append("股价跌破布林下轨，可能超跌")
                 elif position == '上轨上方':
-                    score -= 8
+                    score -= p.boll_weight
                     reasons.append("股价突破布林上轨，可能超买")
             
-            score = max(0, min(100, score))
+            agreement = timeframes.get('confluence', {})
+            if agreement.get('timeframes', 0) >= p.mtf_min_timeframes:
+                if agreement['agreement'] >= p.mtf_agreement:
+                    score += p.mtf_weight
+                    reasons.append(f"{agreement['bullish']}/{agreement['timeframes']}个周期同时看多，多周期共振")
+                elif agreement['agreement'] <= -p.mtf_agreement:
+                    score -= p.mtf_weight
+                    reasons.append(f"{agreement['bearish']}/{agreement['timeframes']}个周期同时看空，多周期共振")
             
-            if score >= 80:
-                action = "强烈买入"
-                confidence = 85 + (score - 80) * 1.5
-            elif score >= 60:
-                action = "谨慎买入"
-                confidence = 70 + (score - 60) * 0.75
-            elif score >= 40:
-                action = "观望"
-                confidence = 60
-            elif score >= 20:
-                action = "谨慎卖出"
-                confidence = 70 + (40 - score) * 0.75
-            else:
-                action = "强烈卖出"
-                confidence = 85 + (20 - score) * 1.5
+            score = max(0, min(100, score))
             
-            confidence = min(98, confidence)
+            action, confidence = p.classify(score)
             
             if len(reasons) < 3:
                 if "主力" not in str(reasons):
@@ -367,14 +353,19 @@ class RealtimeTradeAnalyzer:
                 "AI建议仅供参考，不构成投资建议",
                 "请结合自身风险承受能力做出决策"
             ]
+            stale_sections = [name for name, section in realtime_data.items()
+                              if isinstance(section, dict) and section.get("stale")]
+            if stale_sections:
+                risk_warnings.insert(0, "行情接口暂不可用，部分数据为缓存旧数据")
             
-            return {
+            result = {
                 "action": action,
                 "score": score,
                 "confidence": round(confidence, 1),
                 "reasons": reasons[:3],
                 "risk_warnings": risk_warnings,
                 "indicators_summary": indicators,
+                "timeframes": timeframes,
                 "realtime_data_summary": {
                     "price": spot.get('price', 0),
                     "change_pct": spot.get('change_pct', 0),
@@ -384,6 +375,9 @@ class RealtimeTradeAnalyzer:
                 "timestamp": datetime.now().isoformat(),
                 "disclaimer": "AI建议仅供参考，不构成投资建议，投资有风险"
             }
+            if stale_sections:
+                result["stale_sections"] = stale_sections
+            return result
             
         except Exception as e:
             logger.error(f"Error generating trade signal: {e}")
@@ -396,24 +390,27 @@ class RealtimeTradeAnalyzer:
                 "error": str(e)
             }
     
+    def _analyze_timeframes(self, minute_df: Optional[pd.DataFrame], daily_df: Optional[pd.DataFrame]) -> Dict:
+        try:
+            return _mark_stale(multi_timeframe.analyze(minute_df, daily_df), minute_df)
+        except Exception as e:
+            logger.warning(f"Failed to analyze timeframes: {e}")
+            return {}
+    
     def get_history_accuracy(self) -> Dict:
-        return {
-            "total_predictions": 156,
-            "correct_predictions": 98,
-            "accuracy_rate": 62.8,
-            "avg_return": 2.3,
-            "last_30_days": {
-                "total": 45,
-                "correct": 29,
-                "accuracy_rate": 64.4,
-                "avg_return": 2.8
-            }
-        }
+        """已记录信号的实际准确率，由收盘后的统计任务更新"""
+        return signal_store.accuracy()
 
 trade_analyzer = RealtimeTradeAnalyzer()
 
 def get_trade_signal(code: str) -> Dict:
-    return trade_analyzer.generate_trade_signal(code)
+    signal = trade_analyzer.generate_trade_signal(code)
+    # 只入队，落盘在后台线程
+    signal_store.record(code, signal)
+    return signal
+
+def get_history_accuracy() -> Dict:
+    return trade_analyzer.get_history_accuracy()
 
 def get_realtime_data(code: str) -> Dict:
     return trade_analyzer.get_realtime_data(code)
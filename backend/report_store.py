@@ -0,0 +1,67 @@
+"""
+预生成分析报告存储
+
+每只股票一份 JSON（.data/reports/<code>.json），由 pregenerate.py 在收盘后写入。
+收盘后生成的报告在下一个交易时段内有效：只要生成时间晚于最近一次收盘（交易日 15:00），
+/api/analyze 的直接分析就直接返回存储的报告。
+"""
+import datetime
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+import cache_policy
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REPORT_DIR = os.path.join(os.getcwd(), ".data", "reports")
+
+
+def last_close(now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """不晚于 now 的最近一次收盘时间（交易日 15:00，节假日按交易日历跳过）"""
+    return cache_policy.calendar.last_close(now or cache_policy.market_now())
+
+
+def _path(code: str, report_dir: str) -> str:
+    return os.path.join(report_dir, f"{code[-6:]}.json")
+
+
+def save(code: str, report: str, meta: Optional[Dict] = None, report_dir: str = REPORT_DIR) -> Dict:
+    entry = {
+        "code": code[-6:],
+        "report": report,
+        "generated_at": cache_policy.market_now().isoformat(timespec="seconds"),
+        **(meta or {}),
+    }
+    os.makedirs(report_dir, exist_ok=True)
+    path = _path(code, report_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return entry
+
+
+def load(code: str, report_dir: str = REPORT_DIR) -> Optional[Dict]:
+    try:
+        with open(_path(code, report_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read stored report for {code}: {e}")
+        return None
+
+
+def load_fresh(code: str, now: Optional[datetime.datetime] = None, report_dir: str = REPORT_DIR) -> Optional[Dict]:
+    """返回最近一次收盘之后生成的报告，没有则返回 None"""
+    entry = load(code, report_dir)
+    if entry is not None:
+        generated = datetime.datetime.fromisoformat(entry["generated_at"])
+        if generated >= last_close(now):
+            metrics.cache_hit("report_store")
+            return entry
+    metrics.cache_miss("report_store")
+    return None
@@ -0,0 +1,269 @@
+"""
+板块本地聚合 (Sectors)
+
+/api/hot 原先每次都要请求 stock_board_industry_name_em，失败再串行请求
+stock_board_concept_name_em，两个接口都慢且不稳定。这里只在每天第一次用到时拉取板块列表和
+各板块成分股（stock_board_industry_cons_em / stock_board_concept_cons_em），
+持久化到 .data/sectors/<kind>.pkl；盘中的板块涨跌幅、涨跌家数、成交额和领涨股
+全部由已有的全市场行情快照（shared_snapshot.spot）按成分股分组向量化计算：
+
+- 成分股在快照中用 searchsorted 定位，停牌（最新价为 0）的不参与；
+- 板块涨跌幅按流通市值加权（与行情软件的板块指数口径接近），市值缺失时等权；
+- 各项合计用 np.bincount，领涨股按 (板块, 涨跌幅) 排序后取每组最后一个。
+
+结果按快照版本缓存，快照刷新一次才重算一次，不增加任何上游请求。
+成分股列表过期后在后台线程刷新（多个 worker 用文件锁保证只有一个在拉取，其余按 mtime 重新加载），
+刷新完成前继续使用旧列表；从未拉取成功时 hot_boards 返回 None，由调用方回退到上游板块接口。
+
+配置：SECTOR_KINDS 逗号分隔的板块类型（industry 行业、concept 概念，默认只拉行业，
+概念板块有数百个，全部拉取成分股要几分钟）。
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import cache_policy
+import metrics
+import shared_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows：单进程部署，不需要跨进程锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SECTOR_DIR = os.path.join(os.getcwd(), ".data", "sectors")
+KINDS = {
+    "industry": ("stock_board_industry_name_em", "stock_board_industry_cons_em"),
+    "concept": ("stock_board_concept_name_em", "stock_board_concept_cons_em"),
+}
+# 每隔多久检查一次磁盘上的成分股文件是否被其他 worker 更新
+RELOAD_SECONDS = 60.0
+# 拉取失败后多久再试
+RETRY_SECONDS = 300.0
+
+MEMBERSHIP_REFRESH = metrics.counter("sector_membership_refresh_total", "Board constituent list refreshes by kind and outcome",
+                                     ["kind", "outcome"])
+SECTOR_AGGREGATE = metrics.histogram("sector_aggregate_seconds", "Time to aggregate all boards from one spot snapshot")
+
+
+def build_membership(kind: str) -> Dict:
+    """拉取板块列表与全部成分股；个别板块失败时跳过，整体失败抛出异常"""
+    from data_provider import ak, staleness
+
+    list_func, cons_func = KINDS[kind]
+    boards = getattr(ak, list_func)()
+    if staleness(boards) is not None:
+        raise RuntimeError(f"{list_func} returned stale data")
+    names, codes, members, board_index = [], [], [], []
+    for name, code in zip(boards["板块名称"].astype(str), boards["板块代码"].astype(str)):
+        try:
+            cons = getattr(ak, cons_func)(symbol=name)
+        except Exception as e:
+            logger.warning(f"Failed to fetch constituents of {name}: {e}")
+            continue
+        if staleness(cons) is not None or cons.empty:
+            continue
+        member_codes = cons["代码"].astype(str).str.zfill(6).to_numpy().astype("S6")
+        members.append(member_codes)
+        board_index.append(np.full(len(member_codes), len(names), dtype=np.int32))
+        names.append(name)
+        codes.append(code)
+    if not names:
+        raise RuntimeError(f"no constituents fetched for {kind} boards")
+    return {
+        "kind": kind,
+        "fetched_at": time.time(),
+        "names": names,
+        "codes": codes,
+        "members": np.concatenate(members),
+        "board_index": np.concatenate(board_index),
+    }
+
+
+def aggregate(segment, membership: Dict) -> List[Dict]:
+    """一版行情快照 -> 各板块行情，按涨跌幅降序"""
+    n_boards = len(membership["names"])
+    members, board_index = membership["members"], membership["board_index"]
+    if segment is None or segment.rows == 0 or len(members) == 0:
+        return []
+    codes = segment.column("code")
+    rows = np.minimum(np.searchsorted(codes, members), segment.rows - 1)
+    price = segment.column("price")
+    found = (codes[rows] == members) & (price[rows] > 0)
+    rows, b = rows[found], board_index[found]
+
+    change = segment.column("change_pct")[rows]
+    weight = np.maximum(segment.column("circ_mv")[rows], 0)
+    count = np.bincount(b, minlength=n_boards)
+    weight_sum = np.bincount(b, weights=weight, minlength=n_boards)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted = np.bincount(b, weights=weight * change, minlength=n_boards) / weight_sum
+        equal = np.bincount(b, weights=change, minlength=n_boards) / count
+    board_change = np.where(weight_sum > 0, weighted, equal)
+    up = np.bincount(b, weights=change > 0, minlength=n_boards).astype(int)
+    down = np.bincount(b, weights=change < 0, minlength=n_boards).astype(int)
+    amount = np.bincount(b, weights=segment.column("amount")[rows], minlength=n_boards)
+
+    # 领涨股：按 (板块, 涨跌幅) 升序排列后每个板块的最后一个
+    order = np.lexsort((change, b))
+    sorted_b = b[order]
+    last = np.flatnonzero(np.append(sorted_b[1:] != sorted_b[:-1], True)) if len(order) else np.zeros(0, dtype=int)
+    leader_row = np.full(n_boards, -1)
+    leader_row[sorted_b[last]] = rows[order][last]
+
+    names = segment.column("name")
+    out = []
+    for i in np.argsort(-np.nan_to_num(board_change, nan=-np.inf), kind="stable"):
+        if count[i] == 0:
+            continue
+        leader = int(leader_row[i])
+        out.append({
+            "板块名称": membership["names"][i],
+            "板块代码": membership["codes"][i],
+            "涨跌幅": round(float(board_change[i]), 2),
+            "上涨家数": int(up[i]),
+            "下跌家数": int(down[i]),
+            "成分股数": int(count[i]),
+            "成交额": float(amount[i]),
+            "领涨股票": names[leader],
+            "领涨股票代码": codes[leader].decode("ascii"),
+            "领涨股票-涨跌幅": round(float(segment.column("change_pct")[leader]), 2),
+        })
+    return out
+
+
+class SectorEngine:
+    def __init__(self, kind: str, directory: str = SECTOR_DIR):
+        self.kind = kind
+        self.path = os.path.join(directory, f"{kind}.pkl")
+        self._lock_path = os.path.join(directory, f"{kind}.lock")
+        self._membership: Optional[Dict] = None
+        self._mtime = None
+        self._checked = 0.0
+        self._refreshing = False
+        self._retry_at = 0.0
+        self._cached = None
+        self._lock = threading.Lock()
+
+    # --- 成分股 ---
+    def _expired(self, membership: Optional[Dict], now: float) -> bool:
+        """成分股每个交易日更新一次：取得于今天之前且今天是交易日时过期"""
+        if membership is None:
+            return True
+        today = cache_policy.market_time(now).date()
+        fetched = cache_policy.market_time(membership["fetched_at"]).date()
+        return fetched < today and cache_policy.calendar.is_trading_day(today)
+
+    def membership(self) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            if now - self._checked >= RELOAD_SECONDS or (self._membership is None and now - self._checked >= 5):
+                self._checked = now
+                self._reload()
+            membership = self._membership
+            if self._expired(membership, now) and not self._refreshing and now >= self._retry_at:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, name=f"sector-{self.kind}", daemon=True).start()
+        return membership
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                self._membership = pickle.load(f)
+            self._mtime = mtime
+        except Exception as e:
+            logger.warning(f"Failed to read {self.kind} board constituents: {e}")
+
+    def _refresh(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # 其他 worker 正在拉取，完成后按 mtime 重新加载
+                        MEMBERSHIP_REFRESH.labels(self.kind, "skipped").inc()
+                        self._retry_at = time.time() + RELOAD_SECONDS
+                        return
+                with self._lock:
+                    self._reload()
+                    if not self._expired(self._membership, time.time()):
+                        return
+                membership = build_membership(self.kind)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(membership, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+                with self._lock:
+                    self._membership, self._mtime = membership, os.stat(self.path).st_mtime_ns
+                MEMBERSHIP_REFRESH.labels(self.kind, "fetched").inc()
+                logger.info(f"Fetched {len(membership['names'])} {self.kind} boards, {len(membership['members'])} constituents")
+        except Exception as e:
+            MEMBERSHIP_REFRESH.labels(self.kind, "error").inc()
+            logger.warning(f"Failed to refresh {self.kind} board constituents: {e}")
+            self._retry_at = time.time() + RETRY_SECONDS
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # --- 板块行情 ---
+    def boards(self, wait: float = 5.0) -> Optional[Dict]:
+        """{"boards": [...], "as_of", "stale"?}；成分股或行情快照不可用时返回 None"""
+        membership = self.membership()
+        if membership is None:
+            return None
+        segment = shared_snapshot.spot.get(wait=wait)
+        if segment is None:
+            return None
+        key = (segment.version, membership["fetched_at"])
+        cached = self._cached
+        if cached is not None and cached[0] == key:
+            metrics.cache_hit("sectors")
+            return cached[1]
+        metrics.cache_miss("sectors")
+        started = time.perf_counter()
+        result = {
+            "boards": aggregate(segment, membership),
+            "as_of": cache_policy.market_time(segment.version).isoformat(timespec="seconds"),
+        }
+        SECTOR_AGGREGATE.observe(time.perf_counter() - started)
+        # 与 lookup_row 相同：超过应刷新时刻一段时间仍未刷新才算过期
+        spot = shared_snapshot.spot
+        if time.time() - spot.expires_at(segment.version) > max(2 * spot.ttl, 60.0):
+            result["stale"] = {"reason": "snapshot", "age_seconds": round(segment.age(), 1), "as_of": result["as_of"]}
+        self._cached = (key, result)
+        return result
+
+
+def _kinds() -> List[str]:
+    kinds = [k.strip() for k in os.getenv("SECTOR_KINDS", "industry").split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in KINDS]
+    if unknown:
+        logger.warning(f"Ignoring unknown SECTOR_KINDS entries: {unknown}")
+    return [k for k in kinds if k in KINDS] or ["industry"]
+
+
+engines = {kind: SectorEngine(kind) for kind in _kinds()}
+
+
+def hot_boards(n: int = 6, wait: float = 5.0) -> Optional[Dict]:
+    """涨幅前 n 的板块，优先行业板块；本地数据不可用时返回 None"""
+    for engine in engines.values():
+        result = engine.boards(wait)
+        if result is not None and result["boards"]:
+            return dict(result, boards=result["boards"][:n])
+    return None
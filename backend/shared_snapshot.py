@@ -0,0 +1,542 @@
+"""
+跨 worker 共享的只读快照（股票列表 + 拼音索引、全市场实时行情）
+
+`uvicorn --workers N` 时每个进程原本各自下载并构建一份数据。这里把数据按列写入
+一个内存映射文件（默认放在 /dev/shm），所有 worker 以 mmap 只读方式挂载，
+数值列与定长字符串列直接以 numpy 数组零拷贝读取。
+
+- 写入：先写临时文件再 os.replace，读者看到的总是完整的一版；
+  旧版本文件被替换后，已经挂载它的 worker 仍可继续读取直到重新挂载。
+- 刷新：同一目录下通过 flock 选出唯一的 leader 进程，由它的后台线程负责刷新；
+  leader 退出后锁自动释放，其他 worker 接管。
+- 按需：worker 读取时更新 `<name>.demand` 的时间戳，leader 只在最近有人读取
+  且数据过期时刷新，空闲时不会持续请求上游。带 policy 的快照按 cache_policy 的交易日历过期：
+  交易时段内超过 TTL 刷新，午休、收盘后和节假日保持到下一次开盘。
+
+人气榜（stock_hot_rank_em）与行业/概念板块列表（stock_board_*_name_em）也作为快照共享，
+按排名/涨跌幅顺序存放，用 head() 读取前 n 行。
+
+配置：SHARED_SNAPSHOT_DIR 存放目录，SHARED_UNIVERSE_TTL / SHARED_SPOT_TTL / SHARED_HOT_RANK_TTL /
+SHARED_BOARD_TTL 刷新间隔（秒）。
+"""
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+import cache_policy
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，每个进程各自刷新
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"STKSNAP1"
+ALIGN = 64
+# 最近多少秒内有读取才继续刷新
+DEMAND_WINDOW = 300.0
+
+SNAPSHOT_AGE = metrics.gauge("shared_snapshot_age_seconds", "Age of the shared snapshot seen by this worker", ["name"])
+SNAPSHOT_REFRESH = metrics.counter("shared_snapshot_refresh_total", "Shared snapshot rebuilds by outcome", ["name", "outcome"])
+
+Column = Union[np.ndarray, Sequence[str]]
+
+
+def _default_dir() -> str:
+    # 同一台机器上多个部署互不干扰
+    suffix = hashlib.sha1(os.getcwd().encode("utf-8")).hexdigest()[:8]
+    if os.path.isdir("/dev/shm"):
+        return os.path.join("/dev/shm", f"stock-snapshots-{suffix}")
+    return os.path.join(os.getcwd(), ".data", "shm")
+
+
+SNAPSHOT_DIR = os.getenv("SHARED_SNAPSHOT_DIR") or _default_dir()
+
+
+def _aligned(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_segment(path: str, columns: Dict[str, Column], meta: Optional[Dict] = None) -> float:
+    """
+    按列写入快照文件，返回版本号（写入时间戳）。
+    numpy 数组原样写入；字符串列表编码为 UTF-8 数据区 + int64 偏移数组。
+    """
+    rows = None
+    blobs = []
+    specs = []
+    for name, values in columns.items():
+        if isinstance(values, np.ndarray) and values.dtype.kind != "O":
+            arrays = [("data", np.ascontiguousarray(values))]
+            spec = {"name": name, "kind": "array", "dtype": values.dtype.str}
+            count = len(values)
+        else:
+            strings = StringColumn.from_strings(values)
+            arrays = [("data", strings.data), ("offsets", strings.offsets)]
+            spec = {"name": name, "kind": "str"}
+            count = len(strings)
+        if rows is None:
+            rows = count
+        elif rows != count:
+            raise ValueError(f"Column {name} has {count} rows, expected {rows}")
+        for part, array in arrays:
+            spec[part] = array
+        specs.append(spec)
+
+    # 头部里的偏移相对于数据区起点，数据区紧跟在对齐后的头部之后
+    version = time.time()
+    header = {"version": version, "rows": rows or 0, "meta": meta or {}, "columns": []}
+    offset = 0
+    for spec in specs:
+        entry = {}
+        for key, value in spec.items():
+            if isinstance(value, np.ndarray):
+                entry[key] = (offset, value.nbytes)
+                blobs.append((offset, value))
+                offset = _aligned(offset + value.nbytes)
+            else:
+                entry[key] = value
+        header["columns"].append(entry)
+    header_bytes = json.dumps(header).encode("utf-8")
+    base = _aligned(len(MAGIC) + 4 + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for position, array in blobs:
+            f.seek(base + position)
+            f.write(array.tobytes())
+        f.truncate(base + offset)
+    os.replace(tmp_path, path)
+    return version
+
+
+class StringColumn:
+    """变长字符串列，按行解码，不整体复制"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def data(self) -> np.ndarray:
+        """全部字符串拼接后的 UTF-8 字节 (uint8)"""
+        return self._data
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """第 i 行占 data[offsets[i]:offsets[i + 1]]"""
+        return self._offsets
+
+    @classmethod
+    def from_strings(cls, values: Sequence[str]) -> "StringColumn":
+        encoded = [str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._data[start:end].tobytes().decode("utf-8")
+
+    def tolist(self) -> List[str]:
+        return [self[i] for i in range(len(self))]
+
+
+class Segment:
+    """一版已挂载的快照"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = (stat.st_ino, stat.st_mtime_ns)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot segment")
+        (length,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mm[start:start + length].decode("utf-8"))
+        self._base = _aligned(start + length)
+        self.version: float = header["version"]
+        self.rows: int = header["rows"]
+        self.meta: Dict = header["meta"]
+        self._columns = {c["name"]: c for c in header["columns"]}
+        self._cache: Dict[str, object] = {}
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    def age(self) -> float:
+        return time.time() - self.version
+
+    def _view(self, location, dtype) -> np.ndarray:
+        offset, nbytes = location
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mm, dtype=dtype, count=nbytes // dtype.itemsize, offset=self._base + offset)
+
+    def column(self, name: str):
+        """数值/定长列返回只读 numpy 数组，变长字符串列返回 StringColumn"""
+        cached = self._cache.get(name)
+        if cached is not None:
+            return cached
+        spec = self._columns[name]
+        if spec["kind"] == "array":
+            value = self._view(spec["data"], spec["dtype"])
+        else:
+            value = StringColumn(self._view(spec["data"], np.uint8), self._view(spec["offsets"], "<i8"))
+        self._cache[name] = value
+        return value
+
+    def row(self, i: int) -> Dict:
+        out = {}
+        for name in self._columns:
+            value = self.column(name)[i]
+            if isinstance(value, np.generic):
+                value = value.item()
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            out[name] = value
+        return out
+
+
+class SharedSnapshot:
+    """
+    一个命名快照：builder() 返回 {列名: 列数据}，由 leader 进程调用并发布。
+    get() 返回当前挂载的 Segment；数据不存在时 leader 同步构建，其他 worker 最多等待 wait 秒。
+    """
+
+    def __init__(self, name: str, builder: Callable[[], Dict[str, Column]], ttl: float,
+                 directory: str = SNAPSHOT_DIR, policy: Optional[str] = None):
+        self.name = name
+        self.builder = builder
+        self.ttl = ttl
+        # cache_policy 中的数据类型：ttl 只作为交易时段内的刷新间隔，休市期间数据保持到下次开盘
+        self.policy = policy
+        self.path = os.path.join(directory, f"{name}.seg")
+        self._demand_path = os.path.join(directory, f"{name}.demand")
+        # leader 刷新失败时更新该文件，其他 worker 据此不再空等
+        self._failed_path = os.path.join(directory, f"{name}.failed")
+        self._segment: Optional[Segment] = None
+        self._checked = 0.0
+        self._demanded = 0.0
+        self._build_lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+        _coordinator.register(self)
+
+    def current(self) -> Optional[Segment]:
+        """挂载最新发布的版本（每秒最多 stat 一次），不触发构建"""
+        now = time.monotonic()
+        if self._segment is not None and now - self._checked < 1.0:
+            return self._segment
+        with self._attach_lock:
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self._segment
+            if self._segment is None or self._segment.inode != (stat.st_ino, stat.st_mtime_ns):
+                try:
+                    self._segment = Segment(self.path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Failed to attach snapshot {self.name}: {e}")
+            return self._segment
+
+    def get(self, wait: float = 0.0) -> Optional[Segment]:
+        self._touch_demand()
+        segment = self.current()
+        if segment is None and not self._recently_failed():
+            if _coordinator.is_leader():
+                segment = self.refresh(only_if_missing=True)
+            else:
+                deadline = time.monotonic() + wait
+                while segment is None and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    self._checked = 0.0
+                    segment = self.current()
+        if segment is not None:
+            SNAPSHOT_AGE.labels(self.name).set(round(segment.age(), 1))
+        return segment
+
+    def refresh(self, only_if_missing: bool = False) -> Optional[Segment]:
+        """构建并发布新版本；同一进程内同时只有一次构建"""
+        with self._build_lock:
+            if only_if_missing and os.path.exists(self.path):
+                self._checked = 0.0
+                return self.current()
+            try:
+                columns = self.builder()
+                write_segment(self.path, columns, {"name": self.name})
+                SNAPSHOT_REFRESH.labels(self.name, "ok").inc()
+                if os.path.exists(self._failed_path):
+                    os.remove(self._failed_path)
+            except Exception as e:
+                SNAPSHOT_REFRESH.labels(self.name, "error").inc()
+                logger.warning(f"Failed to refresh snapshot {self.name}: {e}")
+                try:
+                    with open(self._failed_path, "w") as f:
+                        f.write(str(e))
+                except OSError:
+                    pass
+            self._checked = 0.0
+            return self.current()
+
+    def _touch_demand(self):
+        now = time.monotonic()
+        if now - self._demanded < 1.0:
+            return
+        self._demanded = now
+        try:
+            os.makedirs(os.path.dirname(self._demand_path), exist_ok=True)
+            with open(self._demand_path, "a"):
+                pass
+            os.utime(self._demand_path)
+        except OSError:
+            pass
+
+    def _recently_failed(self) -> bool:
+        """上次刷新失败后的退避期内（一个 TTL，最多 30 秒）不再重试"""
+        try:
+            failed = os.stat(self._failed_path).st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - failed < min(self.ttl, 30.0)
+
+    def needs_refresh(self) -> bool:
+        """leader 轮询用：最近有读取、数据超过 TTL，且不在失败退避期内"""
+        try:
+            demanded = os.stat(self._demand_path).st_mtime
+        except FileNotFoundError:
+            return False
+        if time.time() - demanded > DEMAND_WINDOW:
+            return False
+        if self._recently_failed():
+            return False
+        try:
+            published = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return True
+        return time.time() >= self.expires_at(published)
+
+    def expires_at(self, published: float) -> float:
+        if self.policy is None:
+            return published + self.ttl
+        return cache_policy.expires_at(self.policy, published, self.ttl)
+
+
+class _Coordinator:
+    """进程级：争抢 leader 锁，并由 leader 的后台线程刷新所有已注册的快照"""
+
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        self.directory = directory
+        self._snapshots: List[SharedSnapshot] = []
+        self._lock_file = None
+        self._leader = fcntl is None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, snapshot: SharedSnapshot):
+        with self._lock:
+            self._snapshots.append(snapshot)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="shared-snapshot", daemon=True)
+                self._thread.start()
+
+    def is_leader(self) -> bool:
+        if not self._leader:
+            self._try_acquire()
+        return self._leader
+
+    def _try_acquire(self):
+        with self._lock:
+            if self._leader:
+                return
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                if self._lock_file is None:
+                    self._lock_file = open(os.path.join(self.directory, "leader.lock"), "a")
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            self._leader = True
+            logger.info(f"Process {os.getpid()} is the shared snapshot refresher")
+
+    def _run(self):
+        while True:
+            time.sleep(1.0)
+            if not self.is_leader():
+                continue
+            with self._lock:
+                snapshots = list(self._snapshots)
+            for snapshot in snapshots:
+                try:
+                    if snapshot.needs_refresh():
+                        snapshot.refresh()
+                except Exception as e:
+                    logger.warning(f"Snapshot refresher error for {snapshot.name}: {e}")
+
+
+_coordinator = _Coordinator()
+
+
+# --- 全市场实时行情 ---
+SPOT_NUMERIC = {
+    "price": "最新价", "open": "今开", "high": "最高", "low": "最低",
+    "volume": "成交量", "amount": "成交额", "change_pct": "涨跌幅", "change_amt": "涨跌额",
+    "turnover_rate": "换手率", "pe_ratio": "市盈率-动态", "pb_ratio": "市净率",
+    "total_mv": "总市值", "circ_mv": "流通市值",
+}
+
+
+def build_spot_columns() -> Dict[str, Column]:
+    """stock_zh_a_spot_em -> 按代码排序的列，代码为定长 S6 便于 searchsorted"""
+    import pandas as pd
+    from data_provider import UpstreamError, ak, staleness
+
+    df = ak.stock_zh_a_spot_em()
+    if staleness(df):
+        # 熔断返回的旧数据不重新发布，保留上一版及其真实时间戳
+        raise UpstreamError("spot snapshot upstream returned stale data")
+    df = df.assign(代码=df["代码"].astype(str).str.zfill(6)).sort_values("代码")
+    columns: Dict[str, Column] = {
+        "code": df["代码"].to_numpy().astype("S6"),
+        "name": df["名称"].astype(str).tolist(),
+    }
+    for field, source in SPOT_NUMERIC.items():
+        if source in df.columns:
+            columns[field] = pd.to_numeric(df[source], errors="coerce").fillna(0).to_numpy(dtype="<f8")
+        else:
+            columns[field] = np.zeros(len(df), dtype="<f8")
+    return columns
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _strip_market(codes) -> np.ndarray:
+    """SH600519 / SZ000001 / 600519 -> 定长 S6 代码"""
+    return codes.astype(str).str.upper().str.replace(r"^(SH|SZ|BJ)", "", regex=True).str.zfill(6).to_numpy().astype("S6")
+
+
+def build_hot_rank_columns() -> Dict[str, Column]:
+    """stock_hot_rank_em -> 按人气排名排序的列（不是按代码排序，不能用 lookup_row）"""
+    import pandas as pd
+    from data_provider import UpstreamError, ak, staleness
+
+    df = ak.stock_hot_rank_em()
+    if staleness(df):
+        raise UpstreamError("hot rank snapshot upstream returned stale data")
+    df = df.sort_values("当前排名", kind="stable")
+    return {
+        "rank": pd.to_numeric(df["当前排名"], errors="coerce").fillna(0).to_numpy(dtype="<f8"),
+        "code": _strip_market(df["代码"]),
+        "name": df["股票名称"].astype(str).tolist(),
+        "price": pd.to_numeric(df["最新价"], errors="coerce").fillna(0).to_numpy(dtype="<f8"),
+        "change_pct": pd.to_numeric(df["涨跌幅"], errors="coerce").fillna(0).to_numpy(dtype="<f8"),
+    }
+
+
+def build_board_columns(func: str) -> Dict[str, Column]:
+    """stock_board_industry_name_em / stock_board_concept_name_em -> 按涨跌幅降序的列"""
+    import pandas as pd
+    from data_provider import UpstreamError, ak, staleness
+
+    df = getattr(ak, func)()
+    if staleness(df):
+        raise UpstreamError(f"{func} snapshot upstream returned stale data")
+    df = df.assign(涨跌幅=pd.to_numeric(df["涨跌幅"], errors="coerce").fillna(0)).sort_values("涨跌幅", ascending=False)
+    return {
+        "name": df["板块名称"].astype(str).tolist(),
+        "code": df["板块代码"].astype(str).tolist(),
+        "change_pct": df["涨跌幅"].to_numpy(dtype="<f8"),
+        "leader": df["领涨股票"].astype(str).tolist(),
+        "leader_change_pct": pd.to_numeric(df["领涨股票-涨跌幅"], errors="coerce").fillna(0).to_numpy(dtype="<f8"),
+    }
+
+
+spot = SharedSnapshot("spot", build_spot_columns, ttl=_env_float("SHARED_SPOT_TTL", 15.0), policy="spot")
+hot_rank = SharedSnapshot("hot_rank", build_hot_rank_columns, ttl=_env_float("SHARED_HOT_RANK_TTL", 300.0),
+                          policy="hot_rank")
+industry_boards = SharedSnapshot("industry_boards", functools.partial(build_board_columns, "stock_board_industry_name_em"),
+                                 ttl=_env_float("SHARED_BOARD_TTL", 60.0), policy="board")
+concept_boards = SharedSnapshot("concept_boards", functools.partial(build_board_columns, "stock_board_concept_name_em"),
+                                ttl=_env_float("SHARED_BOARD_TTL", 60.0), policy="board")
+
+
+def _stale_marker(snapshot: SharedSnapshot, segment: Segment, as_of: str) -> Optional[Dict]:
+    # 超过应刷新时刻一段时间仍未刷新才算过期；休市期间的旧快照本身就是最新数据
+    if time.time() - snapshot.expires_at(segment.version) > max(2 * snapshot.ttl, 60.0):
+        return {"reason": "snapshot", "age_seconds": round(segment.age(), 1), "as_of": as_of}
+    return None
+
+
+def lookup_row(snapshot: SharedSnapshot, code: str, wait: float = 5.0) -> Optional[Dict]:
+    """在按代码排序的快照中二分查找一行，快照不可用或代码不存在时返回 None"""
+    segment = snapshot.get(wait=wait)
+    if segment is None or segment.rows == 0:
+        return None
+    codes = segment.column("code")
+    key = code[-6:].encode("ascii")
+    i = int(np.searchsorted(codes, key))
+    if i >= segment.rows or codes[i] != key:
+        return None
+    row = segment.row(i)
+    row["as_of"] = cache_policy.market_time(segment.version).isoformat(timespec="seconds")
+    stale = _stale_marker(snapshot, segment, row["as_of"])
+    if stale is not None:
+        row["stale"] = stale
+    return row
+
+
+def head(snapshot: SharedSnapshot, n: int, wait: float = 5.0) -> Optional[Dict]:
+    """按存放顺序取前 n 行：{"rows": [...], "as_of", "stale"?}；快照不可用时返回 None"""
+    segment = snapshot.get(wait=wait)
+    if segment is None:
+        return None
+    as_of = cache_policy.market_time(segment.version).isoformat(timespec="seconds")
+    result = {"rows": [segment.row(i) for i in range(min(n, segment.rows))], "as_of": as_of}
+    stale = _stale_marker(snapshot, segment, as_of)
+    if stale is not None:
+        result["stale"] = stale
+    return result
+
+
+def spot_row(code: str, wait: float = 5.0) -> Optional[Dict]:
+    """按代码读取全市场行情快照中的一行"""
+    return lookup_row(spot, code, wait)
+
+
+def spot_top(n: int, by: str = "change_pct", wait: float = 5.0) -> Optional[List[Dict]]:
+    """按某一数值列降序取前 n 行"""
+    segment = spot.get(wait=wait)
+    if segment is None:
+        return None
+    values = segment.column(by)
+    k = min(n, segment.rows)
+    if k == 0:
+        return []
+    top = np.argpartition(-values, k - 1)[:k]
+    top = top[np.argsort(-values[top], kind="stable")]
+    as_of = cache_policy.market_time(segment.version).isoformat(timespec="seconds")
+    return [dict(segment.row(int(i)), as_of=as_of) for i in top]
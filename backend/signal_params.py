@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SignalParams:
+    """
+    实时买卖信号的评分权重与阈值。
+    默认值与原先写死在 generate_trade_signal 中的常量一致，
+    可通过 param_sweep.py 回测寻优后以 JSON 形式加载。
+    """
+    base_score: int = 50
+    limit_pct: float = 9.9
+
+    # 换手率
+    turnover_high: float = 20.0
+    turnover_low: float = 3.0
+    turnover_weight: int = 5
+
+    # 主力资金
+    main_inflow_pct: float = 5.0
+    main_inflow_weight: int = 15
+
+    # 盘口委比
+    bid_ask_strong: float = 1.5
+    bid_ask_weak: float = 0.67
+    bid_ask_weight: int = 10
+
+    # 盘口环形缓冲：窗口内五档失衡均值、挂单金额变化 (至少 ob_min_samples 次快照才参与评分)
+    ob_window: int = 20
+    ob_min_samples: int = 3
+    ob_imbalance: float = 0.3
+    ob_imbalance_weight: int = 5
+    ob_depth_drop: float = 0.3
+    ob_depth_weight: int = 5
+
+    # MACD 金叉/死叉
+    macd_cross_weight: int = 10
+
+    # KDJ
+    kdj_oversold: float = 20.0
+    kdj_overbought: float = 80.0
+    kdj_weight: int = 15
+
+    # RSI6
+    rsi_oversold: float = 30.0
+    rsi_overbought: float = 70.0
+    rsi_weight: int = 10
+
+    # 布林带
+    boll_weight: int = 8
+
+    # 多周期共振：5/15/30/60 分钟与日线的多空一致度 (至少 mtf_min_timeframes 个周期有效才参与评分)
+    mtf_min_timeframes: int = 3
+    mtf_agreement: float = 0.6
+    mtf_weight: int = 10
+
+    # 操作评级分段 (score >= band)
+    strong_buy_band: int = 80
+    buy_band: int = 60
+    hold_band: int = 40
+    sell_band: int = 20
+
+    def classify(self, score: float) -> Tuple[str, float]:
+        """根据分数返回 (操作建议, 置信度)"""
+        if score >= self.strong_buy_band:
+            action = "强烈买入"
+            confidence = 85 + (score - self.strong_buy_band) * 1.5
+        elif score >= self.buy_band:
+            action = "谨慎买入"
+            confidence = 70 + (score - self.buy_band) * 0.75
+        elif score >= self.hold_band:
+            action = "观望"
+            confidence = 60
+        elif score >= self.sell_band:
+            action = "谨慎卖出"
+            confidence = 70 + (self.hold_band - score) * 0.75
+        else:
+            action = "强烈卖出"
+            confidence = 85 + (self.sell_band - score) * 1.5
+        return action, min(98, confidence)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SignalParams":
+        names = {f.name for f in fields(cls)}
+        unknown = set(data) - names
+        if unknown:
+            logger.warning(f"Ignoring unknown signal params: {sorted(unknown)}")
+        return cls(**{k: v for k, v in data.items() if k in names})
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "SignalParams":
+        """
+        从 JSON 文件加载参数，路径默认取环境变量 SIGNAL_PARAMS_PATH。
+        文件不存在或解析失败时回退到默认参数。
+        """
+        path = path or os.getenv("SIGNAL_PARAMS_PATH")
+        if not path:
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # param_sweep 的输出文件把参数放在 "params" 字段下
+            return cls.from_dict(data.get("params", data))
+        except Exception as e:
+            logger.warning(f"Failed to load signal params from {path}: {e}")
+            return cls()
@@ -0,0 +1,343 @@
+"""
+交易信号历史与准确率 (Signal Store)
+
+generate_trade_signal 的结果原先响应后即丢弃，get_history_accuracy 返回的是写死的数字。
+这里把每次产生的信号（代码、时间、评分、操作、置信度、当时价格）记入按交易日分区的列式存储，
+收盘后的统计任务再用 N 个交易日后的收盘价回填实际涨跌，得出真实的准确率与收益。
+
+写入不阻塞请求：record() 只把一行放进内存队列（队列满时丢弃并计数），后台线程每
+SIGNAL_FLUSH_SECONDS（默认 5 秒）或攒满 SIGNAL_FLUSH_ROWS（默认 500 行）时，按日期把一批行
+以列（numpy 数组）的形式写成一个分片：.data/signals/<YYYYMMDD>/<pid>-<毫秒时间戳>.pkl。
+每个 worker 各写各的分片，不需要跨进程锁；统计任务把已收盘日期的分片合并成 part.pkl。
+
+统计口径（update_accuracy）：
+- 观望不计入；同一只股票同一交易日只取当天第一条买入/卖出类信号，避免反复刷新页面重复计数；
+- 买入类信号 N 日后上涨、卖出类信号 N 日后下跌为正确；
+- 收益 = 信号价格到第 N 个交易日收盘价（按后复权因子折算除权）的涨跌幅，卖出信号取相反数；
+- N 为 SIGNAL_HORIZON_DAYS（默认 5），结果写入 .data/signals/accuracy.json。
+
+统计任务随 pregenerate.py 每个交易日收盘后运行一次，也可以单独运行：
+    python signal_store.py
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import cache_policy
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_DIR = os.path.join(os.getcwd(), ".data", "signals")
+ACCURACY_FILE = "accuracy.json"
+COMPACT_FILE = "part.pkl"
+COLUMNS = ("code", "ts", "score", "action", "confidence", "price")
+BUY_ACTIONS = ("强烈买入", "谨慎买入")
+SELL_ACTIONS = ("强烈卖出", "谨慎卖出")
+
+SIGNALS_RECORDED = metrics.counter("signal_store_records_total", "Trade signals handed to the signal store by outcome",
+                                   ["outcome"])
+SIGNAL_FLUSH = metrics.histogram("signal_store_flush_seconds", "Time to write one batch of trade signals")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _columns(rows: List[Dict]) -> Dict[str, np.ndarray]:
+    return {
+        "code": np.array([r["code"] for r in rows], dtype="S6"),
+        "ts": np.array([r["ts"] for r in rows], dtype=float),
+        "score": np.array([r["score"] for r in rows], dtype=float),
+        "action": np.array([r["action"] for r in rows], dtype="U4"),
+        "confidence": np.array([r["confidence"] for r in rows], dtype=float),
+        "price": np.array([r["price"] for r in rows], dtype=float),
+    }
+
+
+def _concat(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    if not parts:
+        return _columns([])
+    return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+
+def _write(path: str, columns: Dict[str, np.ndarray]):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+class SignalWriter:
+    """进程内的批量写入器，record() 在请求线程中调用，落盘在后台线程"""
+
+    def __init__(self, directory: str = SIGNAL_DIR, flush_seconds: float = 5.0, flush_rows: int = 500,
+                 max_pending: int = 10000):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.flush_rows = flush_rows
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._seq = 0
+
+    def record(self, code: str, signal: Dict):
+        """记下一条信号；没有价格的结果（数据获取失败、涨跌停直接返回的观望）不记录"""
+        price = (signal.get("realtime_data_summary") or {}).get("price") or 0
+        if signal.get("error") or price <= 0:
+            SIGNALS_RECORDED.labels("skipped").inc()
+            return
+        row = {
+            "code": code[-6:],
+            "ts": time.time(),
+            "score": float(signal.get("score", 0)),
+            "action": str(signal.get("action", "")),
+            "confidence": float(signal.get("confidence", 0)),
+            "price": float(price),
+        }
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(row)
+            SIGNALS_RECORDED.labels("queued").inc()
+        except queue.Full:
+            # 磁盘跟不上时宁可丢统计样本，也不让请求等待
+            SIGNALS_RECORDED.labels("dropped").inc()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="signal-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_seconds
+            while self._queue.qsize() < self.flush_rows and time.monotonic() < deadline:
+                time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Failed to flush trade signals: {e}")
+
+    def flush(self) -> int:
+        """把队列中已有的行按日期写成分片，返回写入行数"""
+        with self._flush_lock:
+            rows = []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            by_day: Dict[str, List[Dict]] = {}
+            for row in rows:
+                by_day.setdefault(f'{cache_policy.market_time(row["ts"]):%Y%m%d}', []).append(row)
+            for day, day_rows in by_day.items():
+                day_dir = os.path.join(self.directory, day)
+                os.makedirs(day_dir, exist_ok=True)
+                self._seq += 1
+                _write(os.path.join(day_dir, f"{os.getpid()}-{int(time.time() * 1000)}-{self._seq}.pkl"), _columns(day_rows))
+            SIGNAL_FLUSH.observe(time.perf_counter() - started)
+            return len(rows)
+
+
+def partitions(directory: str = SIGNAL_DIR) -> List[str]:
+    try:
+        return sorted(n for n in os.listdir(directory) if n.isdigit() and len(n) == 8)
+    except FileNotFoundError:
+        return []
+
+
+def read_partition(day: str, directory: str = SIGNAL_DIR, names: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """一个交易日的全部信号（已合并的 part.pkl 加上仍在写入的分片）；names 给出时只读这些文件"""
+    day_dir = os.path.join(directory, day)
+    parts = []
+    for name in sorted(os.listdir(day_dir) if names is None else names):
+        if not name.endswith(".pkl"):
+            continue
+        try:
+            with open(os.path.join(day_dir, name), "rb") as f:
+                parts.append(pickle.load(f))
+        except FileNotFoundError:
+            # 合并时被删除的分片，内容已在 part.pkl 中
+            continue
+        except Exception as e:
+            logger.warning(f"Failed to read signal chunk {day}/{name}: {e}")
+    return _concat(parts)
+
+
+def compact(day: str, directory: str = SIGNAL_DIR):
+    """把一个已结束交易日的分片合并为 part.pkl"""
+    day_dir = os.path.join(directory, day)
+    chunks = [n for n in os.listdir(day_dir) if n.endswith(".pkl") and n != COMPACT_FILE]
+    if not chunks:
+        return
+    # 只合并随后会删除的这些分片：两次列目录之间新写入的分片留到下一次合并，不会被重复计入
+    _write(os.path.join(day_dir, COMPACT_FILE), read_partition(day, directory, chunks + [COMPACT_FILE]))
+    for name in chunks:
+        try:
+            os.remove(os.path.join(day_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def _first_per_day(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """每只股票当天第一条非观望信号"""
+    order = np.lexsort((columns["ts"], columns["code"]))
+    sorted_cols = {name: values[order] for name, values in columns.items()}
+    directional = np.isin(sorted_cols["action"], BUY_ACTIONS + SELL_ACTIONS)
+    sorted_cols = {name: values[directional] for name, values in sorted_cols.items()}
+    codes = sorted_cols["code"]
+    first = np.concatenate(([True], codes[1:] != codes[:-1])) if len(codes) else np.zeros(0, dtype=bool)
+    return {name: values[first] for name, values in sorted_cols.items()}
+
+
+def _outcomes(signals: List[Dict], horizon: int) -> List[Dict]:
+    """按股票拉取日K，计算每条信号 horizon 个交易日后的方向收益"""
+    import pandas as pd
+
+    import kline_store
+
+    by_code: Dict[str, List[Dict]] = {}
+    for s in signals:
+        by_code.setdefault(s["code"], []).append(s)
+    out = []
+    for code, items in by_code.items():
+        try:
+            raw = kline_store.daily_bars(code, adjust="")
+            hfq = kline_store.daily_bars(code, adjust="hfq")
+        except Exception as e:
+            logger.warning(f"Failed to load bars for signal outcomes of {code}: {e}")
+            continue
+        if raw.empty or len(raw) != len(hfq):
+            continue
+        dates = pd.to_datetime(raw["日期"]).to_numpy().astype("datetime64[D]")
+        raw_close = raw["收盘"].to_numpy(dtype=float)
+        hfq_close = hfq["收盘"].to_numpy(dtype=float)
+        days = np.array([s["day"] for s in items], dtype="datetime64[D]")
+        idx = np.searchsorted(dates, days)
+        exit_idx = idx + horizon
+        valid = (idx < len(dates)) & (exit_idx < len(dates))
+        valid[valid] &= dates[idx[valid]] == days[valid]
+        for s, i, j, ok in zip(items, idx, exit_idx, valid):
+            if not ok:
+                continue
+            # 信号价格换算到后复权口径，与 horizon 日后的后复权收盘价比较，除权不影响收益
+            entry = s["price"] * hfq_close[i] / raw_close[i]
+            ret = hfq_close[j] / entry - 1
+            direction = 1.0 if s["action"] in BUY_ACTIONS else -1.0
+            out.append({**s, "return": direction * ret})
+    return out
+
+
+def _summary(outcomes: List[Dict]) -> Dict:
+    total = len(outcomes)
+    correct = sum(1 for o in outcomes if o["return"] > 0)
+    return {
+        "total": total,
+        "correct": correct,
+        "accuracy_rate": round(correct / total * 100, 1) if total else 0.0,
+        "avg_return": round(float(np.mean([o["return"] for o in outcomes])) * 100, 2) if total else 0.0,
+    }
+
+
+def update_accuracy(horizon: Optional[int] = None, directory: str = SIGNAL_DIR,
+                    now: Optional[datetime.datetime] = None) -> Dict:
+    """合并已结束交易日的分片，回填 horizon 个交易日后的收盘价，写出准确率统计"""
+    horizon = horizon or int(_env_float("SIGNAL_HORIZON_DAYS", 5))
+    now = now or cache_policy.market_now()
+    calendar = cache_policy.calendar
+    # 最近一次收盘的日K已定型，horizon 日后的收盘价不晚于它的信号才能结算
+    settled = calendar.last_close(now).date()
+
+    signals = []
+    for day in partitions(directory):
+        date = datetime.datetime.strptime(day, "%Y%m%d").date()
+        if date < now.date():
+            compact(day, directory)
+        exit_day = date
+        for _ in range(horizon):
+            exit_day = calendar.next_trading_day(exit_day)
+        if not calendar.is_trading_day(date) or exit_day > settled:
+            continue
+        first = _first_per_day(read_partition(day, directory))
+        signals.extend({
+            "code": code.decode(), "day": date, "action": str(action), "price": float(price),
+        } for code, action, price in zip(first["code"], first["action"], first["price"]))
+
+    outcomes = _outcomes(signals, horizon)
+    cutoff = calendar.last_close(now).date() - datetime.timedelta(days=30)
+    overall = _summary(outcomes)
+    result = {
+        "total_predictions": overall["total"],
+        "correct_predictions": overall["correct"],
+        "accuracy_rate": overall["accuracy_rate"],
+        "avg_return": overall["avg_return"],
+        "last_30_days": _summary([o for o in outcomes if o["day"] >= cutoff]),
+        "by_action": {action: _summary([o for o in outcomes if o["action"] == action])
+                      for action in BUY_ACTIONS + SELL_ACTIONS},
+        "horizon_days": horizon,
+        "updated_at": now.isoformat(timespec="seconds"),
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, ACCURACY_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return result
+
+
+def accuracy(directory: str = SIGNAL_DIR) -> Dict:
+    """最近一次统计结果；尚未统计过时各项为 0"""
+    try:
+        with open(os.path.join(directory, ACCURACY_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read signal accuracy: {e}")
+    empty = _summary([])
+    return {
+        "total_predictions": 0,
+        "correct_predictions": 0,
+        "accuracy_rate": 0.0,
+        "avg_return": 0.0,
+        "last_30_days": empty,
+        "by_action": {action: _summary([]) for action in BUY_ACTIONS + SELL_ACTIONS},
+        "horizon_days": int(_env_float("SIGNAL_HORIZON_DAYS", 5)),
+        "updated_at": None,
+    }
+
+
+writer = SignalWriter(
+    flush_seconds=_env_float("SIGNAL_FLUSH_SECONDS", 5.0),
+    flush_rows=int(_env_float("SIGNAL_FLUSH_ROWS", 500)),
+)
+
+
+def record(code: str, signal: Dict):
+    writer.record(code, signal)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(update_accuracy(), ensure_ascii=False, indent=2))
@@ -0,0 +1,237 @@
+"""
+列式股票池 (Stock Universe)
+
+原来的股票列表是约 5000 个 dict（每个 6 个字符串字段），每次搜索还要为每个命中复制一个 dict。
+这里每个字段存为一段 UTF-8 字节 + 行偏移（即共享快照的 StringColumn，可直接零拷贝引用
+mmap 段），搜索过程：
+
+1. 对代码/名称/首字母/拼音全称四个字段各做一次整段向量化字节匹配，找出所有出现位置，
+   用 searchsorted 把命中位置映射到行号，并丢弃跨行的命中；
+2. 用 NumPy 整型数组按原有规则累加分数；
+3. 只对最终前 limit 名解码字符串、生成结果 dict；
+4. 精确层不足 limit 条时进入模糊层：拼音首字母/全拼的三元组倒排索引筛候选，
+   再做有界前缀编辑距离校验（查询少于 8 个字母允许 1 次编辑，否则 2 次），得分低于任何精确匹配。
+
+内存对比见 benchmarks/universe_memory.py。
+"""
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+import threading
+
+import numpy as np
+
+import metrics
+from shared_snapshot import StringColumn
+
+FIELDS = ("code", "name", "market", "symbol", "initials", "pinyin_full")
+
+# 模糊匹配的字段与基础分（低于任何精确匹配的得分），每差一次编辑扣 2 分
+FUZZY_FIELDS = (("initials", 8), ("pinyin_full", 6))
+FUZZY_MIN_LENGTH = 3
+
+SEARCH_FUZZY = metrics.counter("search_fuzzy_total", "Searches that fell through to the fuzzy tier by outcome", ["outcome"])
+
+
+def fuzzy_distance_limit(length: int) -> int:
+    """查询越长允许的编辑次数越多"""
+    return 1 if length < 8 else 2
+
+
+class _SearchField:
+    """单个字符串字段的整段查找"""
+
+    def __init__(self, column: StringColumn):
+        self.column = column
+        self._starts = column.offsets[:-1]
+        self._ends = column.offsets[1:]
+
+    def find(self, needle: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """返回两个按行的布尔数组：(包含 needle, 以 needle 开头)"""
+        contains = np.zeros(len(self._starts), dtype=bool)
+        prefix = np.zeros(len(self._starts), dtype=bool)
+        data = self.column.data
+        if not 0 < len(needle) <= len(data):
+            return contains, prefix
+        # 先比较首字节，再在候选位置上逐字节过滤，得到所有（可能重叠的）出现位置
+        positions = np.flatnonzero(data[:len(data) - len(needle) + 1] == needle[0])
+        for k in range(1, len(needle)):
+            positions = positions[data[positions + k] == needle[k]]
+        rows = np.searchsorted(self._starts, positions, side="right") - 1
+        valid = positions + len(needle) <= self._ends[rows]
+        rows, positions = rows[valid], positions[valid]
+        contains[rows] = True
+        prefix[rows[positions == self._starts[rows]]] = True
+        return contains, prefix
+
+    def exact(self, needle: bytes) -> np.ndarray:
+        _, prefix = self.find(needle)
+        return prefix & (self._ends - self._starts == len(needle))
+
+
+class _FuzzyIndex:
+    """
+    单个 ASCII 字段的字符三元组倒排索引 + 有界前缀编辑距离校验
+
+    每行前面补两个占位字符后取三元组，三元组编码成 int32，(三元组, 行号) 按三元组排序存放，
+    查询时用 searchsorted 取出各三元组的行号并计数。按 q-gram 引理，与某个前缀编辑距离不超过 k
+    的查询至少与之共享 len(q) - 3k 个三元组，据此筛出候选，再在候选上向量化计算编辑距离。
+    """
+    PAD = 1
+
+    def __init__(self, column: StringColumn, max_width: int = 32):
+        starts = column.offsets[:-1]
+        lengths = np.minimum(column.offsets[1:] - starts, max_width)
+        width = int(lengths.max()) if len(lengths) else 0
+        cols = np.arange(width)
+        in_row = cols < lengths[:, None]
+        matrix = np.zeros((len(starts), width), dtype=np.uint8)
+        matrix[in_row] = column.data[(starts[:, None] + cols)[in_row]]
+        self.rows = len(starts)
+        self.matrix = matrix
+        self.lengths = lengths
+
+        grams = self._grams(matrix)
+        row_ids = np.broadcast_to(np.arange(self.rows, dtype=np.int64)[:, None], grams.shape)
+        keys = np.unique((grams[in_row].astype(np.int64) << 32) | row_ids[in_row])
+        self._grams_sorted = (keys >> 32).astype(np.int32)
+        self._rows = (keys & 0xFFFFFFFF).astype(np.int32)
+
+    @classmethod
+    def _grams(cls, matrix: np.ndarray) -> np.ndarray:
+        padded = np.concatenate([np.full((len(matrix), 2), cls.PAD, dtype=np.uint8), matrix], axis=1).astype(np.int32)
+        return (padded[:, :-2] << 16) | (padded[:, 1:-1] << 8) | padded[:, 2:]
+
+    def candidates(self, needle: bytes, k: int) -> np.ndarray:
+        query = np.unique(self._grams(np.frombuffer(needle, dtype=np.uint8)[None, :])[0])
+        lo = np.searchsorted(self._grams_sorted, query, side="left")
+        hi = np.searchsorted(self._grams_sorted, query, side="right")
+        if not (hi > lo).any():
+            return np.zeros(0, dtype=np.int64)
+        hits = np.concatenate([self._rows[a:b] for a, b in zip(lo, hi)])
+        counts = np.bincount(hits, minlength=self.rows)
+        return np.flatnonzero(counts >= max(1, len(query) - 3 * k))
+
+    def prefix_distance(self, needle: bytes, rows: np.ndarray, k: int) -> np.ndarray:
+        """needle 与各候选行任一前缀之间的最小编辑距离"""
+        width = min(len(needle) + k, self.matrix.shape[1])
+        chars = self.matrix[rows, :width]
+        steps = np.arange(width + 1)
+        prev = np.broadcast_to(steps, (len(rows), width + 1))
+        for i, ch in enumerate(needle, 1):
+            cost = (chars != ch).astype(np.int64)
+            best = np.minimum(prev[:, :-1] + cost, prev[:, 1:] + 1)
+            cur = np.concatenate([np.full((len(rows), 1), i), best], axis=1)
+            # 插入操作沿行方向传递：cur[j] = min(cur[j], cur[j-1] + 1)，用累计最小值一次完成
+            prev = np.minimum.accumulate(cur - steps, axis=1) + steps
+        beyond = steps > np.minimum(self.lengths[rows], width)[:, None]
+        return np.where(beyond, len(needle) + k + 1, prev).min(axis=1)
+
+
+class StockUniverse:
+    def __init__(self, columns: Mapping[str, StringColumn]):
+        self.columns = {field: columns[field] for field in FIELDS}
+        self.rows = len(self.columns["code"])
+        names = self.columns["name"]
+        upper = [s.upper() for s in names.tolist()]
+        # 名称按大写匹配；绝大多数名称本身不含小写字母，此时直接复用原列
+        name_upper = names if upper == names.tolist() else StringColumn.from_strings(upper)
+        self._fields = {
+            "code": _SearchField(self.columns["code"]),
+            "name": _SearchField(name_upper),
+            "initials": _SearchField(self.columns["initials"]),
+            "pinyin_full": _SearchField(self.columns["pinyin_full"]),
+        }
+        self._fuzzy = {}
+        self._fuzzy_lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, stocks: Sequence[Dict]) -> "StockUniverse":
+        return cls({field: StringColumn.from_strings([s[field] for s in stocks]) for field in FIELDS})
+
+    @classmethod
+    def from_segment(cls, segment) -> "StockUniverse":
+        """直接引用共享快照段中的字符串列，不复制"""
+        return cls({field: segment.column(field) for field in FIELDS})
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def row(self, i: int) -> Dict:
+        return {field: self.columns[field][i] for field in FIELDS}
+
+    def records(self) -> List[Dict]:
+        return [self.row(i) for i in range(self.rows)]
+
+    def scores(self, q: str) -> np.ndarray:
+        """按原搜索规则给每一行打分，0 表示不匹配"""
+        needle = q.encode("utf-8")
+        code, code_prefix = self._fields["code"].find(needle)
+        name, _ = self._fields["name"].find(needle)
+        initials, initials_prefix = self._fields["initials"].find(needle)
+        pinyin, pinyin_prefix = self._fields["pinyin_full"].find(needle)
+
+        scores = 40 * code.astype(np.int32) + 60 * name
+        scores += np.where(initials_prefix, 50, np.where(initials, 20, 0))
+        scores += np.where(pinyin_prefix, 40, np.where(pinyin, 10, 0))
+
+        # 代码优先：精确匹配 1000 分；没有精确匹配时代码前缀匹配 800 分
+        if q.isdigit():
+            exact = self._fields["code"].exact(q.zfill(6).encode("ascii"))
+            if exact.any():
+                scores[exact] = 1000
+            else:
+                scores[code_prefix] = 800
+        return scores
+
+    def fuzzy_scores(self, q: str, exclude: np.ndarray) -> np.ndarray:
+        """模糊层：拼音首字母/全拼与查询的前缀编辑距离在限度内的行，exclude 中的行不参与"""
+        scores = np.zeros(self.rows, dtype=np.int32)
+        needle = q.encode("ascii")
+        k = fuzzy_distance_limit(len(needle))
+        for field, base in FUZZY_FIELDS:
+            index = self._fuzzy_index(field)
+            rows = index.candidates(needle, k)
+            rows = rows[~exclude[rows]]
+            if len(rows) == 0:
+                continue
+            distance = index.prefix_distance(needle, rows, k)
+            matched = distance <= k
+            rows = rows[matched]
+            scores[rows] = np.maximum(scores[rows], base - 2 * distance[matched])
+        return scores
+
+    def _fuzzy_index(self, field: str) -> _FuzzyIndex:
+        # 三元组索引只在第一次走到模糊层时构建，随股票池版本一起替换
+        index = self._fuzzy.get(field)
+        if index is None:
+            with self._fuzzy_lock:
+                index = self._fuzzy.get(field)
+                if index is None:
+                    index = self._fuzzy[field] = _FuzzyIndex(self.columns[field])
+        return index
+
+    def search(self, q: str, limit: int = 20) -> List[Dict]:
+        q = (q or "").strip().upper()
+        if not q or limit <= 0:
+            return []
+        scores = self.scores(q)
+        candidates = np.flatnonzero(scores)
+        # 稳定排序：同分时保持股票池原有顺序
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:limit]]
+        results = [self._result(i, scores[i]) for i in top]
+
+        # 精确层不足 limit 条时，用模糊层补足（容忍拼音输错一两个字母）
+        if len(results) < limit and len(q) >= FUZZY_MIN_LENGTH and q.isascii() and q.isalpha():
+            fuzzy = self.fuzzy_scores(q, exclude=scores > 0)
+            candidates = np.flatnonzero(fuzzy)
+            top = candidates[np.argsort(-fuzzy[candidates], kind="stable")[:limit - len(results)]]
+            results += [self._result(i, fuzzy[i], fuzzy=True) for i in top]
+            SEARCH_FUZZY.labels("hit" if len(top) else "empty").inc()
+        return results
+
+    def _result(self, i, score, fuzzy: bool = False) -> Dict:
+        stock = self.row(int(i))
+        stock["score"] = int(score)
+        if fuzzy:
+            stock["fuzzy"] = True
+        return stock
@@ -0,0 +1,185 @@
+"""
+盯盘提醒的单元测试：条件求值、once 规则在重新编译与多 worker 之间只触发一次（不发出网络请求）
+
+    python -m pytest test_alerts.py    或    python test_alerts.py
+"""
+import asyncio
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+import alerts
+
+
+class _Params:
+    sell_band, hold_band, buy_band, strong_buy_band = 30.0, 45.0, 60.0, 75.0
+
+
+class _Segment:
+    def __init__(self):
+        self.version = time.time()
+
+
+def _engine(store):
+    engine = alerts.AlertEngine(store, params=_Params())
+    engine.current = {}
+
+    # 直接给出 (字段, 股票) 矩阵，绕开行情快照与日线指标
+    def values(segment, flow_segment, codes):
+        matrix = np.full((len(alerts.FIELDS), len(codes)), np.nan)
+        for (field, code), value in engine.current.items():
+            if code in codes:
+                matrix[alerts.FIELDS.index(field), list(codes).index(code)] = value
+        return matrix
+
+    engine.values = values
+    return engine
+
+
+def _step(engine, field, value, code="600519", now=None):
+    engine.current[(field, code)] = value
+    return engine.evaluate(_Segment(), now=now)
+
+
+class AlertEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.store = alerts.RuleStore(tempfile.mkdtemp())
+        self.engine = _engine(self.store)
+
+    def _add(self, field, op, threshold=None, once=False, cooldown=0.0):
+        return self.store.add(alerts.make_rule("c1", "600519", field, op, threshold, once=once, cooldown=cooldown))
+
+    def test_cross_above_needs_previous_value(self):
+        self._add("price", "cross_above", 100.0)
+        self.assertEqual(_step(self.engine, "price", 101.0), [])
+        self.assertEqual(_step(self.engine, "price", 99.0), [])
+        events = _step(self.engine, "price", 100.0)
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0]["previous"], events[0]["value"]), (99.0, 100.0))
+        self.assertEqual(_step(self.engine, "price", 102.0), [])
+
+    def test_missing_value_keeps_last_known(self):
+        self._add("price", "cross_below", 100.0)
+        _step(self.engine, "price", 101.0)
+        self.assertEqual(_step(self.engine, "price", np.nan), [])
+        self.assertEqual(len(_step(self.engine, "price", 98.0)), 1)
+
+    def test_above_fires_on_transition_and_first_evaluation(self):
+        self._add("change_pct", "above", 5.0)
+        self.assertEqual(len(_step(self.engine, "change_pct", 6.0)), 1)
+        self.assertEqual(_step(self.engine, "change_pct", 7.0), [])
+        self.assertEqual(_step(self.engine, "change_pct", 4.0), [])
+        self.assertEqual(len(_step(self.engine, "change_pct", 5.5)), 1)
+
+    def test_cooldown(self):
+        self._add("price", "above", 100.0, cooldown=60.0)
+        now = time.time()
+        self.assertEqual(len(_step(self.engine, "price", 101.0, now=now)), 1)
+        _step(self.engine, "price", 99.0, now=now + 1)
+        self.assertEqual(_step(self.engine, "price", 101.0, now=now + 2), [])
+        _step(self.engine, "price", 99.0, now=now + 61)
+        self.assertEqual(len(_step(self.engine, "price", 101.0, now=now + 62)), 1)
+
+    def test_band_change(self):
+        self._add("score", "band_change")
+        self.assertEqual(_step(self.engine, "score", 50.0), [])
+        self.assertEqual(_step(self.engine, "score", 55.0), [])
+        events = _step(self.engine, "score", 62.0)
+        self.assertEqual(len(events), 1)
+        self.assertEqual((events[0]["previous_band"], events[0]["band"]), ("观望", "谨慎买入"))
+
+    def test_once_rule_stays_spent_across_recompiles(self):
+        self._add("price", "above", 100.0, once=True)
+        self.assertEqual(len(_step(self.engine, "price", 101.0)), 1)
+        _step(self.engine, "price", 99.0)
+        # 规则文件变化触发重新编译；once 规则还没被删除，也不能再次触发
+        time.sleep(0.01)
+        self._add("volume", "above", 1e9)
+        self.assertEqual(_step(self.engine, "price", 101.0), [])
+
+
+class _Worker:
+    """同一进程里模拟一个 worker：各自的规则缓存、引擎与 hub，共用规则文件目录"""
+
+    def __init__(self, directory, name):
+        self.store = alerts.RuleStore(directory)
+        self.engine = _engine(self.store)
+        self.hub = alerts.AlertHub()
+        self.presence = alerts.Presence(f"{directory}/online", name=name)
+        self.dispatcher = alerts.Dispatcher(self.hub, self.store, self.presence, grace=5.0)
+
+    def backlog(self, client_id="c1"):
+        return [event for _, event in self.hub._backlog.get(client_id, ())]
+
+
+class DispatchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.a, self.b = _Worker(directory, "a"), _Worker(directory, "b")
+        self.now = time.time()
+
+    async def _tick(self, value, now):
+        events = {}
+        for worker in (self.a, self.b):
+            worker.presence.publish(worker.hub.clients())
+            events[worker] = _step(worker.engine, "price", value, now=now)
+        delivered = {}
+        for worker in (self.a, self.b):
+            delivered[worker] = await worker.dispatcher.dispatch(events[worker], now=now)
+        return delivered
+
+    async def test_once_delivered_by_worker_holding_connection(self):
+        self.a.store.add(alerts.make_rule("c1", "600519", "price", "above", 100.0, once=True))
+        queue = self.b.hub.subscribe("c1")
+        delivered = await self._tick(101.0, self.now)
+        self.assertEqual(len(delivered[self.b]), 1)
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(self.a.store.rules(), [])
+        # a 暂存的事件到期后认领失败（规则已被 b 删除），不积压
+        await self.a.dispatcher.dispatch([], now=self.now + 10)
+        self.assertEqual(self.a.backlog(), [])
+
+    async def test_once_backlogged_by_exactly_one_worker_when_offline(self):
+        self.a.store.add(alerts.make_rule("c1", "600519", "price", "above", 100.0, once=True))
+        await self._tick(101.0, self.now)
+        self.assertEqual(self.a.backlog() + self.b.backlog(), [])
+        for worker in (self.a, self.b):
+            await worker.dispatcher.dispatch([], now=self.now + 10)
+        self.assertEqual(len(self.a.backlog() + self.b.backlog()), 1)
+        self.assertEqual(self.a.store.rules(), [])
+
+    async def test_failed_claim_is_retried(self):
+        self.a.store.add(alerts.make_rule("c1", "600519", "price", "above", 100.0, once=True))
+        queue = self.a.hub.subscribe("c1")
+        claim = self.a.store.claim
+
+        def failing(rule_ids, client_id=None):
+            raise OSError("disk full")
+
+        self.a.store.claim = failing
+        await self.a.dispatcher.dispatch(_step(self.a.engine, "price", 101.0, now=self.now), now=self.now)
+        self.assertEqual(queue.qsize(), 0)
+        self.a.store.claim = claim
+        await self.a.dispatcher.dispatch([], now=self.now + 1)
+        self.assertEqual(queue.qsize(), 1)
+
+    async def test_repeating_rule_not_backlogged_for_client_on_other_worker(self):
+        self.a.store.add(alerts.make_rule("c1", "600519", "price", "above", 100.0, once=False, cooldown=0.0))
+        queue = self.b.hub.subscribe("c1")
+        await self._tick(101.0, self.now)
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(self.a.backlog(), [])
+        self.assertEqual(len(self.a.store.rules()), 1)
+
+        # 客户端断开后两个 worker 都为它积压，重连到任意一个都只补发一次
+        self.b.hub.unsubscribe("c1", queue)
+        await self._tick(99.0, self.now + 1)
+        await self._tick(101.0, self.now + 2)
+        self.assertEqual(len(self.a.backlog()), 1)
+        self.assertEqual(len(self.b.backlog()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+LLM 网关优先级信号量的单元测试（不发出网络请求）
+
+    python -m pytest test_llm_gateway.py    或    python test_llm_gateway.py
+"""
+import asyncio
+import unittest
+
+from llm_gateway import BACKGROUND, INTERACTIVE, _PriorityLimiter
+
+
+async def _settle():
+    """让已放行的等待者运行到下一个挂起点"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+class PriorityLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def _enqueue(self, limiter, level, order, label, timeout=5.0):
+        async def waiter():
+            await limiter.acquire(level, timeout)
+            order.append(label)
+        task = asyncio.ensure_future(waiter())
+        await _settle()
+        return task
+
+    async def test_reserve_admits_interactive_while_background_waits(self):
+        limiter = _PriorityLimiter(capacity=3, interactive_reserve=1)
+        await limiter.acquire(BACKGROUND, 1.0)
+        await limiter.acquire(BACKGROUND, 1.0)
+        order = []
+        blocked = await self._enqueue(limiter, BACKGROUND, order, "background")
+        self.assertEqual(order, [])
+        self.assertEqual(limiter.queued(BACKGROUND), 1)
+
+        # 后台名额已满但预留名额空闲：交互请求不应排在被挡住的后台请求后面
+        await asyncio.wait_for(limiter.acquire(INTERACTIVE, 1.0), 0.1)
+        self.assertEqual(limiter.active, {INTERACTIVE: 1, BACKGROUND: 2})
+
+        limiter.release(BACKGROUND)
+        await blocked
+        self.assertEqual(order, ["background"])
+        self.assertEqual(limiter.active, {INTERACTIVE: 1, BACKGROUND: 2})
+
+    async def test_queued_interactive_granted_past_blocked_background(self):
+        limiter = _PriorityLimiter(capacity=3, interactive_reserve=1)
+        await limiter.acquire(INTERACTIVE, 1.0)
+        await limiter.acquire(BACKGROUND, 1.0)
+        await limiter.acquire(BACKGROUND, 1.0)
+        order = []
+        background = await self._enqueue(limiter, BACKGROUND, order, "background")
+        interactive = await self._enqueue(limiter, INTERACTIVE, order, "interactive")
+
+        # 释放的是预留名额，后台请求仍然受后台上限约束，只有交互请求能拿到
+        limiter.release(INTERACTIVE)
+        await interactive
+        self.assertEqual(order, ["interactive"])
+        self.assertFalse(background.done())
+
+        limiter.release(BACKGROUND)
+        await background
+        self.assertEqual(order, ["interactive", "background"])
+
+    async def test_grants_by_priority_then_arrival(self):
+        limiter = _PriorityLimiter(capacity=2, interactive_reserve=1)
+        await limiter.acquire(INTERACTIVE, 1.0)
+        await limiter.acquire(INTERACTIVE, 1.0)
+        order = []
+        tasks = [
+            await self._enqueue(limiter, BACKGROUND, order, "b1"),
+            await self._enqueue(limiter, INTERACTIVE, order, "i1"),
+            await self._enqueue(limiter, BACKGROUND, order, "b2"),
+            await self._enqueue(limiter, INTERACTIVE, order, "i2"),
+        ]
+        for level in (INTERACTIVE, INTERACTIVE, INTERACTIVE, INTERACTIVE):
+            limiter.release(level)
+            await _settle()
+        # 交互请求释放后名额依次给 i1、i2；后台上限为 1，b1 先于 b2
+        self.assertEqual(order[:2], ["i1", "i2"])
+        self.assertEqual(order[2], "b1")
+        self.assertEqual(limiter.active[BACKGROUND], 1)
+        limiter.release(BACKGROUND)
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["i1", "i2", "b1", "b2"])
+
+    async def test_timed_out_waiter_is_skipped(self):
+        limiter = _PriorityLimiter(capacity=1, interactive_reserve=0)
+        await limiter.acquire(INTERACTIVE, 1.0)
+        with self.assertRaises(asyncio.TimeoutError):
+            await limiter.acquire(INTERACTIVE, 0.01)
+        order = []
+        waiter = await self._enqueue(limiter, BACKGROUND, order, "background")
+        limiter.release(INTERACTIVE)
+        await waiter
+        self.assertEqual(order, ["background"])
+        self.assertEqual(limiter.active, {INTERACTIVE: 0, BACKGROUND: 1})
+        self.assertEqual(limiter.queued(INTERACTIVE), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
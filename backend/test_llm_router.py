@@ -0,0 +1,90 @@
+"""
+LLM 模型路由的单元测试：对冲计时与延迟统计（不发出网络请求）
+
+    python -m pytest test_llm_router.py    或    python test_llm_router.py
+"""
+import asyncio
+import unittest
+
+import httpx
+
+from llm_router import ModelEndpoint, ModelRouter, ModelStats
+
+
+def _request() -> httpx.Request:
+    return httpx.Request("POST", "http://llm.test/v1/chat/completions", json={"model": "x", "messages": []})
+
+
+def _router(hedge_after: float) -> ModelRouter:
+    endpoints = [ModelEndpoint("slow", "slow", "http://slow.test/v1"), ModelEndpoint("fast", "fast", "http://fast.test/v1")]
+    return ModelRouter(endpoints, targets={"interactive": 30.0}, hedge_after=hedge_after)
+
+
+class ModelStatsTest(unittest.TestCase):
+    def test_censored_samples_raise_quantiles(self):
+        stats = ModelStats()
+        for latency in (1.0, 1.0, 1.0, 1.0):
+            stats.record(latency, True)
+        for _ in range(6):
+            stats.record(5.0, True, censored=True)
+        summary = stats.summary()
+        # 被取消的请求至少用了 5 秒：p90 不能只看已完成的 1 秒样本
+        self.assertEqual(summary["p50"], 5.0)
+        self.assertEqual(summary["p90"], 5.0)
+        self.assertEqual(summary["error_rate"], 0.0)
+
+    def test_uncensored_quantiles(self):
+        stats = ModelStats()
+        for latency in range(1, 11):
+            stats.record(float(latency), True)
+        stats.record(99.0, False)
+        summary = stats.summary()
+        self.assertEqual(summary["p50"], 5.0)
+        self.assertEqual(summary["p90"], 9.0)
+        self.assertAlmostEqual(summary["error_rate"], 1 / 11)
+
+
+class DispatchTest(unittest.IsolatedAsyncioTestCase):
+    async def test_hedge_timer_starts_when_primary_is_sent(self):
+        router = _router(hedge_after=0.1)
+        sent_to = []
+
+        async def send(request, tracker):
+            if tracker.endpoint.name == "slow":
+                await asyncio.sleep(0.3)  # 网关排队，不应计入对冲计时
+                tracker.sent()
+                await asyncio.sleep(0.05)
+            else:
+                tracker.sent()
+                await asyncio.sleep(0.01)
+            sent_to.append(tracker.endpoint.name)
+            tracker.finished(True)
+            return httpx.Response(200, request=request)
+
+        response = await router.dispatch(_request(), "interactive", 30.0, send)
+        self.assertEqual(str(response.request.url), "http://slow.test/v1/chat/completions")
+        self.assertEqual(sent_to, ["slow"])
+        # 延迟只计发出之后的 0.05 秒
+        self.assertLess(router.stats["slow"].summary()["p90"], 0.2)
+
+    async def test_cancelled_loser_is_censored(self):
+        router = _router(hedge_after=0.05)
+
+        async def send(request, tracker):
+            tracker.sent()
+            await asyncio.sleep(1.0 if tracker.endpoint.name == "slow" else 0.01)
+            tracker.finished(True)
+            return httpx.Response(200, request=request)
+
+        response = await router.dispatch(_request(), "interactive", 30.0, send)
+        await asyncio.sleep(0)
+        self.assertEqual(str(response.request.url), "http://fast.test/v1/chat/completions")
+        samples = list(router.stats["slow"]._samples)
+        self.assertEqual(len(samples), 1)
+        _, latency, ok, censored = samples[0]
+        self.assertTrue(ok and censored)
+        self.assertGreaterEqual(latency, 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+请求级耗时分解 (Server-Timing) 与慢请求采样分析
+
+- 在处理函数里用 `with span("history"):` 包住各个阶段，耗时会汇总到当前请求，
+  由 app.py 的中间件写入响应头 `Server-Timing`，浏览器开发者工具可直接查看。
+- 设置 PROFILE_SLOW_REQUEST_MS 后启用采样分析：后台线程按
+  PROFILE_SAMPLE_INTERVAL_MS 的间隔采样正在执行 span 的线程调用栈，
+  请求耗时超过阈值时把折叠栈 (collapsed stacks，可用 speedscope/flamegraph.pl 打开)
+  写入 .data/profiles，未超阈值的采样直接丢弃。
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(os.getcwd(), ".data", "profiles")
+
+
+class RequestTimer:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        # span 名称 -> [累计毫秒, 次数]，保持首次出现的顺序
+        self.spans: Dict[str, List[float]] = {}
+        # 正在执行 span 的线程 -> 嵌套深度，采样器只看这些线程
+        self.threads: Dict[int, int] = {}
+        self.samples: Counter = Counter()
+
+    def add(self, name: str, duration_ms: float):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += duration_ms
+            entry[1] += 1
+
+    def enter_thread(self, ident: int):
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+
+    def exit_thread(self, ident: int):
+        with self._lock:
+            depth = self.threads.get(ident, 0) - 1
+            if depth > 0:
+                self.threads[ident] = depth
+            else:
+                self.threads.pop(ident, None)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self) -> str:
+        """生成 Server-Timing 头，例如 `ak.stock_zh_a_hist;dur=812.4, llm;dur=20311.0, total;dur=21530.2`"""
+        with self._lock:
+            items = list(self.spans.items())
+        parts = []
+        for name, (duration, count) in items:
+            part = f"{name};dur={duration:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+def current() -> Optional[RequestTimer]:
+    return _current.get()
+
+
+def start_request(name: str = ""):
+    """开始计时，返回 (timer, token)；结束时把 token 交给 end_request"""
+    timer = RequestTimer(name)
+    token = _current.set(timer)
+    if profiler is not None:
+        profiler.attach(timer)
+    return timer, token
+
+
+def end_request(timer: RequestTimer, token):
+    _current.reset(token)
+    if profiler is not None:
+        profiler.detach(timer)
+
+
+@contextmanager
+def span(name: str):
+    """记录一个阶段的耗时；不在请求上下文中（如脚本、后台任务）时不做任何事"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    ident = threading.get_ident()
+    timer.enter_thread(ident)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - started) * 1000)
+        timer.exit_thread(ident)
+
+
+class SlowRequestProfiler:
+    """单个后台线程按固定间隔采样所有进行中请求的工作线程"""
+
+    def __init__(self, threshold_ms: float, interval_ms: float = 5.0, output_dir: str = PROFILE_DIR):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000.0
+        self.output_dir = output_dir
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def attach(self, timer: RequestTimer):
+        with self._lock:
+            self._active.add(timer)
+        self._wakeup.set()
+
+    def detach(self, timer: RequestTimer):
+        with self._lock:
+            self._active.discard(timer)
+        elapsed = timer.elapsed_ms()
+        if elapsed >= self.threshold_ms and timer.samples:
+            try:
+                self._dump(timer, elapsed)
+            except Exception as e:
+                logger.warning(f"Failed to write profile: {e}")
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for timer in active:
+                with timer._lock:
+                    idents = list(timer.threads)
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is None or ident == own:
+                        continue
+                    stack = self._collapse(frame)
+                    with timer._lock:
+                        timer.samples[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _dump(self, timer: RequestTimer, elapsed_ms: float):
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", timer.name).strip("_") or "request"
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}_{slug}_{int(elapsed_ms)}ms.folded"
+        path = os.path.join(self.output_dir, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {timer.name} {elapsed_ms:.1f}ms, interval {self.interval * 1000:.1f}ms\n")
+            f.write(f"# Server-Timing: {timer.header()}\n")
+            with timer._lock:
+                samples = timer.samples.most_common()
+            for stack, count in samples:
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Slow request profile written to {path}")
+
+
+def _create_profiler() -> Optional[SlowRequestProfiler]:
+    threshold = os.getenv("PROFILE_SLOW_REQUEST_MS")
+    if not threshold:
+        return None
+    interval = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    logger.info(f"Slow request profiler enabled (>= {threshold}ms, every {interval}ms)")
+    return SlowRequestProfiler(float(threshold), interval)
+
+
+profiler = _create_profiler()
@@ -1,4 +1,7 @@
-import akshare as ak
+from data_provider import ak
+import fundamentals
+import kline_store
+import sectors
 import pandas as pd
 import logging
 from crewai.tools import tool
@@ -25,7 +28,7 @@ class StockTools:
             code = symbol[-6:]
             
             # 获取日K线数据
-            df = ak.stock_zh_a_hist(symbol=code, period="daily", start_date="20230101", adjust="qfq")
+            df = kline_store.daily_bars(code, adjust="qfq", start_date="20230101")
             
             if df.empty:
                 return f"No data found for symbol {symbol}"
@@ -52,7 +55,7 @@ class StockTools:
             # 获取主要财务指标，这里使用 stock_financial_abstract 或类似接口
             # 注意：AKShare 接口变动频繁，这里使用示例逻辑
             # 尝试获取个股资金流向作为替代演示，或者具体的财务接口
-            df = ak.stock_financial_abstract_ths(symbol=code, indicator="按年度")
+            df = fundamentals.get_financial_abstract(code)
             
             if df.empty:
                 return f"No financial data found for {symbol}"
@@ -79,12 +82,16 @@ class StockTools:
             # 注意：akshare 接口常变，这里用一个相对稳定的接口，或者模拟数据如果接口失败
             
             try:
-                # 东方财富 行业板块 实时
-                df_board = ak.stock_board_industry_name_em()
-                # 按涨跌幅排序
-                df_board = df_board.sort_values(by="涨跌幅", ascending=False).head(5)
-                # 选取需要的列
-                board_list = df_board[['板块名称', '板块代码', '涨跌幅', '领涨股票', '领涨股票-涨跌幅']].to_dict(orient="records")
+                # 优先用行情快照本地聚合的板块行情，成分股尚未就绪时请求东方财富 行业板块 实时
+                hot = sectors.hot_boards(5)
+                if hot is not None:
+                    board_list = hot["boards"]
+                else:
+                    df_board = ak.stock_board_industry_name_em()
+                    # 按涨跌幅排序
+                    df_board = df_board.sort_values(by="涨跌幅", ascending=False).head(5)
+                    # 选取需要的列
+                    board_list = df_board[['板块名称', '板块代码', '涨跌幅', '领涨股票', '领涨股票-涨跌幅']].to_dict(orient="records")
             except Exception as e:
                 logger.warning(f"Failed to fetch board data: {e}")
                 board_list = []
@@ -41,10 +41,7 @@ const TradeSignalCard: React.FC<TradeSignalProps> = ({ symbol }) => {
   const [autoRefresh, setAutoRefresh] = useState(false);
   const [countdown, setCountdown] = useState(3);
   const [showConfidenceTip, setShowConfidenceTip] = useState(false);
-  const [historyAccuracy, setHistoryAccuracy] = useState({
-    accuracy_rate: 64.4,
-    avg_return: 2.8
-  });
+  const [historyAccuracy, setHistoryAccuracy] = useState<{ total: number; accuracy_rate: number; avg_return: number } | null>(null);
 
   const fetchSignal = useCallback(async () => {
     if (!symbol) return;
@@ -87,6 +84,13 @@ const TradeSignalCard: React.FC<TradeSignalProps> = ({ symbol }) => {
     fetchSignal();
   }, [fetchSignal]);
 
+  useEffect(() => {
+    fetch('/api/trade-signal/accuracy')
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => data && setHistoryAccuracy(data.last_30_days))
+      .catch((error) => console.error('Failed to fetch signal accuracy:', error));
+  }, []);
+
   useEffect(() => {
     if (!autoRefresh) return;
     
@@ -368,13 +372,17 @@ const TradeSignalCard: React.FC<TradeSignalProps> = ({ symbol }) => {
                 }
               </span>
             </div>
-            <div className="flex items-center gap-1 text-green-600">
-              <TrendingUp className="w-4 h-4" />
-              <span>近30日准确率 {historyAccuracy.accuracy_rate}%</span>
-            </div>
-            <div className="text-green-600">
-              平均收益 +{historyAccuracy.avg_return}%
-            </div>
+            {historyAccuracy && historyAccuracy.total > 0 && (
+              <>
+                <div className="flex items-center gap-1 text-green-600">
+                  <TrendingUp className="w-4 h-4" />
+                  <span>近30日准确率 {historyAccuracy.accuracy_rate}%</span>
+                </div>
+                <div className={historyAccuracy.avg_return >= 0 ? 'text-green-600' : 'text-red-600'}>
+                  平均收益 {historyAccuracy.avg_return >= 0 ? '+' : ''}{historyAccuracy.avg_return}%
+                </div>
+              </>
+            )}
           </div>
           
           <div className="flex items-center gap-2">
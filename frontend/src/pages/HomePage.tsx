@@ -28,7 +28,7 @@ const HomePage: React.FC = () => {
             setHotData(data);
             const info = data as any;
             setFallback(!!info.fallback);
-            setAsof(info.asof);
+            setAsof((info.as_of ?? info.asof)?.slice(0, 10));
         } catch (e) {
             setFallback(false);
             setAsof(undefined);